@@ -0,0 +1,182 @@
+"""Локальная замена сервера t.bstu.ru для бенчмарков
+
+Отдает списки групп и преподов, страницы заголовков и ответы /web/api/events
+с настраиваемой задержкой и долей ошибок. Страницы берутся из корпуса:
+либо записанного с настоящего сервера (см. record_corpus.py), либо
+синтетического, который строится генератором из tests/synthetic_pages.py.
+
+У синтетического корпуса есть ревизия: при ее смене меняются расписания
+заданной доли сущностей, как между двумя обновлениями на настоящем сервере.
+
+Example:
+    server = FakeBSTU(SyntheticCorpus(groups=300, teachers=600), latency=0.02, error_rate=0.01)
+    base_url = await server.start()
+    ...
+    await server.stop()
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+import zlib
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.synthetic_pages import TEACHER_NAMES, ROOMS, group_list_page, teacher_list_page, header_page, week_page
+
+
+class SyntheticCorpus:
+    """Синтетический корпус страниц, генерируемый по запросу
+
+    Attributes:
+        groups (int):
+            Количество групп
+        teachers (int):
+            Количество ссылок в списке преподов (каждая седьмая - аудитория)
+        revision (int):
+            Ревизия расписаний
+        changed_share (float):
+            Доля сущностей, у которых расписание меняется при смене ревизии
+
+    """
+
+    def __init__(self, groups: int, teachers: int, changed_share: float = 1.0):
+        self.groups = groups
+        self.teachers = teachers
+        self.revision = 0
+        self.changed_share = changed_share
+        self._list_pages = {"/raspisaniya/gruppy": group_list_page(groups),
+                            "/raspisaniya/prepodavateli": teacher_list_page(teachers)}
+
+    def page(self, path: str) -> str | None:
+        if path in self._list_pages:
+            return self._list_pages[path]
+        entity, _, entity_id = path.removeprefix("/raspisaniya/").partition("/")
+        if not entity_id.isdigit():
+            return None
+        index = int(entity_id)
+        if entity == "gruppy" and index < self.groups:
+            return header_page(f"Г-{index}", entity, entity_id, seed=index)
+        if entity == "prepodavateli" and index < self.teachers:
+            name = ROOMS[index % len(ROOMS)] if index % 7 == 0 else f"{TEACHER_NAMES[index % len(TEACHER_NAMES)]} {index}"
+            return header_page(name, entity, entity_id, seed=index)
+        return None
+
+    def _entity_revision(self, entity: str, entity_id: str) -> int:
+        # Сущность меняется в ревизии, если ее хэш попал в долю changed_share
+        changed = 0
+        for revision in range(1, self.revision + 1):
+            if zlib.crc32(f"{entity}:{entity_id}:{revision}".encode()) % 1000 < self.changed_share * 1000:
+                changed = revision
+        return changed
+
+    def events(self, entity: str, entity_id: str, week: int) -> dict | None:
+        if not entity_id.isdigit():
+            return None
+        seed = zlib.crc32(f"{entity}:{entity_id}:{week}:{self._entity_revision(entity, entity_id)}".encode())
+        return dict(success=True, result=dict(html=dict(week=week_page(seed, entity == "gruppy")),
+                                              week=dict(is_denominator=week % 2 == 1)))
+
+
+class RecordedCorpus:
+    """Корпус, записанный с настоящего сервера
+
+    Формат файла: {"pages": {путь: html}, "events": {"entity:id:week": ответ API}}
+
+    """
+
+    def __init__(self, path: str):
+        with open(path, encoding="utf-8") as corpus_file:
+            corpus = json.load(corpus_file)
+        self._pages = corpus["pages"]
+        self._events = corpus["events"]
+        self.revision = 0
+
+    def page(self, path: str) -> str | None:
+        return self._pages.get(path)
+
+    def events(self, entity: str, entity_id: str, week: int) -> dict | None:
+        return self._events.get(f"{entity}:{entity_id}:{week}")
+
+
+class FakeBSTU:
+    """aiohttp сервер, отдающий корпус вместо t.bstu.ru
+
+    Attributes:
+        corpus (SyntheticCorpus | RecordedCorpus):
+            Отдаваемые страницы
+        latency (float):
+            Средняя задержка ответа в секундах (равномерно от 0.5 до 1.5 от нее)
+        error_rate (float):
+            Доля ответов 503
+        requests (dict[str, int]):
+            Количество запросов по типам: page, api, error
+
+    """
+
+    def __init__(self, corpus, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.corpus = corpus
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = dict(page=0, api=0, error=0)
+        self._random = random.Random(seed)
+        self._runner: web.AppRunner | None = None
+
+    async def _delay_or_fail(self):
+        if self.latency:
+            await asyncio.sleep(self.latency * self._random.uniform(0.5, 1.5))
+        if self._random.random() < self.error_rate:
+            self.requests["error"] += 1
+            raise web.HTTPServiceUnavailable()
+
+    async def _page_handler(self, request: web.Request) -> web.Response:
+        await self._delay_or_fail()
+        self.requests["page"] += 1
+        if (page := self.corpus.page(request.path)) is None:
+            raise web.HTTPNotFound()
+        return web.Response(text=page, content_type="text/html")
+
+    async def _events_handler(self, request: web.Request) -> web.Response:
+        await self._delay_or_fail()
+        self.requests["api"] += 1
+        query = request.query
+        try:
+            events = self.corpus.events(query["entity"], query["id"], int(query["week"]))
+        except (KeyError, ValueError):
+            events = None
+        if events is None:
+            return web.json_response(dict(success=False))
+        return web.json_response(events)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запустить сервер и вернуть его базовый URL"""
+
+        app = web.Application()
+        app.add_routes([web.get("/web/api/events", self._events_handler),
+                        web.get("/{path:.*}", self._page_handler)])
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = self._runner.addresses[0][1]
+        return f"http://{host}:{bound_port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+if __name__ == "__main__":
+    # Запуск отдельно: python benchmarks/fake_bstu.py [групп] [преподов] [задержка] [доля ошибок]
+    async def serve():
+        arguments = sys.argv[1:] + [None] * 4
+        server = FakeBSTU(SyntheticCorpus(int(arguments[0] or 100), int(arguments[1] or 200)),
+                          latency=float(arguments[2] or 0), error_rate=float(arguments[3] or 0))
+        print(f"Serving on {await server.start(port=8081)}")
+        await asyncio.Event().wait()
+    asyncio.run(serve())
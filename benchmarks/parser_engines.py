@@ -0,0 +1,58 @@
+"""Сравнение движков ScheduleParser
+
+Прогоняет оба движка на синтетическом корпусе страниц, проверяет, что результаты
+совпадают побайтово, и печатает среднее время на страницу и ускорение.
+
+Запуск из корня репозитория:
+    python benchmarks/parser_engines.py [количество страниц]
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.parse_html import ScheduleParser
+from tests.synthetic_pages import header_page, week_page, group_list_page, teacher_list_page
+
+
+def measure(function, pages: list) -> tuple[float, list]:
+    results = []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for page in pages:
+            results.append(function(page))
+    return (time.perf_counter() - start) / len(pages), results
+
+
+def main(count: int):
+    parsers = {engine: ScheduleParser(engine) for engine in ScheduleParser.engines}
+    header = dict(table_name="ИТ-221")
+    cases = {
+        "get_schedule_header": ([header_page("ИТ-221", "gruppy", str(index), seed=index) for index in range(count)],
+                                lambda parser: parser.get_schedule_header),
+        "parse_full": ([week_page(index) for index in range(count)],
+                       lambda parser: lambda page: parser.parse_full([page], header, [False])),
+        "get_group_urls": ([group_list_page(500)] * max(count // 10, 1),
+                           lambda parser: lambda page: parser.get_group_urls(page, "https://t.bstu.ru")),
+        "get_teacher_urls": ([teacher_list_page(500)] * max(count // 10, 1),
+                             lambda parser: lambda page: parser.get_teacher_urls(page, "https://t.bstu.ru")),
+    }
+    print(f"{'case':<22}{'bs4 ms/page':>14}{'lxml ms/page':>14}{'speedup':>10}")
+    for name, (pages, method) in cases.items():
+        timings = dict()
+        outputs = dict()
+        for engine, parser in parsers.items():
+            timings[engine], outputs[engine] = measure(method(parser), pages)
+        if json.dumps(outputs["bs4"], ensure_ascii=False) != json.dumps(outputs["lxml"], ensure_ascii=False):
+            raise SystemExit(f"{name}: результаты движков различаются")
+        print(f"{name:<22}{timings['bs4'] * 1000:>14.3f}{timings['lxml'] * 1000:>14.3f}"
+              f"{timings['bs4'] / timings['lxml']:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
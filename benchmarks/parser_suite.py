@@ -0,0 +1,142 @@
+"""Бенчмарк ScheduleParser на эталонном корпусе
+
+Сначала проверяет, что результаты парсера совпадают с эталонами из
+tests/golden/parser, затем замеряет get_group_urls, get_teacher_urls,
+get_schedule_header и parse_full: время на страницу и скорость в МБ/с.
+Для каждого метода берется лучший из нескольких раундов, раунд длится
+не меньше --min-time секунд.
+
+Результаты сравниваются с базовыми замерами из benchmarks/baselines/parser_suite.json:
+если метод стал медленнее базового больше чем на --tolerance, скрипт завершается
+с кодом 1. Чтобы базу можно было использовать на другой машине, время сравнивается
+в единицах калибровочного цикла на чистом Python, который замеряется в том же
+прогоне. Перезаписывается база ключом --update-baseline.
+
+Запуск из корня репозитория:
+    python benchmarks/parser_suite.py [--engine lxml] [--tolerance 0.3] [--update-baseline]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.parse_html import ScheduleParser
+from tests.parser_golden_test import CASES, dump, expected_path, read_page, run_case
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baselines", "parser_suite.json")
+
+
+def case_bytes(case: dict) -> int:
+    return sum(len(read_page(file_name).encode("utf-8")) for file_name in case.get("files", [case.get("file")]))
+
+
+def check_golden(parser: ScheduleParser):
+    for method, case in CASES:
+        with open(expected_path(case), encoding="utf-8") as expected_file:
+            if dump(run_case(parser, method, case)) != expected_file.read():
+                raise SystemExit(f"{parser.engine}: {case['name']} не совпадает с эталоном")
+
+
+def calibrate(rounds: int) -> float:
+    """Время фиксированной нагрузки на чистом Python в миллисекундах, лучшее из раундов"""
+
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        sum(index * index for index in range(200000))
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def measure(parser: ScheduleParser, method: str, cases: list[dict], rounds: int, min_time: float) -> dict:
+    # Страницы читаются заранее, чтобы замерять только парсинг
+    pages = [(case, [read_page(file_name) for file_name in case.get("files", [case.get("file")])]) for case in cases]
+    calls = {"group_urls": lambda case, texts: parser.get_group_urls(texts[0], "https://t.bstu.ru"),
+             "teacher_urls": lambda case, texts: parser.get_teacher_urls(texts[0], "https://t.bstu.ru"),
+             "schedule_header": lambda case, texts: parser.get_schedule_header(texts[0]),
+             "parse_full": lambda case, texts: parser.parse_full(texts, dict(table_name=case["table_name"]),
+                                                                 case["is_denominator"])}
+    call = calls[method]
+    page_count = sum(len(texts) for _, texts in pages)
+    total_bytes = sum(case_bytes(case) for case, _ in pages)
+    best = float("inf")
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(rounds):
+            iterations = 0
+            start = time.perf_counter()
+            while True:
+                for case, texts in pages:
+                    call(case, texts)
+                iterations += 1
+                elapsed = time.perf_counter() - start
+                if elapsed >= min_time:
+                    break
+            best = min(best, elapsed / iterations)
+    return dict(ms_per_page=round(best / page_count * 1000, 4),
+                mb_per_sec=round(total_bytes / best / 1024 / 1024, 2))
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argument_parser.add_argument("--engine", choices=ScheduleParser.engines, action="append",
+                                 help="движок (можно несколько), по умолчанию все")
+    argument_parser.add_argument("--rounds", type=int, default=5)
+    argument_parser.add_argument("--min-time", type=float, default=0.2)
+    argument_parser.add_argument("--tolerance", type=float, default=0.3, help="допустимое замедление относительно базы")
+    argument_parser.add_argument("--update-baseline", action="store_true")
+    arguments = argument_parser.parse_args()
+
+    methods: dict[str, list[dict]] = dict()
+    for method, case in CASES:
+        methods.setdefault(method, []).append(case)
+    results: dict[str, dict[str, dict]] = dict()
+    for engine in arguments.engine or ScheduleParser.engines:
+        parser = ScheduleParser(engine)
+        with contextlib.redirect_stdout(io.StringIO()):
+            check_golden(parser)
+        results[engine] = {method: measure(parser, method, cases, arguments.rounds, arguments.min_time)
+                           for method, cases in methods.items()}
+
+    calibration_ms = calibrate(arguments.rounds * 4)
+    baseline = dict()
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+    # Во сколько раз эта машина медленнее той, на которой снималась база
+    speed_ratio = calibration_ms / baseline["calibration_ms"] if baseline.get("calibration_ms") else 1.0
+    print(f"Calibration: {calibration_ms:.2f} ms ({speed_ratio:.2f}x of baseline machine)")
+    regressions = []
+    print(f"{'engine':<8}{'method':<17}{'ms/page':>10}{'MB/s':>9}{'baseline':>10}{'change':>9}")
+    for engine, engine_results in results.items():
+        for method, result in engine_results.items():
+            base = baseline.get("engines", dict()).get(engine, dict()).get(method)
+            change = ""
+            if base:
+                ratio = result["ms_per_page"] / (base["ms_per_page"] * speed_ratio)
+                change = f"{(ratio - 1) * 100:+.0f}%"
+                if ratio > 1 + arguments.tolerance:
+                    regressions.append(f"{engine} {method}")
+            print(f"{engine:<8}{method:<17}{result['ms_per_page']:>10.3f}{result['mb_per_sec']:>9.1f}"
+                  f"{base['ms_per_page'] if base else float('nan'):>10.3f}{change:>9}")
+
+    if arguments.update_baseline:
+        baseline["calibration_ms"] = round(calibration_ms, 3)
+        baseline.setdefault("engines", dict()).update(results)
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, "w", encoding="utf-8") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2)
+            baseline_file.write("\n")
+        print(f"Baseline updated: {BASELINE_PATH}")
+    elif regressions:
+        raise SystemExit(f"Замедление больше {arguments.tolerance:.0%}: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
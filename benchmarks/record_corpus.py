@@ -0,0 +1,88 @@
+"""Запись корпуса страниц с сервера БГТУ для FakeBSTU
+
+Скачивает списки групп и преподов, страницы заголовков первых N групп и
+преподов и их ответы /web/api/events за две недели, и сохраняет все в один
+JSON файл в формате RecordedCorpus. Списки в корпусе обрезаются до записанных
+сущностей, чтобы сервис при бенчмарке не ходил за отсутствующими страницами.
+
+Запуск из корня репозитория (нужен доступ к сети):
+    python benchmarks/record_corpus.py corpus.json --groups 100 --teachers 200
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from download_html import ScheduleDownloader
+from parse_html import ScheduleParser
+
+
+async def record(arguments: argparse.Namespace) -> dict:
+    base_url = arguments.base_url.rstrip("/")
+    agent = {"User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:101.0) Gecko/20100101 Firefox/101.0"}
+    downloader = ScheduleDownloader(agent, connection_limit=arguments.concurrency)
+    parser = ScheduleParser("lxml")
+    pages, events = dict(), dict()
+    semaphore = asyncio.Semaphore(arguments.concurrency)
+
+    async def download(url: str) -> str:
+        async with semaphore:
+            text, ok = await downloader.try_download_page(url)
+        if not ok:
+            raise RuntimeError(f"Не удалось скачать {url}")
+        return text
+
+    async def record_entity(url: str):
+        page = await download(url)
+        pages[urlsplit(url).path] = page
+        header = parser.get_schedule_header(page)
+        for week in range(2):
+            async with semaphore:
+                text, ok = await downloader.try_get_request(base_url + "/web/api/events", header, week)
+            if not ok:
+                raise RuntimeError(f"Не удалось получить неделю {week} для {url}")
+            events[f"{header['entity']}:{header['id']}:{week}"] = json.loads(text)
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            group_list = await download(base_url + "/raspisaniya/gruppy")
+            teacher_list = await download(base_url + "/raspisaniya/prepodavateli")
+            group_urls = parser.get_group_urls(group_list, base_url)[:arguments.groups]
+            teacher_urls = parser.get_teacher_urls(teacher_list, base_url)[:arguments.teachers]
+        await asyncio.gather(*[record_entity(url) for url in group_urls + teacher_urls])
+    finally:
+        await downloader.close()
+
+    # Оставляем в списках только ссылки на записанные страницы
+    for list_path, list_html, urls in (("/raspisaniya/gruppy", group_list, group_urls),
+                                       ("/raspisaniya/prepodavateli", teacher_list, teacher_urls)):
+        recorded = {urlsplit(url).path for url in urls}
+        links = [f'<a class="{"group__item" if "gruppy" in list_path else "teachers__item"}" href="{path}">{path}</a>'
+                 for path in sorted(recorded)]
+        pages[list_path] = "<html><body>\n" + "\n".join(links) + "\n</body></html>"
+    return dict(pages=pages, events=events)
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argument_parser.add_argument("output", help="файл корпуса")
+    argument_parser.add_argument("--base-url", default="https://t.bstu.ru")
+    argument_parser.add_argument("--groups", type=int, default=100)
+    argument_parser.add_argument("--teachers", type=int, default=200)
+    argument_parser.add_argument("--concurrency", type=int, default=8)
+    arguments = argument_parser.parse_args()
+    corpus = asyncio.run(record(arguments))
+    with open(arguments.output, "w", encoding="utf-8") as corpus_file:
+        json.dump(corpus, corpus_file, ensure_ascii=False)
+    print(f"Recorded {len(corpus['pages'])} pages and {len(corpus['events'])} API responses to {arguments.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Сквозной бенчмарк цикла обновления расписания
+
+Запускает локальный FakeBSTU и гоняет ScheduleService.update_schedule против
+него без выхода в сеть. Вместо MongoDB по умолчанию используется mongomock,
+с ключом --mongo - настоящий сервер. После каждого цикла печатает время цикла,
+запросы в секунду, пиковый RSS и разбивку по фазам из метрик сервиса.
+
+mongomock не реализует $merge, поэтому с ним перенос неизменившихся расписаний
+недоступен и каждое повторное обновление меняет все расписания (--changed 1).
+Для замеров с частичными изменениями нужен --mongo.
+
+Запуск из корня репозитория:
+    python benchmarks/update_cycle.py --groups 300 --teachers 600 --cycles 3 --latency 0.02 --error-rate 0.01
+    python benchmarks/update_cycle.py --corpus corpus.json --mongo localhost --changed 0.1
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import resource
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_bstu import FakeBSTU, SyntheticCorpus, RecordedCorpus
+
+PHASES = ("list fetch", "header fetch", "header parse", "api fetch", "schedule parse", "db write", "teacher derive", "room index",
+          "commit")
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в Linux в килобайтах; процессы пула парсинга учитываются отдельно
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+async def run(arguments: argparse.Namespace) -> list[dict]:
+    corpus = RecordedCorpus(arguments.corpus) if arguments.corpus else SyntheticCorpus(arguments.groups, arguments.teachers,
+                                                                                        arguments.changed)
+    server = FakeBSTU(corpus, latency=arguments.latency, error_rate=arguments.error_rate)
+    base_url = await server.start()
+    os.environ.update(SCHEDULE_BASE_URL=base_url,
+                      SCHEDULE_TEACHER_LIST_URL=base_url + "/raspisaniya/prepodavateli",
+                      SCHEDULE_GROUP_LIST_URL=base_url + "/raspisaniya/gruppy",
+                      SCHEDULE_API_URL=base_url + "/web/api/events")
+    os.environ.setdefault("FETCH_RATE_PER_SEC", "0")
+    if arguments.mongo:
+        os.environ["DB_CONTAINER_NAME"] = arguments.mongo
+    else:
+        import mongomock
+        import db_client
+        mongo = mongomock.MongoClient()
+        db_client.pymongo.MongoClient = lambda *args, **kwargs: mongo
+
+    import main
+    with contextlib.redirect_stdout(io.StringIO()):
+        service = main.ScheduleService()
+    await service.parse_executor.start()
+    results = []
+    try:
+        for cycle in range(arguments.cycles):
+            corpus.revision = cycle
+            requests_before = dict(server.requests)
+            phases_before = {phase: service.phase_seconds.sum(phase=phase) for phase in PHASES}
+            log = io.StringIO()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(sys.stdout if arguments.verbose else log):
+                await service.update_schedule()
+            seconds = time.perf_counter() - start
+            requests = {kind: server.requests[kind] - requests_before[kind] for kind in server.requests}
+            total_requests = sum(requests.values())
+            results.append(dict(cycle=cycle, seconds=round(seconds, 3), requests=requests,
+                                requests_per_sec=round(total_requests / seconds, 1),
+                                peak_rss_mb=round(peak_rss_mb(), 1),
+                                phases={phase: round(service.phase_seconds.sum(phase=phase) - phases_before[phase], 3)
+                                        for phase in PHASES}))
+    finally:
+        await service.downloader.close()
+        await service.parse_executor.close()
+        await service.db_client.close()
+        await server.stop()
+    return results
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argument_parser.add_argument("--groups", type=int, default=200, help="групп в синтетическом корпусе")
+    argument_parser.add_argument("--teachers", type=int, default=400, help="ссылок на преподов в синтетическом корпусе")
+    argument_parser.add_argument("--corpus", help="записанный корпус (см. record_corpus.py) вместо синтетического")
+    argument_parser.add_argument("--cycles", type=int, default=2, help="количество циклов обновления")
+    argument_parser.add_argument("--latency", type=float, default=0.0, help="средняя задержка ответа сервера, секунды")
+    argument_parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    argument_parser.add_argument("--changed", type=float, default=1.0, help="доля расписаний, меняющихся между циклами")
+    argument_parser.add_argument("--mongo", help="хост настоящего MongoDB вместо mongomock")
+    argument_parser.add_argument("--json", help="сохранить результаты в файл")
+    argument_parser.add_argument("--verbose", action="store_true", help="не скрывать логи сервиса")
+    arguments = argument_parser.parse_args()
+    if not arguments.mongo and (arguments.changed < 1 or arguments.corpus) and arguments.cycles > 1:
+        argument_parser.error("перенос неизменившихся расписаний использует $merge, которого нет в mongomock: укажите --mongo")
+
+    results = asyncio.run(run(arguments))
+    print(f"{'cycle':<7}{'seconds':>9}{'pages':>7}{'api':>7}{'errors':>8}{'req/s':>8}{'rss MB':>8}")
+    for result in results:
+        requests = result["requests"]
+        print(f"{result['cycle']:<7}{result['seconds']:>9.2f}{requests['page']:>7}{requests['api']:>7}{requests['error']:>8}"
+              f"{result['requests_per_sec']:>8.0f}{result['peak_rss_mb']:>8.0f}")
+    print("\nphase seconds per cycle (pipeline stages: summed handler time)")
+    print(f"{'phase':<16}" + "".join(f"{result['cycle']:>9}" for result in results))
+    for phase in PHASES:
+        print(f"{phase:<16}" + "".join(f"{result['phases'][phase]:>9.2f}" for result in results))
+    if arguments.json:
+        with open(arguments.json, "w", encoding="utf-8") as result_file:
+            json.dump(results, result_file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,49 @@
 
 Клиент держит в себе два буфера для расписания: текущий и следующий. Все изменения 
 применяются к следующему буферу, чтобы пользователь не видел полуобновленного расписания.
-Чтобы применить изменения, текущий буфер меняется местами со следующим.
+Каждый буфер - это пара коллекций поколения generation_<N>.teachers и generation_<N>.groups.
+Чтобы применить изменения, указатель на текущее поколение в коллекции meta переключается
+на следующее, а для следующего обновления заводятся пустые коллекции нового поколения.
+Время применения не зависит от объема данных: старое поколение удаляется позже,
+вне критической секции, методом drop_retired_buffers.
+
+Рядом с каждым расписанием хранится идентификатор сущности на сервере БГТУ (entity_id)
+и отпечаток исходных данных (fingerprint), а также нормализованное имя (name_key), по
+которому идет поиск. На (name_key, entity_id) в каждом буфере стоит уникальный индекс,
+поэтому поиск по точному имени и по началу имени выполняется по индексу. Если отпечаток
+не изменился, расписание переносится из текущего буфера в следующий на стороне сервера
+без повторной вставки.
+
+Какой буфер текущий и его поколение хранятся в коллекции meta. База не очищается
+при запуске: если в ней уже есть примененный буфер, клиент продолжает отдавать его,
+а коллекции недописанных и устаревших поколений удаляет. Так сервис после перезапуска сразу
+отдает последнее примененное расписание, не дожидаясь полного обновления.
+
+В каждом поколении есть и коллекция rooms: индекс занятости аудиторий, который
+строится из расписаний групп следующего буфера перед применением обновлений
+(build_room_index), и коллекция calendar: даты и номера пар, которые есть в
+расписаниях групп. По ней индекс отличает слот без пар от слота, о котором
+ничего не известно. Обе переключаются вместе с буфером, поэтому всегда
+соответствуют текущему расписанию.
+
+При нормализованном хранении (normalized=True) строки расписаний - названия
+предметов, преподы, группы, аудитории, время, дни недели и даты - хранятся один раз
+в общей коллекции dictionary, а документы ссылаются на них целочисленными id. Пара
+хранится массивом [id строки с именами полей через запятую, значения полей...].
+Словарь только дополняется и не зависит от поколений, поэтому перенесенные
+без изменений документы остаются валидными. При чтении документы
+собираются обратно в исходный вид, для пользователя формат не виден. Нормализованные
+документы помечены полем normalized, поэтому в одном буфере могут лежать документы
+обоих форматов: после смены режима расписания в старом формате не переносятся,
+а перезаписываются. Словарь дополняет только один сервис, id выдаются в памяти.
+
+Отдельно от буферов, в базе schedule_cache, хранится кэш заголовков расписаний:
+URL страницы препода или группы -> заголовок для БГТУ API. Эта база не очищается
+при запуске, поэтому кэш переживает перезапуски сервиса.
+
+Для асинхронного кода есть обертка AsyncDBClient: у нее те же методы, что и у DBClient,
+но они выполняются в ограниченном пуле потоков и возвращают awaitable, чтобы
+запросы к базе не блокировали цикл событий.
 
 Example:
     from os import environ as env
@@ -24,7 +66,14 @@ Example:
 
 import pymongo
 from pymongo.collection import Collection
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
 import json
+import re
+import threading
+import time
 
 class DBClient:
     """Класс клиента базы данных
@@ -38,10 +87,39 @@ class DBClient:
             База данных, в которой хранятся буферы
         buffers (dict):
             Буферы с расписанием
+        header_cache (Collection):
+            Кэш заголовков расписаний, не очищается при запуске
+        write_batch_size (int):
+            Размер пачки при записи расписаний в следующий буфер
+        write_stats (list[dict]):
+            Время записи каждой пачки в следующий буфер: kind, documents, seconds
+        generation (int):
+            Поколение текущего буфера, увеличивается при каждом применении обновлений.
+            Сохраняется в базе, 0 - примененных обновлений еще не было
+        committed_at (float | None):
+            Время применения обновлений текущего поколения (unix time)
+        meta (Collection):
+            Состояние буферов: имя текущего буфера, поколение и время применения
+        normalized (bool):
+            Записывать расписания в нормализованном формате со ссылками на словарь строк
+        dictionary (Collection):
+            Словарь строк нормализованного формата: {"_id": id, "value": строка}
 
     """
 
-    def __init__(self, host: str, port: int, username: str, password: str):
+    # Режимы поиска по имени: auto - точное совпадение, если его нет - по началу имени. Оба по индексу,
+    # неякорный $regex по всей коллекции (contains) выполняется только по явному запросу. Подстроку
+    # для auto сервис ищет сам по триграммному индексу имен в памяти
+    match_modes = ("auto", "exact", "prefix", "contains")
+
+    # Поле с именем в документах каждой подколлекции
+    _name_fields = {"teachers": "nameofteacher", "groups": "nameofgroup"}
+
+    # Поля, которые хранятся для служебных целей и не отдаются пользователю
+    _service_fields = {"_id": 0, "entity_id": 0, "fingerprint": 0, "name_key": 0}
+
+    def __init__(self, host: str, port: int, username: str, password: str, write_batch_size: int = 500,
+                 normalized: bool = False):
         """Конструктор
 
         Args:
@@ -53,6 +131,10 @@ class DBClient:
                 Имя пользователя mongodb
             password (str):
                 Пароль пользователя mongodb
+            write_batch_size (int):
+                Размер пачки при записи расписаний в следующий буфер
+            normalized (bool):
+                Записывать расписания в нормализованном формате
         
         """
 
@@ -72,35 +154,238 @@ class DBClient:
                     print("Database connection counter exceeded. Closing service")
                     raise e
                 
-        self.client.drop_database("schedule_db")
         self.db = self.client["schedule_db"]
-
-        self.buffers = dict(current_buffer = self.db["buffer_1"], next_buffer = self.db["buffer_2"], template = self.db["template"])
-        self.buffers["template"].insert_one({"teachers": [], "groups": []})
+        self.meta = self.db["meta"]
+        self.header_cache = self.client["schedule_cache"]["headers"]
+        self.write_batch_size = max(write_batch_size, 1)
+        self.write_stats: list[dict] = []
+        self._pending_writes: dict[str, list] = dict(teachers=[], groups=[])
+        self._write_lock = threading.Lock()
+        self.normalized = normalized
+        self.dictionary = self.db["dictionary"]
+        self.dictionary.create_index("value", unique=True)
+        # Словарь целиком держим в памяти: строк в нем тысячи, а не миллионы
+        self._strings = {document["_id"]: document["value"] for document in self.dictionary.find({})}
+        self._string_ids = {value: string_id for string_id, value in self._strings.items()}
+        self._next_string_id = max(self._strings, default=-1) + 1
+        self._pending_strings: list[dict] = []
+        self._shapes: dict[int, list[str]] = dict()
+
+        # Восстанавливаем состояние буферов после перезапуска
+        state = self.meta.find_one({"_id": "buffers"})
+        self.generation = state["generation"] if state else 0
+        self.committed_at = state.get("committed_at") if state else None
+        current_name = state["current_buffer"] if state else self._buffer_name(self.generation)
+        self.buffers = dict(current_buffer = self.db[current_name])
+        self._retired_buffers: list[str] = []
+        self._retired_lock = threading.Lock()
+        if state:
+            print(f"Restored committed schedule of generation {self.generation} from {current_name}")
+        # Все буферы, кроме текущего, остались от прошлых запусков или недописаны при падении
+        stale_buffers = {name.split(".")[0] for name in self.db.list_collection_names()
+                         if name.startswith(("buffer_", "generation_"))}
+        if state:
+            stale_buffers.discard(current_name)
+        self._retired_buffers.extend(sorted(stale_buffers))
+        self.drop_retired_buffers()
+        self._prepare_next_buffer()
 
 
     def __getitem__(self, key: str) -> Collection:
         return self.buffers[key]
-    
 
-    def _clear_buffer(self, buffer: Collection):
-        """Очищает указанный буфер
-        
-        Приводит буфер к первоначальному состоянию с помощью шаблона
+    @staticmethod
+    def normalize_name(name: str) -> str:
+        """Нормализовать имя препода или группы для поиска
+
+        Приводит к нижнему регистру без учета особенностей языка и схлопывает пробелы
 
         Args:
-            buffer (Collection):
-                Буфер, который будет очищен
+            name (str):
+                Имя препода или группы
+
+        Returns:
+            Ключ для поиска по полю name_key
 
         """
 
-        buffer["teachers"].delete_many({})
-        buffer["groups"].delete_many({})
-        pipeline = [{"$match": {}},
-                    {"$out": buffer.full_name}]
-        self["template"].aggregate(pipeline)
+        return " ".join(name.casefold().split())
     
 
+    @staticmethod
+    def _buffer_name(generation: int) -> str:
+        return f"generation_{generation}"
+
+    def _prepare_next_buffer(self):
+        """Завести пустые коллекции следующего поколения с индексами
+
+        Коллекции пустые, поэтому создание индексов занимает постоянное время
+
+        """
+
+        next_buffer = self.db[self._buffer_name(self.generation + 1)]
+        for kind in ("rooms", "calendar"):
+            next_buffer[kind].drop()
+        for kind in ("teachers", "groups"):
+            next_buffer[kind].drop()
+            next_buffer[kind].create_index([("name_key", pymongo.ASCENDING), ("entity_id", pymongo.ASCENDING)],
+                                           unique=True)
+        self.buffers["next_buffer"] = next_buffer
+        self.write_stats = []
+
+    def drop_retired_buffers(self):
+        """Удалить коллекции поколений, которые больше не являются текущими
+
+        Вызывается вне критической секции применения обновлений, например
+        в фоне через некоторое время после commit_updates, чтобы уже начатые
+        запросы к старому поколению успели завершиться.
+
+        """
+
+        with self._retired_lock:
+            retired, self._retired_buffers = self._retired_buffers, []
+        for name in retired:
+            for kind in ("teachers", "groups", "rooms", "calendar"):
+                self.db[name][kind].drop()
+            print(f"Dropped retired buffer {name}")
+
+    def _to_document(self, kind: str, schedule: dict) -> dict:
+        """Собрать документ для буфера из результата парсинга, не изменяя его"""
+
+        name_field = self._name_fields[kind]
+        document = {key: value for key, value in schedule.items() if key != "table_name"}
+        document[name_field] = schedule["table_name"]
+        document["name_key"] = self.normalize_name(document[name_field])
+        if self.normalized and "weeks" in document:
+            document["weeks"] = self._normalize_weeks(document["weeks"])
+            document["normalized"] = True
+        return document
+
+    def _intern(self, value):
+        """Заменить строку (или список строк) на id из словаря, новые строки ставятся в очередь записи"""
+
+        if isinstance(value, list):
+            return [self._intern(item) for item in value]
+        if not isinstance(value, str):
+            return value
+        if (string_id := self._string_ids.get(value)) is None:
+            string_id = self._next_string_id
+            self._next_string_id += 1
+            self._strings[string_id] = value
+            self._string_ids[value] = string_id
+            self._pending_strings.append({"_id": string_id, "value": value})
+        return string_id
+
+    def _normalize_weeks(self, weeks: list[dict]) -> list[dict]:
+        """Перевести недели расписания в нормализованный формат"""
+
+        intern = self._intern
+        return [dict(week_status=intern(week["week_status"]),
+                     day=[dict(day_of_week=intern(day["day_of_week"]), date=intern(day["date"]),
+                               subjects=[[intern(",".join(subject))] + [intern(value) for value in subject.values()]
+                                         for subject in day["subjects"]])
+                          for day in week["day"]])
+                for week in weeks]
+
+    def _string(self, string_id):
+        """Строка по id из словаря; id, записанные другим клиентом, дочитываются из базы"""
+
+        if isinstance(string_id, list):
+            return [self._string(item) for item in string_id]
+        if not isinstance(string_id, int):
+            return string_id
+        if (value := self._strings.get(string_id)) is None:
+            value = self._strings[string_id] = self.dictionary.find_one({"_id": string_id})["value"]
+        return value
+
+    def _rehydrate(self, document: dict | None) -> dict | None:
+        """Собрать нормализованный документ обратно в исходный вид, остальные документы вернуть как есть"""
+
+        if not document or not document.pop("normalized", False):
+            return document
+        string = self._string
+        for week in document.get("weeks", []):
+            week["week_status"] = string(week["week_status"])
+            for day in week["day"]:
+                day["day_of_week"] = string(day["day_of_week"])
+                day["date"] = string(day["date"])
+                subjects = []
+                for shape_id, *values in day["subjects"]:
+                    if (fields := self._shapes.get(shape_id)) is None:
+                        fields = self._shapes[shape_id] = string(shape_id).split(",")
+                    subjects.append({field: string(value) for field, value in zip(fields, values)})
+                day["subjects"] = subjects
+        return document
+
+    def _write_batch(self, kind: str, requests: list):
+        """Отправить одну пачку записей неупорядоченным bulk_write и замерить время"""
+
+        start = time.perf_counter()
+        # Новые строки словаря записываются раньше документов, которые на них ссылаются
+        if self._pending_strings:
+            self.dictionary.insert_many(self._pending_strings)
+            self._pending_strings = []
+        self["next_buffer"][kind].bulk_write(requests, ordered=False)
+        seconds = time.perf_counter() - start
+        self.write_stats.append(dict(kind=kind, documents=len(requests), seconds=seconds))
+        print(f"Bulk write {kind}: {len(requests)} documents in {seconds:.3f} seconds")
+
+    def _add_schedules(self, kind: str, schedules: list[dict]):
+        """Добавить расписания в очередь записи
+
+        Документы записываются upsert-ом по (name_key, entity_id), на эти поля
+        стоит уникальный индекс. Как только в очереди набирается write_batch_size
+        документов, они отправляются одной пачкой.
+
+        Args:
+            kind (str):
+                Подколлекция буфера: "teachers" или "groups"
+            schedules (list[dict]):
+                Результаты парсинга
+
+        """
+
+        with self._write_lock:
+            pending = self._pending_writes[kind]
+            for schedule in schedules:
+                document = self._to_document(kind, schedule)
+                pending.append(pymongo.ReplaceOne({"name_key": document["name_key"], "entity_id": document.get("entity_id")},
+                                                  document, upsert=True))
+            while len(pending) >= self.write_batch_size:
+                self._write_batch(kind, pending[:self.write_batch_size])
+                del pending[:self.write_batch_size]
+
+    def add_teachers(self, teacher_schedules: list[dict]):
+        """Добавить расписания преподов в очередь записи следующего буфера
+
+        Args:
+            teacher_schedules (list[dict]):
+                Список расписаний преподов
+
+        """
+
+        self._add_schedules("teachers", teacher_schedules)
+
+    def add_groups(self, group_schedules: list[dict]):
+        """Добавить расписания групп в очередь записи следующего буфера
+
+        Args:
+            group_schedules (list[dict]):
+                Список расписаний групп
+
+        """
+
+        self._add_schedules("groups", group_schedules)
+
+    def flush_writes(self):
+        """Записать все, что осталось в очереди записи"""
+
+        with self._write_lock:
+            for kind, pending in self._pending_writes.items():
+                if pending:
+                    self._write_batch(kind, pending)
+                    pending.clear()
+
     def update_teachers_one(self, teacher_schedule: dict):
         """Обновить одно расписание препода
 
@@ -112,14 +397,13 @@ class DBClient:
 
         """
 
-        teacher_schedule["nameofteacher"] = teacher_schedule.pop("table_name")
-        self["next_buffer"]["teachers"].insert_one(teacher_schedule)
+        self.update_teachers_many([teacher_schedule])
 
 
     def update_teachers_many(self, teacher_schedules: list[dict]):
         """Обновить много расписаний преподов
         
-        Добавляет в следующий буфер много расписаний преподов
+        Добавляет в следующий буфер много расписаний преподов и сразу записывает их
 
         Args:
             teacher_schedule (list[dict]):
@@ -127,9 +411,8 @@ class DBClient:
 
         """
 
-        for schedule in teacher_schedules:
-            schedule["nameofteacher"] = schedule.pop("table_name")
-        self["next_buffer"]["teachers"].insert_many(teacher_schedules)
+        self.add_teachers(teacher_schedules)
+        self.flush_writes()
    
 
     def update_groups_one(self, group_schedule: dict):
@@ -143,13 +426,12 @@ class DBClient:
         
         """
 
-        group_schedule["nameofgroup"] = group_schedule.pop("table_name")
-        self["next_buffer"]["groups"].insert_one(group_schedule)
+        self.update_groups_many([group_schedule])
     
     def update_groups_many(self, group_schedules: list[dict]):
         """Обновить расписание нескольких групп
 
-        Добавляет расписание нескольких групп в следующий буфер
+        Добавляет расписание нескольких групп в следующий буфер и сразу записывает их
 
         Args:
             group_schedules (list[dict]):
@@ -157,21 +439,233 @@ class DBClient:
         
         """
 
-        for schedule in group_schedules:
-            schedule["nameofgroup"] = schedule.pop("table_name")
-        self["next_buffer"]["groups"].insert_many(group_schedules)
+        self.add_groups(group_schedules)
+        self.flush_writes()
+
+    def get_cached_headers(self) -> dict[str, dict]:
+        """Получить кэш заголовков расписаний
+
+        Returns:
+            Словарь URL -> {"header": заголовок, "checked_at": время последней проверки в секундах}
+
+        """
+
+        return {document["_id"]: dict(header=document["header"], checked_at=document["checked_at"])
+                for document in self.header_cache.find({})}
+
+    def update_cached_headers(self, headers: dict[str, dict]):
+        """Сохранить свежие заголовки в кэш
+
+        Args:
+            headers (dict[str, dict]):
+                Словарь URL -> заголовок, полученный со страницы расписания
+
+        """
+
+        if not headers:
+            return
+        checked_at = time.time()
+        requests = [pymongo.UpdateOne({"_id": url}, {"$set": {"header": header, "checked_at": checked_at}}, upsert=True)
+                    for url, header in headers.items()]
+        self.header_cache.bulk_write(requests, ordered=False)
+
+    def _get_fingerprints(self, kind: str) -> dict[str, str]:
+        """Получить отпечатки расписаний из текущего буфера
+
+        Args:
+            kind (str):
+                Подколлекция буфера: "teachers" или "groups"
+
+        Returns:
+            Словарь entity_id -> fingerprint
+
+        """
+
+        # Документы в другом формате хранения не переносятся, а перезаписываются в текущем
+        find_result = self["current_buffer"][kind].find({"fingerprint": {"$exists": True},
+                                                         "normalized": {"$exists": self.normalized}},
+                                                        {"_id": 0, "entity_id": 1, "fingerprint": 1})
+        return {document["entity_id"]: document["fingerprint"] for document in find_result}
+
+    def get_teacher_fingerprints(self) -> dict[str, str]:
+        """Получить отпечатки расписаний преподов из текущего буфера"""
+
+        return self._get_fingerprints("teachers")
+
+    def get_group_fingerprints(self) -> dict[str, str]:
+        """Получить отпечатки расписаний групп из текущего буфера"""
+
+        return self._get_fingerprints("groups")
+
+    def _carry_forward(self, kind: str, entity_ids: list[str]):
+        """Перенести неизменившиеся расписания из текущего буфера в следующий
+
+        Копирование выполняется одним агрегационным запросом на стороне MongoDB,
+        документы не проходят через сервис.
+
+        Args:
+            kind (str):
+                Подколлекция буфера: "teachers" или "groups"
+            entity_ids (list[str]):
+                Идентификаторы сущностей, расписания которых нужно перенести
+
+        """
+
+        if not entity_ids:
+            return
+        # Документы сливаются upsert-ом по уникальному индексу (name_key, entity_id), _id выдается заново
+        pipeline = [{"$match": {"entity_id": {"$in": entity_ids}}},
+                    {"$unset": "_id"},
+                    {"$merge": {"into": self["next_buffer"][kind].name,
+                                "on": ["name_key", "entity_id"],
+                                "whenMatched": "replace",
+                                "whenNotMatched": "insert"}}]
+        self["current_buffer"][kind].aggregate(pipeline)
+
+    def carry_teachers_forward(self, entity_ids: list[str]):
+        """Перенести неизменившиеся расписания преподов в следующий буфер
+
+        Args:
+            entity_ids (list[str]):
+                Идентификаторы преподов на сервере БГТУ
+
+        """
+
+        self._carry_forward("teachers", entity_ids)
+
+    def carry_groups_forward(self, entity_ids: list[str]):
+        """Перенести неизменившиеся расписания групп в следующий буфер
+
+        Args:
+            entity_ids (list[str]):
+                Идентификаторы групп на сервере БГТУ
+
+        """
+
+        self._carry_forward("groups", entity_ids)
+
+    def build_room_index(self) -> int:
+        """Построить индекс занятости аудиторий в следующем буфере
+
+        Проходит по расписаниям групп следующего буфера и для каждой аудитории
+        собирает занятые слоты: дата, номер пары, время, предмет, группы и преподы.
+        Даты и номера пар всех групп сохраняются в коллекцию calendar.
+        Вызывается после записи всех расписаний и перед commit_updates.
+
+        Returns:
+            Количество аудиторий в индексе
+
+        """
+
+        slots: dict[tuple[str, str, str], dict] = dict()
+        date_order: dict[str, int] = dict()
+        numbers: set[str] = set()
+        cursor = self["next_buffer"]["groups"].find({}, {"_id": 0, "nameofgroup": 1, "weeks": 1, "normalized": 1})
+        for document in map(self._rehydrate, cursor):
+            for week in document.get("weeks", []):
+                for day in week["day"]:
+                    date_order.setdefault(day["date"], len(date_order))
+                    for subject in day["subjects"]:
+                        if "number" in subject:
+                            numbers.add(subject["number"])
+                        for room in subject.get("classroom", []):
+                            slot = slots.get((room, day["date"], subject["number"]))
+                            if slot is None:
+                                slot = dict(date=day["date"], day_of_week=day["day_of_week"], number=subject["number"],
+                                            start=subject["start"], end=subject["end"], name=subject["name"],
+                                            groups=[], teachers=[])
+                                slots[(room, day["date"], subject["number"])] = slot
+                            if document["nameofgroup"] not in slot["groups"]:
+                                slot["groups"].append(document["nameofgroup"])
+                            slot["teachers"] += [teacher for teacher in subject.get("teacher", []) if teacher not in slot["teachers"]]
+        rooms: dict[str, list[dict]] = dict()
+        for (room, _, _), slot in slots.items():
+            rooms.setdefault(room, []).append(slot)
+        documents = [dict(room=room, slots=sorted(room_slots, key=lambda slot: (date_order[slot["date"]], slot["number"].zfill(2))))
+                     for room, room_slots in sorted(rooms.items())]
+        self["next_buffer"]["rooms"].drop()
+        if documents:
+            self["next_buffer"]["rooms"].insert_many(documents)
+        self["next_buffer"]["calendar"].drop()
+        self["next_buffer"]["calendar"].insert_one(dict(dates=list(date_order),
+                                                        numbers=sorted(numbers, key=lambda number: number.zfill(2))))
+        return len(documents)
+
+    def get_next_group_documents(self) -> list[dict]:
+        """Получить все расписания групп следующего буфера
+
+        Нужны, чтобы вывести из них расписания преподов после записи групп
+        и перед commit_updates.
+
+        Returns:
+            Список документов {"nameofgroup": имя группы, "weeks": недели}
+
+        """
+
+        cursor = self["next_buffer"]["groups"].find({}, {"_id": 0, "nameofgroup": 1, "weeks": 1, "normalized": 1})
+        return [self._rehydrate(document) for document in cursor]
+
+    def get_room_documents(self) -> list[dict]:
+        """Получить индекс занятости аудиторий текущего буфера
+
+        Returns:
+            Список документов {"room": аудитория, "slots": [занятые слоты]}
+
+        """
+
+        return list(self["current_buffer"]["rooms"].find({}, {"_id": 0}))
+
+    def get_room_calendar(self) -> dict | None:
+        """Получить даты и номера пар, по которым построен индекс аудиторий текущего буфера
+
+        Returns:
+            Документ {"dates": [даты по порядку], "numbers": [номера пар]} или None,
+            если индекс построен без календаря
+
+        """
+
+        return self["current_buffer"]["calendar"].find_one({}, {"_id": 0})
 
     def commit_updates(self):
         """Применить обновления
         
-        Меняет местами текущий и следующий буфер, предоставляя пользователю
-        доступ к обновлениям
+        Делает следующий буфер текущим, предоставляя пользователю доступ к обновлениям.
+        Данные не копируются и не удаляются: переключается только указатель в meta,
+        а прежний текущий буфер ставится в очередь на удаление (см. drop_retired_buffers)
         
         """
 
-        self.buffers["next_buffer"], self.buffers["current_buffer"] = self.buffers["current_buffer"], self.buffers["next_buffer"]
-        self._clear_buffer(self["next_buffer"])
-    
+        retired = self["current_buffer"]
+        committed_at = time.time()
+        self.meta.replace_one({"_id": "buffers"},
+                              {"current_buffer": self["next_buffer"].name,
+                               "generation": self.generation + 1,
+                               "committed_at": committed_at},
+                              upsert=True)
+        self.buffers["current_buffer"] = self["next_buffer"]
+        # Поколение меняется только после переключения, чтобы данные нового буфера
+        # никогда не оказались помечены старым поколением
+        self.committed_at = committed_at
+        self.generation += 1
+        with self._retired_lock:
+            self._retired_buffers.append(retired.name)
+        self._prepare_next_buffer()
+
+    def discard_updates(self):
+        """Отменить недописанные обновления
+
+        Сбрасывает очередь записи и заводит следующий буфер заново, чтобы после
+        прерванного цикла обновления его остатки не попали в следующий цикл.
+        Текущий буфер не меняется. Новые строки словаря не сбрасываются:
+        id уже выданы, а словарь только дополняется.
+
+        """
+
+        with self._write_lock:
+            for pending in self._pending_writes.values():
+                pending.clear()
+        self._prepare_next_buffer()
+
     def get_teacher_list(self) -> str:
         """Получить список преподов
 
@@ -179,7 +673,7 @@ class DBClient:
         
         """
 
-        find_result = self["current_buffer"]["teachers"].find({}, {"_id": 0, "nameofteacher": 1})
+        find_result = self["current_buffer"]["teachers"].find({}, {"_id": 0, "nameofteacher": 1}).sort("name_key")
         find_result_raw = list(map(dict, find_result))
         find_result_list = dict(teacher_names = [name["nameofteacher"] for name in find_result_raw])
         return json.dumps(find_result_list)
@@ -191,44 +685,245 @@ class DBClient:
         
         """
 
-        find_result = self["current_buffer"]["groups"].find({}, {"_id": 0,"nameofgroup": 1})
+        find_result = self["current_buffer"]["groups"].find({}, {"_id": 0,"nameofgroup": 1}).sort("name_key")
         find_result_raw = list(map(dict, find_result))
         find_result_list = dict(group_names = [name["nameofgroup"] for name in find_result_raw])
         return json.dumps(find_result_list)
 
-    def get_teacher_schedule_full(self, teacher_name: str) -> str:
+    @staticmethod
+    def _slice_stages(week: int | None = None, day: str | None = None, dates: list[str] | None = None,
+                      string_ids: dict[str, int] | None = None) -> list[dict]:
+        """Стадии агрегации, оставляющие в weeks[].day[] только нужный срез
+
+        Недели, в которых после фильтрации не осталось дней, отбрасываются.
+        В нормализованных документах вместо дня недели и даты лежат id из словаря,
+        поэтому значения сравниваются и со строкой, и с ее id.
+
+        Args:
+            week (int | None):
+                Номер недели: 0 - эта, 1 - следующая
+            day (str | None):
+                Полное название дня недели
+            dates (list[str] | None):
+                Даты в формате "ДД.ММ"
+            string_ids (dict[str, int] | None):
+                Словарь строка -> id нормализованного формата
+
+        Returns:
+            Список стадий агрегации
+
+        """
+
+        string_ids = string_ids or dict()
+        with_ids = lambda values: values + [string_ids[value] for value in values if value in string_ids]
+        stages = []
+        if week is not None:
+            stages.append({"$set": {"weeks": {"$slice": ["$weeks", week, 1]}}})
+        conditions = []
+        if day is not None:
+            conditions.append({"$in": ["$$day.day_of_week", with_ids([day])]})
+        if dates is not None:
+            conditions.append({"$in": ["$$day.date", with_ids(dates)]})
+        if conditions:
+            days = {"$filter": {"input": "$$week.day", "as": "day", "cond": {"$and": conditions}}}
+            weeks = {"$map": {"input": "$weeks", "as": "week", "in": {"week_status": "$$week.week_status", "day": days}}}
+            stages.append({"$set": {"weeks": {"$filter": {"input": weeks, "as": "week",
+                                                          "cond": {"$gt": [{"$size": "$$week.day"}, 0]}}}}})
+        return stages
+
+    def _find_schedule(self, kind: str, name: str, mode: str, schedule_slice: dict | None = None) -> dict | None:
+        """Найти расписание по имени в текущем буфере
+
+        Из нескольких подходящих документов выбирается первый по (name_key, entity_id),
+        поэтому результат не зависит от порядка вставки. Если задан срез, документ
+        обрезается агрегацией на стороне MongoDB.
+
+        Args:
+            kind (str):
+                Подколлекция буфера: "teachers" или "groups"
+            name (str):
+                Имя из запроса пользователя, воспринимается как обычный текст
+            mode (str):
+                Режим поиска: "exact", "prefix", "contains" или "auto"
+            schedule_slice (dict | None):
+                Срез расписания: week, day и dates, как у _slice_stages
+
+        Returns:
+            Документ с расписанием без служебных полей или None
+
+        """
+
+        if mode not in self.match_modes:
+            raise ValueError(f"Неизвестный режим поиска: {mode}. Доступны: {', '.join(self.match_modes)}")
+        if mode == "auto":
+            return (self._find_schedule(kind, name, "exact", schedule_slice)
+                    or self._find_schedule(kind, name, "prefix", schedule_slice))
+        name_key = self.normalize_name(name)
+        if mode == "exact":
+            query = {"name_key": name_key}
+        elif mode == "prefix":
+            # Якорный регистрозависимый regex по нормализованному полю использует индекс
+            query = {"name_key": {"$regex": "^" + re.escape(name_key)}}
+        else:
+            query = {"name_key": {"$regex": re.escape(name_key)}}
+        sort = [("name_key", pymongo.ASCENDING), ("entity_id", pymongo.ASCENDING)]
+        if not schedule_slice:
+            return self._rehydrate(self["current_buffer"][kind].find_one(query, self._service_fields, sort=sort))
+        pipeline = [{"$match": query}, {"$sort": dict(sort)}, {"$limit": 1},
+                    *self._slice_stages(**schedule_slice, string_ids=self._string_ids),
+                    {"$project": self._service_fields}]
+        return self._rehydrate(next(self["current_buffer"][kind].aggregate(pipeline), None))
+
+    def find_schedules(self, kind: str, names: list[str], schedule_slice: dict | None = None):
+        """Найти расписания сразу для многих имен одним запросом
+
+        Имена сравниваются точно после нормализации и ищутся одним $in по
+        индексу name_key. Документы идут в порядке (name_key, entity_id) и
+        содержат name_key, чтобы их можно было сопоставить с запрошенными именами.
+        Результаты не загружаются целиком: их читают пачками через fetch_batch.
+
+        Args:
+            kind (str):
+                Подколлекция буфера: "teachers" или "groups"
+            names (list[str]):
+                Имена из запроса
+            schedule_slice (dict | None):
+                Срез расписания: week, day и dates, как у _slice_stages
+
+        Returns:
+            Курсор по найденным документам
+
+        """
+
+        query = {"name_key": {"$in": list({self.normalize_name(name) for name in names})}}
+        projection = {key: value for key, value in self._service_fields.items() if key != "name_key"}
+        sort = [("name_key", pymongo.ASCENDING), ("entity_id", pymongo.ASCENDING)]
+        if not schedule_slice:
+            return self["current_buffer"][kind].find(query, projection, sort=sort)
+        pipeline = [{"$match": query}, {"$sort": dict(sort)},
+                    *self._slice_stages(**schedule_slice, string_ids=self._string_ids),
+                    {"$project": projection}]
+        return self["current_buffer"][kind].aggregate(pipeline)
+
+    def fetch_batch(self, cursor, size: int) -> list[dict]:
+        """Прочитать из курсора следующую пачку документов (пустой список - курсор исчерпан)"""
+
+        return [self._rehydrate(document) for document in islice(cursor, size)]
+
+    @staticmethod
+    def close_cursor(cursor):
+        """Закрыть курсор, не дочитывая его"""
+
+        cursor.close()
+
+    def get_teacher_schedule_full(self, teacher_name: str, mode: str = "auto", week: int | None = None,
+                              day: str | None = None, dates: list[str] | None = None) -> str:
         """Получить полное расписание препода
 
-        Возвращает JSON с расписанием препода на две недели: эту и следующую
+        Возвращает JSON с расписанием препода на две недели: эту и следующую,
+        или только запрошенный срез
 
         Args:
             teacher_name (str):
                 Имя препода
+            mode (str):
+                Режим поиска: "exact", "prefix", "contains" или "auto"
+            week (int | None):
+                Вернуть только одну неделю: 0 - эта, 1 - следующая
+            day (str | None):
+                Вернуть только дни с этим названием, например "Понедельник"
+            dates (list[str] | None):
+                Вернуть только дни с этими датами в формате "ДД.ММ"
         
         """
 
-        query = {"nameofteacher": {"$regex": teacher_name, "$options": 'i'}}
-        find_result = self["current_buffer"]["teachers"].find_one(query, {"_id": 0})
+        schedule_slice = {key: value for key, value in dict(week=week, day=day, dates=dates).items() if value is not None}
+        find_result = self._find_schedule("teachers", teacher_name, mode, schedule_slice)
         if find_result:
             find_result_list = dict(find_result)
             return json.dumps(find_result_list)
         return ""
 
-    def get_group_schedule_full(self, group_name: str) -> str:
+    def get_group_schedule_full(self, group_name: str, mode: str = "auto", week: int | None = None,
+                              day: str | None = None, dates: list[str] | None = None) -> str:
         """Получить полное расписание группы
 
-        Возвращает JSON с расписанием группы на две недели: эту и следующую
+        Возвращает JSON с расписанием группы на две недели: эту и следующую,
+        или только запрошенный срез
 
         Args:
             group_name (str):
                 Имя группы
+            mode (str):
+                Режим поиска: "exact", "prefix", "contains" или "auto"
+            week (int | None):
+                Вернуть только одну неделю: 0 - эта, 1 - следующая
+            day (str | None):
+                Вернуть только дни с этим названием, например "Понедельник"
+            dates (list[str] | None):
+                Вернуть только дни с этими датами в формате "ДД.ММ"
         
         """
 
-        query = {"nameofgroup": {"$regex": group_name, "$options": 'i'}}
-        find_result = self["current_buffer"]["groups"].find_one(query, {"_id": 0})
+        schedule_slice = {key: value for key, value in dict(week=week, day=day, dates=dates).items() if value is not None}
+        find_result = self._find_schedule("groups", group_name, mode, schedule_slice)
         if find_result:
             find_result_list = dict(find_result)
             return json.dumps(find_result_list)
         return ""
-    
+
+
+class AsyncDBClient:
+    """Асинхронная обертка над клиентом базы данных
+
+    Повторяет методы DBClient, но каждый вызов выполняется в ограниченном пуле
+    потоков. pymongo потокобезопасен, поэтому одновременные запросы из разных
+    обработчиков перекрывают свои задержки, а цикл событий не блокируется.
+
+    Example:
+        db_client = AsyncDBClient(DBClient("localhost", 27017, "username", "password"), max_workers=8)
+        teacher_list = await db_client.get_teacher_list()
+
+    Attributes:
+        db_client (DBClient):
+            Синхронный клиент, методы которого вызываются в пуле
+        max_workers (int):
+            Максимальное количество одновременных запросов к базе
+
+    """
+
+    def __init__(self, db_client: DBClient, max_workers: int = 8):
+        """Конструктор
+
+        Args:
+            db_client (DBClient):
+                Синхронный клиент базы данных
+            max_workers (int):
+                Максимальное количество одновременных запросов к базе
+
+        """
+
+        self.db_client = db_client
+        self.max_workers = max(max_workers, 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="db_client")
+
+    def __getattr__(self, name: str):
+        method = getattr(self.db_client, name)
+        if not callable(method):
+            return method
+
+        async def run_in_executor(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(method, *args, **kwargs))
+        return run_in_executor
+
+    async def close(self):
+        """Дождаться текущих запросов и остановить пул потоков"""
+
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+
+    async def executor_context(self, _app):
+        """Контекст жизни пула для app.cleanup_ctx"""
+
+        yield
+        await self.close()
@@ -3,19 +3,29 @@
 Удобная обертка над библиотекой aiohttp для легкого использования 
 ее функций в контексте сервиса "Расписание".
 
+Загрузчик держит одну долгоживущую сессию aiohttp с пулом соединений, чтобы
+не платить за TCP+TLS рукопожатие и DNS запрос на каждый запрос к серверу БГТУ.
+При включенных условных запросах загрузчик запоминает ETag/Last-Modified ответов
+и на ответ 304 Not Modified возвращает сохраненное тело. Сохраненные тела занимают
+не больше validator_cache_bytes: при переполнении вытесняются давно не запрошенные
+адреса, и для них запрос снова идет без условных заголовков.
+
 Example:
     agent = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:101.0) Gecko/20100101 Firefox/101.0'}
     url = "https://google.com"
     downloader = ScheduleDownloader(agent)
-    text, status = await downloader.try_download(url)
+    text, status = await downloader.try_download_page(url)
     if status:
         print(text)
     else:
         print("Ошибка скачивания")
+    await downloader.close()
 """
 
 import aiohttp
+import asyncio
 import sys
+from collections import OrderedDict
 
 class ScheduleDownloader:
     """Класс для скачивания html страниц и получения ответов с API запросов.
@@ -26,19 +36,161 @@ class ScheduleDownloader:
     Attributes:
         headers (dict):
             Заголовок для получения корректного контента с сервера
+        connection_limit (int):
+            Максимальное количество одновременных соединений в пуле (0 - без ограничения)
+        connection_limit_per_host (int):
+            Максимальное количество одновременных соединений к одному хосту (0 - без ограничения)
+        keepalive_timeout (float):
+            Время в секундах, которое простаивающее соединение держится открытым
+        dns_cache_ttl (int):
+            Время жизни записи в кэше DNS в секундах
+        conditional_requests (bool):
+            Отправлять ли If-None-Match/If-Modified-Since для уже скачанных адресов
+        validator_cache_bytes (int):
+            Максимальный суммарный размер тел ответов, сохраненных для условных запросов
 
     """  
 
-    def __init__(self, headers: dict):
+    def __init__(self, headers: dict,
+                 connection_limit: int = 100,
+                 connection_limit_per_host: int = 20,
+                 keepalive_timeout: float = 60.0,
+                 dns_cache_ttl: int = 600,
+                 conditional_requests: bool = False,
+                 validator_cache_bytes: int = 64 * 1024 * 1024):
         """Конструктор
         
         Args:
             headers (dict):
                 Заголовок для получения корректного контента с сервера
+            connection_limit (int):
+                Максимальное количество одновременных соединений в пуле (0 - без ограничения)
+            connection_limit_per_host (int):
+                Максимальное количество одновременных соединений к одному хосту (0 - без ограничения)
+            keepalive_timeout (float):
+                Время в секундах, которое простаивающее соединение держится открытым
+            dns_cache_ttl (int):
+                Время жизни записи в кэше DNS в секундах
+            conditional_requests (bool):
+                Отправлять ли If-None-Match/If-Modified-Since для уже скачанных адресов
+            validator_cache_bytes (int):
+                Максимальный суммарный размер тел ответов, сохраненных для условных запросов
 
         """
 
         self.headers = headers
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.conditional_requests = conditional_requests
+        self._session: aiohttp.ClientSession | None = None
+        self.validator_cache_bytes = validator_cache_bytes
+        # url -> (ETag, Last-Modified, тело ответа, размер тела в байтах), в порядке последнего обращения
+        self._validators: OrderedDict[str, tuple[str | None, str | None, str, int]] = OrderedDict()
+        self._validators_bytes = 0
+
+    async def start(self):
+        """Открыть сессию
+        
+        Создает долгоживущую сессию с настроенным пулом соединений. Если сессия
+        уже открыта, ничего не делает.
+
+        """
+
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(limit=self.connection_limit,
+                                         limit_per_host=self.connection_limit_per_host,
+                                         keepalive_timeout=self.keepalive_timeout,
+                                         ttl_dns_cache=self.dns_cache_ttl)
+        self._session = aiohttp.ClientSession(connector=connector, headers=self.headers)
+
+    async def close(self):
+        """Закрыть сессию
+        
+        Закрывает сессию и все соединения пула. После закрытия сессия будет
+        создана заново при следующем запросе.
+
+        """
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def session_context(self, _app):
+        """Контекст жизни сессии для aiohttp приложения
+
+        Предназначен для app.cleanup_ctx: открывает сессию при старте сервера
+        и закрывает ее при остановке.
+
+        """
+
+        await self.start()
+        yield
+        await self.close()
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Получить открытую сессию, при необходимости открыв ее"""
+
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def _get_text(self, url: str) -> tuple[str, bool]:
+        """Сделать GET запрос с учетом условных заголовков
+
+        Args:
+            url (str):
+                Полный адрес запроса
+
+        Returns:
+            Кортеж с двумя элементами: первый - результирующая строка и второй - флаг успеха
+
+        """
+
+        client = await self._get_session()
+        cached = self._validators.get(url) if self.conditional_requests else None
+        request_headers = dict()
+        if cached:
+            self._validators.move_to_end(url)
+            etag, last_modified, _, _ = cached
+            if etag:
+                request_headers["If-None-Match"] = etag
+            if last_modified:
+                request_headers["If-Modified-Since"] = last_modified
+        try:
+            async with client.get(url, headers=request_headers) as response:
+                if response.status == 304 and cached:
+                    return (cached[2], True)
+                if response.status == 200:
+                    text = await response.text()
+                    if self.conditional_requests:
+                        etag = response.headers.get("ETag")
+                        last_modified = response.headers.get("Last-Modified")
+                        if etag or last_modified:
+                            self._remember(url, etag, last_modified, text)
+                    return (text, True)
+                return ("", False)
+        except asyncio.CancelledError:
+            # Отмена - не ошибка сети: задача должна завершиться, а не уйти на повтор
+            raise
+        except Exception:
+            return ("", False)
+
+    def _remember(self, url: str, etag: str | None, last_modified: str | None, text: str):
+        """Сохранить валидаторы и тело ответа, вытеснив давно не запрошенные адреса сверх лимита"""
+
+        if (previous := self._validators.pop(url, None)) is not None:
+            self._validators_bytes -= previous[3]
+        size = len(text.encode("utf-8"))
+        if size > self.validator_cache_bytes:
+            return
+        self._validators[url] = (etag, last_modified, text, size)
+        self._validators_bytes += size
+        while self._validators_bytes > self.validator_cache_bytes:
+            _, evicted = self._validators.popitem(last=False)
+            self._validators_bytes -= evicted[3]
 
     async def try_download_page(self, url: str) -> tuple[str, bool]:
         """Попытаться скачать HTML страницу.
@@ -55,14 +207,7 @@ class ScheduleDownloader:
 
         """
 
-        async with aiohttp.ClientSession() as client:
-            try:
-                response = await client.get(url, headers=self.headers)
-                if response.status == 200:
-                    return (await response.text(), True)
-                return ("", False)
-            except:
-                return ("", False)
+        return await self._get_text(url)
 
     async def try_get_request(self, api_url: str, header: dict, week_index: int) -> tuple[str, bool]:
         """Попытаться получить расписание с сервера БГТУ
@@ -84,15 +229,8 @@ class ScheduleDownloader:
 
         """
 
-        async with aiohttp.ClientSession() as client:
-            try:
-                response = await client.get(api_url 
+        return await self._get_text(api_url 
                                     + "?entity=" + header["entity"] 
                                     + "&id=" + header["id"]
                                     + "&week=" + str(week_index)
-                                    + "&device=" + header["device"], headers=self.headers) 
-                if response.status == 200:
-                    return (await response.text(), True)
-                return ("", False)
-            except:
-                return ("", False)
+                                    + "&device=" + header["device"])
@@ -0,0 +1,252 @@
+"""Модуль планировщика запросов
+
+Ограничивает нагрузку на сервер БГТУ во время обновления расписания:
+общий и похостовый лимит одновременных запросов, ограничение частоты
+запросов через token bucket, экспоненциальная задержка с джиттером между
+повторами и общий бюджет повторов на один цикл обновления.
+
+Общий лимит одновременных запросов адаптивный (AIMD): после каждого быстрого
+успешного ответа он плавно растет, а при ошибке или слишком долгом ответе
+уменьшается в несколько раз. Так пропускная способность держится на уровне,
+который выдерживает сервер.
+
+Example:
+    scheduler = FetchScheduler(max_concurrency=32, rate_per_sec=20)
+    scheduler.new_cycle()
+    html = await scheduler.run(url, lambda: downloader.try_download_page(url), name="Group header 1")
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable
+from urllib.parse import urlsplit
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов
+
+    Классический token bucket: токены копятся со скоростью rate в секунду,
+    но не больше capacity. Каждый запрос забирает один токен.
+
+    Attributes:
+        rate (float):
+            Скорость пополнения токенов в секунду (0 - без ограничения)
+        capacity (float):
+            Максимальное количество накопленных токенов (размер всплеска)
+
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """Конструктор
+
+        Args:
+            rate (float):
+                Скорость пополнения токенов в секунду (0 - без ограничения)
+            capacity (float):
+                Максимальное количество накопленных токенов (размер всплеска)
+
+        """
+
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Забрать один токен, при необходимости дождавшись его появления"""
+
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class FetchScheduler:
+    """Планировщик запросов к серверу расписания
+
+    Выполняет запросы с повторами, соблюдая лимиты одновременности и частоты.
+
+    Attributes:
+        max_concurrency (int):
+            Верхняя граница общего лимита одновременных запросов
+        min_concurrency (int):
+            Нижняя граница общего лимита одновременных запросов
+        per_host_concurrency (int):
+            Лимит одновременных запросов к одному хосту
+        max_attempts (int):
+            Количество попыток для одного запроса по умолчанию
+        retry_budget (int):
+            Количество повторов, доступное на один цикл обновления
+        backoff_base (float):
+            Базовая задержка перед повтором в секундах
+        backoff_max (float):
+            Максимальная задержка перед повтором в секундах
+        latency_threshold (float):
+            Время ответа в секундах, после которого ответ считается признаком перегрузки
+        decrease_factor (float):
+            Множитель уменьшения лимита при перегрузке
+        limit (float):
+            Текущий общий лимит одновременных запросов
+        stats (dict):
+            Счетчики запросов, повторов и неудач за текущий цикл
+
+    """
+
+    def __init__(self,
+                 max_concurrency: int = 32,
+                 min_concurrency: int = 1,
+                 per_host_concurrency: int = 16,
+                 rate_per_sec: float = 20.0,
+                 burst: int = 10,
+                 max_attempts: int = 8,
+                 retry_budget: int = 2000,
+                 backoff_base: float = 0.5,
+                 backoff_max: float = 30.0,
+                 latency_threshold: float = 5.0,
+                 decrease_factor: float = 0.5):
+        """Конструктор
+
+        Args:
+            max_concurrency (int):
+                Верхняя граница общего лимита одновременных запросов
+            min_concurrency (int):
+                Нижняя граница общего лимита одновременных запросов
+            per_host_concurrency (int):
+                Лимит одновременных запросов к одному хосту
+            rate_per_sec (float):
+                Максимальная частота запросов в секунду (0 - без ограничения)
+            burst (int):
+                Количество запросов, которое можно сделать разом после простоя
+            max_attempts (int):
+                Количество попыток для одного запроса по умолчанию
+            retry_budget (int):
+                Количество повторов, доступное на один цикл обновления
+            backoff_base (float):
+                Базовая задержка перед повтором в секундах
+            backoff_max (float):
+                Максимальная задержка перед повтором в секундах
+            latency_threshold (float):
+                Время ответа в секундах, после которого ответ считается признаком перегрузки
+            decrease_factor (float):
+                Множитель уменьшения лимита при перегрузке
+
+        """
+
+        self.max_concurrency = max(max_concurrency, 1)
+        self.min_concurrency = min(max(min_concurrency, 1), self.max_concurrency)
+        self.per_host_concurrency = max(per_host_concurrency, 1)
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_budget = retry_budget
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.latency_threshold = latency_threshold
+        self.decrease_factor = decrease_factor
+        self.limit = float(self.max_concurrency)
+        self.stats = dict(requests=0, retries=0, failures=0)
+        self._bucket = TokenBucket(rate_per_sec, burst)
+        self._retries_left = retry_budget
+        self._in_flight = 0
+        self._in_flight_per_host: dict[str, int] = dict()
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    def new_cycle(self):
+        """Начать новый цикл обновления
+
+        Восстанавливает бюджет повторов и обнуляет счетчики
+
+        """
+
+        self._retries_left = self.retry_budget
+        self.stats = dict(requests=0, retries=0, failures=0)
+
+    def _can_start(self, host: str) -> bool:
+        return (self._in_flight < int(self.limit)
+                and self._in_flight_per_host.get(host, 0) < self.per_host_concurrency)
+
+    async def _acquire(self, host: str):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._can_start(host))
+            self._in_flight += 1
+            self._in_flight_per_host[host] = self._in_flight_per_host.get(host, 0) + 1
+
+    async def _release(self, host: str, ok: bool, latency: float):
+        async with self._condition:
+            self._in_flight -= 1
+            self._in_flight_per_host[host] -= 1
+            if not self._in_flight_per_host[host]:
+                del self._in_flight_per_host[host]
+            if ok and latency < self.latency_threshold:
+                # Аддитивный рост: примерно +1 за каждое "окно" успешных запросов
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            else:
+                # Мультипликативное уменьшение, не чаще одного раза за время типичного ответа
+                now = time.monotonic()
+                if now - self._last_decrease >= min(latency, self.latency_threshold):
+                    self.limit = max(float(self.min_concurrency), self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            self._condition.notify_all()
+
+    def _backoff(self, attempt: int) -> float:
+        """Задержка перед повтором: экспонента с полным джиттером"""
+
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def run(self, url: str, fetch: Callable[[], Awaitable[tuple[Any, bool]]],
+                  name: str = "", attempts: int | None = None) -> Any:
+        """Выполнить запрос с соблюдением лимитов и повторами
+
+        Args:
+            url (str):
+                Адрес запроса, по нему определяется хост
+            fetch (Callable[[], Awaitable[tuple[Any, bool]]]):
+                Функция, делающая одну попытку запроса и возвращающая результат и флаг успеха
+            name (str):
+                Название запроса для логов
+            attempts (int | None):
+                Количество попыток, по умолчанию max_attempts
+
+        Returns:
+            Результат первой успешной попытки
+
+        Raises:
+            RuntimeError: Если попытки или бюджет повторов на цикл закончились
+
+        """
+
+        attempts = attempts or self.max_attempts
+        host = urlsplit(url).netloc
+        for attempt in range(attempts):
+            await self._bucket.acquire()
+            await self._acquire(host)
+            start = time.monotonic()
+            ok = False
+            try:
+                result, ok = await fetch()
+            finally:
+                await self._release(host, ok, time.monotonic() - start)
+            self.stats["requests"] += 1
+            if ok:
+                return result
+            if attempt >= attempts - 1:
+                break
+            if self._retries_left <= 0:
+                print(f"{name} error: retry budget for this cycle is exhausted")
+                break
+            self._retries_left -= 1
+            self.stats["retries"] += 1
+            delay = self._backoff(attempt)
+            print(f"{name} error, retrying in {delay:.2f} seconds...")
+            await asyncio.sleep(delay)
+        self.stats["failures"] += 1
+        print(f"{name} timeout: error occurred multiple times on requesting {url}")
+        raise RuntimeError(f"No internet connection or bad request {name} to {url}")
@@ -1,13 +1,28 @@
-from db_client import DBClient
+from db_client import DBClient, AsyncDBClient
 from download_html import ScheduleDownloader
 from parse_html import ScheduleParser
+from fetch_scheduler import FetchScheduler
+from parse_executor import ParseExecutor
+from pipeline import PipelineStage, run_pipeline
+from response_cache import ResponseCache, CachedResponse
+from schedule_slice import parse_slice, slice_key
+from name_index import TrigramIndex
+from room_index import RoomIndex
+from metrics import MetricsRegistry, metrics_middleware
+from profiling import Profiler, profiling_middleware
+from teacher_derivation import TeacherDeriver, url_entity_id
 import asyncio
+import hmac
+import random
 import time
 from os import environ as env
 import json
 from aiohttp import web
 import traceback
 from contextlib import suppress
+from functools import partial
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
 import aiohttp
 
 class ExitFromServiceException(Exception):
@@ -16,213 +31,381 @@ class ExitFromServiceException(Exception):
 class ScheduleService:
     def __init__(self):
         self.running = True
-        self.is_ready = False
         self.schedule_update_period = int(env.get("SERVICE_UPDATE_TIMER_SECS", 10800))
-        self.db_client = DBClient(env.get("DB_CONTAINER_NAME"), 27017, env.get("MONGODB_USERNAME", "foxrly"), env.get("MONGODB_PASSWORD", "1001"))
+        self.db_client = AsyncDBClient(DBClient(env.get("DB_CONTAINER_NAME"), 27017, env.get("MONGODB_USERNAME", "foxrly"), env.get("MONGODB_PASSWORD", "1001"),
+                                                write_batch_size=int(env.get("DB_WRITE_BATCH_SIZE", 100)),
+                                                normalized=env.get("DB_NORMALIZED_STORAGE", "0") == "1"),
+                                       max_workers=int(env.get("DB_MAX_WORKERS", 8)))
+        # Если в базе есть примененное расписание, отдаем его сразу, а обновление идет в фоне
+        self.is_ready = self.db_client.generation > 0
         agent = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:101.0) Gecko/20100101 Firefox/101.0'}
-        self.downloader = ScheduleDownloader(agent)
-        self.parser = ScheduleParser()
+        self.downloader = ScheduleDownloader(agent,
+                                             connection_limit=int(env.get("DOWNLOADER_CONNECTION_LIMIT", 100)),
+                                             connection_limit_per_host=int(env.get("DOWNLOADER_CONNECTION_LIMIT_PER_HOST", 20)),
+                                             keepalive_timeout=float(env.get("DOWNLOADER_KEEPALIVE_TIMEOUT_SECS", 60)),
+                                             dns_cache_ttl=int(env.get("DOWNLOADER_DNS_CACHE_TTL_SECS", 600)),
+                                             conditional_requests=env.get("DOWNLOADER_CONDITIONAL_REQUESTS", "1") == "1",
+                                             validator_cache_bytes=int(env.get("DOWNLOADER_VALIDATOR_CACHE_MB", 64)) * 1024 * 1024)
+        self.fetch_scheduler = FetchScheduler(max_concurrency=int(env.get("FETCH_MAX_CONCURRENCY", 32)),
+                                              min_concurrency=int(env.get("FETCH_MIN_CONCURRENCY", 1)),
+                                              per_host_concurrency=int(env.get("FETCH_PER_HOST_CONCURRENCY", 16)),
+                                              rate_per_sec=float(env.get("FETCH_RATE_PER_SEC", 20)),
+                                              burst=int(env.get("FETCH_BURST", 10)),
+                                              max_attempts=int(env.get("FETCH_MAX_ATTEMPTS", 8)),
+                                              retry_budget=int(env.get("FETCH_RETRY_BUDGET", 2000)),
+                                              backoff_base=float(env.get("FETCH_BACKOFF_BASE_SECS", 0.5)),
+                                              backoff_max=float(env.get("FETCH_BACKOFF_MAX_SECS", 30)),
+                                              latency_threshold=float(env.get("FETCH_LATENCY_THRESHOLD_SECS", 5)))
+        self.parser = ScheduleParser(env.get("PARSER_ENGINE", "lxml"))
+        self.parse_executor = ParseExecutor(self.parser,
+                                            workers=int(env.get("PARSE_WORKERS", 0)),
+                                            batch_size=int(env.get("PARSE_BATCH_SIZE", 16)))
+        self.pipeline_queue_size = int(env.get("PIPELINE_QUEUE_SIZE", 64))
+        self.pipeline_fetch_workers = int(env.get("PIPELINE_FETCH_WORKERS", 32))
+        # Обработчик стадии парсинга отдает в пул одну пачку за раз, поэтому обработчиков
+        # не меньше, чем процессов пула, иначе часть ядер простаивает
+        self.pipeline_parse_workers = max(int(env.get("PIPELINE_PARSE_WORKERS", 2)), self.parse_executor.workers)
+        self.db_write_batch_size = int(env.get("DB_WRITE_BATCH_SIZE", 100))
+        self.response_cache = ResponseCache(max_entries=int(env.get("RESPONSE_CACHE_MAX_ENTRIES", 4096)),
+                                            normalize_name=DBClient.normalize_name)
+        self.name_indexes = dict(teacher=TrigramIndex([]), group=TrigramIndex([]))
+        self.room_index = RoomIndex([])
+        self.search_max_limit = int(env.get("SEARCH_MAX_LIMIT", 50))
+        self.batch_max_names = int(env.get("BATCH_MAX_NAMES", 1000))
+        self.batch_fetch_size = int(env.get("BATCH_FETCH_SIZE", 50))
+        self.retired_buffer_drop_delay = float(env.get("DB_RETIRED_BUFFER_DROP_DELAY_SECS", 30))
+        self.background_tasks = set()
+        self.header_cache_revalidate_period = int(env.get("HEADER_CACHE_REVALIDATE_SECS", 604800))
+        # "Сегодня" в запросах считается по часовому поясу университета, а не контейнера (обычно UTC)
+        self.timezone = ZoneInfo(env.get("SERVICE_TIMEZONE", "Europe/Moscow"))
+        self.metrics = MetricsRegistry()
+        self.phase_seconds = self.metrics.histogram("schedule_update_phase_seconds",
+                                                    "Длительность фаз цикла обновления (для стадий конвейера - суммарное время обработчиков)",
+                                                    ("phase",), buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800))
+        self.upstream_seconds = self.metrics.histogram("upstream_request_seconds", "Время одной попытки запроса к серверу БГТУ",
+                                                       ("kind",), buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+        self.upstream_requests = self.metrics.counter("upstream_requests_total", "Попытки запросов к серверу БГТУ", ("kind", "result"))
+        self.upstream_retries = self.metrics.counter("upstream_retries_total", "Повторные попытки запросов к серверу БГТУ", ("kind",))
+        self.upstream_failures = self.metrics.counter("upstream_failures_total", "Запросы к серверу БГТУ, для которых закончились попытки", ("kind",))
+        # Расписания преподов можно собирать из расписаний групп: тогда у БГТУ API запрашиваются
+        # только преподы с неоднозначным кратким именем и случайная выборка для проверки
+        self.derive_teachers = env.get("DERIVE_TEACHER_SCHEDULES", "0") == "1"
+        self.derive_verify_sample = int(env.get("DERIVE_TEACHER_VERIFY_SAMPLE", 0))
+        self.response_cache_lookups = self.metrics.counter("response_cache_lookups_total", "Обращения к кэшу готовых ответов",
+                                                           ("endpoint", "result"))
+        self.derivation_checks = self.metrics.counter("teacher_derivation_checks_total",
+                                                      "Сравнения выведенных расписаний преподов со скачанными", ("result",))
+        self.profiler = Profiler(env.get("PROFILE_DIR", "profiles"), top=int(env.get("PROFILE_TOP", 30)),
+                                 frames=int(env.get("PROFILE_TRACEMALLOC_FRAMES", 1)))
+        # Сессии, взведенные при старте: следующий цикл обновления и/или первые N запросов
+        if env.get("PROFILE_NEXT_UPDATE", "0") == "1":
+            self.profiler.arm("update")
+        if (profile_requests := int(env.get("PROFILE_REQUESTS", 0))) > 0:
+            self.profiler.arm("requests", profile_requests)
+        # Без токена админский эндпоинт выключен
+        self.admin_token = env.get("PROFILE_ADMIN_TOKEN", "")
         print("Service successfully initialized")
 
 
     async def update_timer(self, timer_period=100, number_of_tests=None):
         while True:
             print("Update timer went up")
-            await self.update_schedule(test_number=number_of_tests)
+            await self._update_cycle(test_number=number_of_tests)
             await asyncio.sleep(timer_period)
+
+    async def _update_cycle(self, test_number=None):
+        # Упавший цикл не останавливает таймер: пользователи получают прошлое поколение, а следующий цикл начинается с чистого буфера
+        try:
+            async with self.profiler.session("update"):
+                await self.update_schedule(test_number=test_number)
+        except ExitFromServiceException:
+            raise
+        except Exception:
+            print(f"Schedule update failed, keeping generation {self.db_client.generation}: {traceback.format_exc()}")
+            await self.db_client.discard_updates()
     
 
-    async def _download_html_page(self, url: str, url_name: str, timeout: int) -> str:
-        html_page = ""
-        for i in range(timeout):
-            html_page, status = await self.downloader.try_download_page(url)
-            if not status and i >= timeout-1:
-                print(f"{url_name} download timeout: error occurred multiple times on downloading")
-                raise RuntimeError(f"No internet connection or bad {url_name} URL")
-            elif not status and i < timeout-1:
-                print(f"{url_name} download error, retrying...")
-                await asyncio.sleep(2)
-            else:
-                print(f"Successfully downloaded {url_name} page")
-                break
-        await asyncio.sleep(2)
+    async def _fetch(self, kind: str, url: str, fetch, name: str, attempts: int | None = None):
+        # Обертка над планировщиком, которая считает попытки, повторы, отказы и время каждой попытки
+        attempt_count = 0
+        async def timed_fetch():
+            nonlocal attempt_count
+            if attempt_count:
+                self.upstream_retries.inc(kind=kind)
+            attempt_count += 1
+            start = time.perf_counter()
+            result, ok = await fetch()
+            self.upstream_seconds.observe(time.perf_counter() - start, kind=kind)
+            self.upstream_requests.inc(kind=kind, result="ok" if ok else "error")
+            return result, ok
+        try:
+            return await self.fetch_scheduler.run(url, timed_fetch, name=name, attempts=attempts)
+        except RuntimeError:
+            self.upstream_failures.inc(kind=kind)
+            raise
+
+    async def _download_html_page(self, url: str, url_name: str, attempts: int | None = None) -> str:
+        html_page = await self._fetch("page", url, lambda: self.downloader.try_download_page(url),
+                                      name=f"{url_name} download", attempts=attempts)
+        print(f"Successfully downloaded {url_name} page")
         return html_page
 
-    async def _get_server_response(self, header: dict, week_indexes: list[int], timeout: int) -> list[dict]:
+    async def _get_server_response(self, header: dict, week_indexes: list[int], attempts: int | None = None) -> list[dict]:
+        api_url = env.get("SCHEDULE_API_URL", "https://t.bstu.ru/web/api/events")
         result = []
-        response = ""
         for week_index in week_indexes:
-            for i in range(timeout):
-                response, status = await self.downloader.try_get_request(env.get("SCHEDULE_API_URL", "https://t.bstu.ru/web/api/events"), header, week_index)
-                response = json.loads(response)
-                if (not status or not response["success"]) and i >= timeout-1:
-                    print(f"API request timeout: error occurred multiple times on requesting BSTU server")
-                    raise RuntimeError(f"No internet connection or bad API request with header {header}")
-                elif (not status or not response["success"]) and i < timeout-1:
-                    print(f"API request error, retrying...")
-                    await asyncio.sleep(2)
-                else:
-                    print("Successfully got response from BSTU server")
-                    break
-            await asyncio.sleep(2)
+            async def request_week(week_index=week_index) -> tuple[dict, bool]:
+                response, status = await self.downloader.try_get_request(api_url, header, week_index)
+                if not status:
+                    return (dict(), False)
+                try:
+                    response = json.loads(response)
+                except json.JSONDecodeError:
+                    return (dict(), False)
+                return (response, bool(response.get("success")))
+            response = await self._fetch("api", api_url, request_week,
+                                         name=f"API request with header {header}", attempts=attempts)
             result.append(response)
         return result
 
 
+    # Стадии конвейера обновления. Элемент конвейера - словарь с данными одного препода или группы:
+    # kind ("teachers" или "groups"), url, name, а дальше стадии дописывают в него свои результаты
+    async def _reuse_cached_headers(self, items: list[dict]):
+        # Известные и недавно проверенные адреса сразу идут к API без скачивания страницы заголовка
+        cached_headers = await self.db_client.get_cached_headers()
+        now = time.time()
+        for item in items:
+            cached = cached_headers.get(item["url"])
+            if cached and now - cached["checked_at"] < self.header_cache_revalidate_period:
+                item["header"] = cached["header"]
+                item["header_cached"] = True
+        print(f"Header cache: {sum('header' in item for item in items)} of {len(items)} headers reused")
+
+    @staticmethod
+    def _mark_failed(item: dict, error: Exception):
+        print(f"{item['name']} failed, keeping previous schedule: {error!r}")
+        item["failed"] = True
+
+    def _keep_previous_on_failure(self, stage):
+        # Если для сущности закончились попытки или БГТУ отдал неожиданные данные, цикл не прерывается:
+        # элемент помечается failed и дальше переносится из текущего буфера как неизменившийся
+        async def run(item: dict) -> dict:
+            if item.get("failed"):
+                return item
+            try:
+                return await stage(item)
+            except Exception as error:
+                self._mark_failed(item, error)
+                return item
+        return run
+
+    async def _fetch_header_stage(self, item: dict) -> dict:
+        if "header" not in item:
+            item["header_html"] = await self._download_html_page(item["url"], item["name"])
+        return item
+
+    async def _parse_header_stage(self, items: list[dict]) -> list[dict]:
+        # Заголовки из кэша уже есть, парсим только скачанные страницы
+        fetched = [item for item in items if "header" not in item and not item.get("failed")]
+        headers = await self.parse_executor.get_schedule_headers([item.pop("header_html") for item in fetched],
+                                                                 return_exceptions=True)
+        for item, header in zip(fetched, headers):
+            if isinstance(header, Exception):
+                self._mark_failed(item, header)
+            else:
+                item["header"] = header
+        await self.db_client.update_cached_headers({item["url"]: item["header"] for item in fetched if not item.get("failed")})
+        return items
+
+    async def _fetch_weeks_stage(self, item: dict) -> dict:
+        try:
+            weeks = await self._get_server_response(item["header"], range(2))
+        except RuntimeError:
+            if not item.pop("header_cached", False):
+                raise
+            # Заголовок из кэша мог устареть: перекачиваем страницу и пробуем еще раз
+            print(f"{item['name']}: cached header failed, revalidating")
+            del item["header"]
+            await self._parse_header_stage([await self._fetch_header_stage(item)])
+            if item.get("failed"):
+                return item
+            weeks = await self._get_server_response(item["header"], range(2))
+        schedule_html = dict(html=[], is_denominator=[])
+        for week in weeks:
+            schedule_html["html"].append(week["result"]["html"]["week"])
+            schedule_html["is_denominator"].append(week["result"]["week"]["is_denominator"])
+        item["schedule_html"] = schedule_html
+        return item
+
+    async def _parse_schedule_stage(self, fingerprints: dict[str, dict[str, str]], items: list[dict]) -> list[dict]:
+        # Расписания с неизменившимся отпечатком не парсим, а переносим из текущего буфера
+        changed = []
+        for item in items:
+            if item.get("failed"):
+                item["entity_id"] = url_entity_id(item["url"])
+                item["schedule"] = None
+                continue
+            header, schedule_html = item["header"], item.pop("schedule_html")
+            item["entity_id"] = f"{header['entity']}:{header['id']}"
+            item["schedule"] = None
+            try:
+                item["fingerprint"] = self.parser.get_fingerprint(schedule_html["html"], header, schedule_html["is_denominator"])
+            except Exception as error:
+                self._mark_failed(item, error)
+                continue
+            # Выборку для проверки выведенных расписаний парсим всегда, ее сравнивают после записи групп
+            if item.get("verify") or fingerprints[item["kind"]].get(item["entity_id"]) != item["fingerprint"]:
+                changed.append((item, (schedule_html["html"], header, schedule_html["is_denominator"])))
+        schedules = await self.parse_executor.parse_full_many([arguments for _, arguments in changed], return_exceptions=True)
+        for (item, _), schedule in zip(changed, schedules):
+            if isinstance(schedule, Exception):
+                self._mark_failed(item, schedule)
+                continue
+            schedule["entity_id"] = item["entity_id"]
+            schedule["fingerprint"] = item["fingerprint"]
+            item["schedule"] = schedule
+        return items
+
+    async def _write_stage(self, verified: list[dict], items: list[dict]) -> list[dict]:
+        for kind, carry_forward, add in (("teachers", self.db_client.carry_teachers_forward, self.db_client.add_teachers),
+                                         ("groups", self.db_client.carry_groups_forward, self.db_client.add_groups)):
+            await carry_forward([item["entity_id"] for item in items if item["kind"] == kind and item["schedule"] is None])
+            await add([item["schedule"] for item in items if item["kind"] == kind and item["schedule"] is not None])
+        # Записанное расписание больше не нужно: в памяти остаются только легкие элементы,
+        # а целиком до конца цикла живет лишь выборка для проверки выведенных преподов
+        for item in items:
+            item.pop("header", None)
+            if item.get("verify") and item["schedule"] is not None:
+                verified.append(item)
+            else:
+                del item["schedule"]
+        return items
+
     async def update_schedule(self, test_number=None):
+        self.fetch_scheduler.new_cycle()
+        cycle_start = time.perf_counter()
 
         # 1) Скачать списки преподов и групп
-        # Список преподов в виде html
-        teacher_list_html = await self._download_html_page(env.get("SCHEDULE_TEACHER_LIST_URL", "https://t.bstu.ru/raspisaniya/prepodavateli"), "Teacher", 3)
+        with self.phase_seconds.time(phase="list fetch"):
+            # Список преподов в виде html
+            teacher_list_html = await self._download_html_page(env.get("SCHEDULE_TEACHER_LIST_URL", "https://t.bstu.ru/raspisaniya/prepodavateli"), "Teacher", 3)
 
 
-        # Список групп в виде html
-        group_list_html = await self._download_html_page(env.get("SCHEDULE_GROUP_LIST_URL", "https://t.bstu.ru/raspisaniya/gruppy"), "Group", 3)
+            # Список групп в виде html
+            group_list_html = await self._download_html_page(env.get("SCHEDULE_GROUP_LIST_URL", "https://t.bstu.ru/raspisaniya/gruppy"), "Group", 3)
 
 
         # 2) Спарсить все ссылки преподов и групп из скачанных списков
-        # Ссылки на преподов
-        teacher_urls = self.parser.get_teacher_urls(teacher_list_html, env.get("SCHEDULE_BASE_URL", "https://t.bstu.ru"))
+        # Ссылки на преподов вместе с полными именами
+        teacher_links = self.parser.get_teacher_links(teacher_list_html, env.get("SCHEDULE_BASE_URL", "https://t.bstu.ru"))
         # Ссылки на группы
         group_urls = self.parser.get_group_urls(group_list_html, env.get("SCHEDULE_BASE_URL", "https://t.bstu.ru"))
         if test_number is not None:
-            teacher_urls = teacher_urls[0:test_number]
+            teacher_links = teacher_links[0:test_number]
             group_urls = group_urls[0:test_number]
-
-
-        # 3) Скачать все заголовки расписаний преподов и групп с помощью предыдущих ссылок
-        # Заголовки перподов
-
-        #teacher_headers_html = []
-        #for index, teacher_url in enumerate(teacher_urls):
-        #    header_html = await self._download_html_page(teacher_url, f"Teacher header {index})", 3)
-        #    teacher_headers_html.append(header_html)
-
-        tasks = [asyncio.create_task(self._download_html_page(teacher_url, f"Teacher header {index}", 1000)) for index, teacher_url in enumerate(teacher_urls)]
-        await asyncio.gather(*tasks)
-        teacher_headers_html = [task.result() for task in tasks]
-
-        # Заголовки групп
-        #group_headers_html = []
-        #for index, group_url in enumerate(group_urls):
-        #    header_html = await self._download_html_page(group_url, f"Group header {index}", 3)
-        #    group_headers_html.append(header_html)
-        
-        tasks = [asyncio.create_task(self._download_html_page(group_url, f"Group header {index}", 1000)) for index, group_url in enumerate(group_urls)]
-        await asyncio.gather(*tasks)
-        group_headers_html = [task.result() for task in tasks]
-
-
-        # 4) Спарсить заголовки расписаний преподов и групп
-        # Нормальные заголовки преподов
-        print("Started processing teacher headers...")
-        start = time.perf_counter()
-        teacher_headers = []
-        for header_html in teacher_headers_html:
-            header = self.parser.get_schedule_header(header_html)
-            teacher_headers.append(header)
-            await asyncio.sleep(0.001)
-        end = time.perf_counter() - start
-        print(f"Processed teacher headers in {end} seconds")
-        # Нормальные заголовки групп
-        print("Started processing group headers...")
-        start = time.perf_counter()
-        group_headers = []
-        for header_html in group_headers_html:
-            header = self.parser.get_schedule_header(header_html)
-            group_headers.append(header)
-            await asyncio.sleep(0.001)
-        end = time.perf_counter() - start
-        print(f"Processed group headers in {end} seconds")
-
-
-        # 5) По заголовкам скачать расписания преподов и групп
-        # Скачиваем и форматируем расписания преподов
-
-        tasks = []
-        for header in teacher_headers:
-            tasks.append(asyncio.create_task(self._get_server_response(header, range(2), 1000)))
-        await asyncio.gather(*tasks)
-        json_responses = [task.result() for task in tasks]
-        teacher_schedules_html = []
-        for json_response in json_responses:
-            schedule_html = dict(html=[], is_denominator=[])
-            for week in json_response:
-                schedule_html["html"].append(week["result"]["html"]["week"])
-                schedule_html["is_denominator"].append(week["result"]["week"]["is_denominator"])
-            await asyncio.sleep(0.001)
-            teacher_schedules_html.append(schedule_html)
-
-
-        #teacher_schedules_html = []
-        #for number, header in enumerate(teacher_headers):
-        #    print(f"Teacher {number}")
-        #    schedule_html = dict(html=[], is_denominator=[])
-        #    for week_index in range(2):
-        #        json_response = await self._get_server_response(header, week_index, 1000)
-        #        response = json.loads(json_response)
-        #        if not response["success"]:
-        #            raise RuntimeError(f"Bad request with header {header}")
-        #        schedule_html["html"].append(response["result"]["html"]["week"])
-        #        schedule_html["is_denominator"].append(response["result"]["week"]["is_denominator"])
-        #    teacher_schedules_html.append(schedule_html)
-        # Скачиваем и форматируем расписания групп
-        
-        tasks = []
-        for header in group_headers:
-            tasks.append(asyncio.create_task(self._get_server_response(header, range(2), 1000)))
-        await asyncio.gather(*tasks)
-        json_responses = [task.result() for task in tasks]
-        group_schedules_html = []
-        for json_response in json_responses:
-            schedule_html = dict(html=[], is_denominator=[])
-            for week in json_response:
-                schedule_html["html"].append(week["result"]["html"]["week"])
-                schedule_html["is_denominator"].append(week["result"]["week"]["is_denominator"])
-            await asyncio.sleep(0.001)
-            group_schedules_html.append(schedule_html)
-
-        #group_schedules_html = []
-        #for number, header in enumerate(group_headers):
-        #    print(f"Group {number}")
-        #    schedule_html = dict(html=[], is_denominator=[])
-        #    for week_index in range(2):
-        #        json_response = await self._get_server_response(header, week_index, 1000)
-        #        response = json.loads(json_response)
-        #        if not response["success"]:
-        #            raise RuntimeError(f"Bad request with header {header}")
-        #        schedule_html["html"].append(response["result"]["html"]["week"])
-        #        schedule_html["is_denominator"].append(response["result"]["week"]["is_denominator"])
-        #    group_schedules_html.append(schedule_html)
-                
-
-        # 6) Спарсить расписания преподов и групп в Python-объекты
-        teacher_schedules = []
-        for header, schedule_html in zip(teacher_headers, teacher_schedules_html):
-            schedule = self.parser.parse_full(schedule_html["html"], header, schedule_html["is_denominator"])
-            teacher_schedules.append(schedule)
-            await asyncio.sleep(0.001)
-        group_schedules = []
-        for header, schedule_html in zip(group_headers, group_schedules_html):
-            schedule = self.parser.parse_full(schedule_html["html"], header, schedule_html["is_denominator"])
-            group_schedules.append(schedule)
-            await asyncio.sleep(0.001)
-
-
-        # 7) Запихнуть раписания в базу данных
-        await asyncio.sleep(0.001)
-        self.db_client.update_teachers_many(teacher_schedules)
-        await asyncio.sleep(0.001)
-        self.db_client.update_groups_many(group_schedules)
-        # 8) Применить изменения базы
-        self.is_ready = False
-        await asyncio.sleep(0.001)
-        self.db_client.commit_updates()
-        await asyncio.sleep(0.001)
+        teacher_urls = [teacher["url"] for teacher in teacher_links]
+        deriver, verify_urls = None, set()
+        if self.derive_teachers:
+            deriver = TeacherDeriver(teacher_links)
+            derivable = [teacher["url"] for teacher in deriver.teachers.values()]
+            verify_urls = set(random.sample(derivable, min(self.derive_verify_sample, len(derivable))))
+            fetch_urls = {teacher["url"] for teacher in deriver.ambiguous} | verify_urls
+            teacher_urls = [url for url in teacher_urls if url in fetch_urls]
+            print(f"Teacher derivation: {len(derivable)} teachers derived from groups, {len(deriver.ambiguous)} ambiguous "
+                  f"and {len(verify_urls)} sampled for verification are fetched")
+
+
+        # 3-7) Потоковый конвейер для каждого препода и группы:
+        # скачать заголовок -> спарсить заголовок -> скачать недели через API -> спарсить расписание -> записать в базу
+        fingerprints = dict(teachers=await self.db_client.get_teacher_fingerprints(),
+                            groups=await self.db_client.get_group_fingerprints())
+        items = [dict(kind="teachers", url=url, name=f"Teacher header {index}", verify=url in verify_urls)
+                 for index, url in enumerate(teacher_urls)]
+        items += [dict(kind="groups", url=url, name=f"Group header {index}") for index, url in enumerate(group_urls)]
+        verified = []
+        if self.header_cache_revalidate_period > 0:
+            await self._reuse_cached_headers(items)
+        stages = [PipelineStage("header fetch", self._keep_previous_on_failure(self._fetch_header_stage),
+                                workers=self.pipeline_fetch_workers),
+                  PipelineStage("header parse", self._parse_header_stage, workers=self.pipeline_parse_workers,
+                                batch_size=self.parse_executor.batch_size),
+                  PipelineStage("api fetch", self._keep_previous_on_failure(self._fetch_weeks_stage),
+                                workers=self.pipeline_fetch_workers),
+                  PipelineStage("schedule parse", partial(self._parse_schedule_stage, fingerprints),
+                                workers=self.pipeline_parse_workers, batch_size=self.parse_executor.batch_size),
+                  PipelineStage("db write", partial(self._write_stage, verified), batch_size=self.db_write_batch_size)]
+        stats = await run_pipeline(items, stages, queue_size=self.pipeline_queue_size)
+        # Дописываем остаток очереди записи, это тоже часть стадии записи
+        flush_start = time.perf_counter()
+        await self.db_client.flush_writes()
+        stats["db write"]["busy_seconds"] += time.perf_counter() - flush_start
+        for name, stage_stats in stats.items():
+            print(f"Stage {name}: {stage_stats['processed']} items, busy {stage_stats['busy_seconds']:.2f} seconds")
+            self.phase_seconds.observe(stage_stats["busy_seconds"], phase=name)
+        if failed := sum(bool(item.get("failed")) for item in items):
+            print(f"{failed} schedules failed to download, previous versions are kept")
+        if (first_write := stats["db write"]["first_output"]) is not None:
+            print(f"First schedules written after {first_write:.2f} seconds")
+        if write_stats := self.db_client.write_stats:
+            print(f"Bulk writes: {len(write_stats)} batches, {sum(batch['documents'] for batch in write_stats)} documents, "
+                  f"slowest batch {max(batch['seconds'] for batch in write_stats):.3f} seconds")
+        if deriver is not None:
+            with self.phase_seconds.time(phase="teacher derive"):
+                await self._derive_teacher_schedules(deriver, verified)
+        with self.phase_seconds.time(phase="room index"):
+            rooms = await self.db_client.build_room_index()
+        print(f"Room index: {rooms} rooms")
+
+
+        # 8) Применить изменения базы: переключение указателя, от объема данных не зависит
+        with self.phase_seconds.time(phase="commit"):
+            await self.db_client.commit_updates()
+        self.response_cache.invalidate(self.db_client.generation)
         self.is_ready = True
+        await self._rebuild_indexes()
+        # Старое поколение удаляем в фоне, когда начатые запросы к нему уже завершились
+        self.background_tasks.add(task := asyncio.create_task(self._drop_retired_buffers()))
+        task.add_done_callback(self.background_tasks.discard)
+        cycle_seconds = time.perf_counter() - cycle_start
+        self.phase_seconds.observe(cycle_seconds, phase="cycle")
+        print(f"Schedule updated in {cycle_seconds:.2f} seconds")
         
 
+    async def _derive_teacher_schedules(self, deriver: TeacherDeriver, verified: list[dict]):
+        # Группы уже записаны в следующий буфер, выводим из них преподов и дописываем туда же
+        group_documents = await self.db_client.get_next_group_documents()
+        schedules = await asyncio.get_running_loop().run_in_executor(None, deriver.derive, group_documents)
+        # Проверенные преподы уже записаны в скачанном виде, выведенное расписание только сравниваем
+        for item in verified:
+            derived = schedules.pop(item["url"])
+            problems = TeacherDeriver.compare(derived, item["schedule"])
+            self.derivation_checks.inc(result="mismatch" if problems else "match")
+            if problems:
+                print(f"Derived schedule of {derived['table_name']} differs from fetched in {len(problems)} places:")
+                for problem in problems[:5]:
+                    print(f"    {problem}")
+        await self.db_client.add_teachers(list(schedules.values()))
+        await self.db_client.flush_writes()
+        print(f"Derived {len(schedules)} teacher schedules, {len(deriver.unknown_names)} teacher names from groups "
+              f"are not in the teacher list")
+
+    async def _drop_retired_buffers(self):
+        await asyncio.sleep(self.retired_buffer_drop_delay)
+        await self.db_client.drop_retired_buffers()
+
+    async def _rebuild_indexes(self):
+        teacher_names = json.loads(await self.db_client.get_teacher_list())["teacher_names"]
+        group_names = json.loads(await self.db_client.get_group_list())["group_names"]
+        room_documents = await self.db_client.get_room_documents()
+        room_calendar = await self.db_client.get_room_calendar()
+        # Новые индексы подменяют старые целиком, поиск никогда не видит полупостроенный индекс
+        self.name_indexes = dict(teacher=TrigramIndex(teacher_names), group=TrigramIndex(group_names))
+        self.room_index = RoomIndex(room_documents, room_calendar)
+
     async def run(self):
+        if self.is_ready:
+            await self._rebuild_indexes()
         tasks = [self.update_timer(timer_period=self.schedule_update_period)]
         for index in range(len(tasks)):
             tasks[index] = asyncio.create_task(tasks[index])
@@ -236,6 +419,8 @@ class ScheduleService:
         finally:
             for task in tasks:
                 task.cancel()
+            # Дожидаемся отмены, чтобы конвейер обновления остановился до закрытия сессии загрузчика
+            await asyncio.gather(*tasks, return_exceptions=True)
 
     async def run_test(self):
         tasks = [self.update_timer(timer_period=150, number_of_tests=5)]
@@ -251,6 +436,8 @@ class ScheduleService:
         finally:
             for task in tasks:
                 task.cancel()
+            # Дожидаемся отмены, чтобы конвейер обновления остановился до закрытия сессии загрузчика
+            await asyncio.gather(*tasks, return_exceptions=True)
 
     async def run_corutine(self, _app):
        task = asyncio.create_task(self.run())
@@ -259,47 +446,212 @@ class ScheduleService:
        with suppress(asyncio.CancelledError):
            await task
 
+    async def _cached_response(self, request: web.BaseRequest, endpoint: str, name: str, query) -> web.Response:
+        # Поколение читаем до запроса в базу: ответ, собранный во время переключения
+        # буферов, окажется помечен старым поколением и не будет отдан после него
+        generation = self.db_client.generation
+        committed_at = self.db_client.committed_at
+        response = self.response_cache.get(endpoint, name, generation)
+        # В метке только путь: параметры среза и режима поиска размножили бы ряды
+        self.response_cache_lookups.inc(endpoint=endpoint.partition("?")[0], result="miss" if response is None else "hit")
+        if response is None:
+            response = CachedResponse((await query()).encode("utf-8"), generation, committed_at)
+            self.response_cache.put(endpoint, name, generation, response)
+        encoding = response.negotiate(request.headers.get("Accept-Encoding", ""))
+        headers = {"ETag": response.etag(encoding), "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+        if response.last_modified:
+            headers["Last-Modified"] = response.last_modified
+        if response.not_modified(request.headers.get("If-None-Match"), request.headers.get("If-Modified-Since")):
+            return web.Response(status=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return web.Response(status=200, body=response.variant(encoding), headers=headers,
+                            content_type="text/json", charset="utf-8")
+
+    async def _find_schedule(self, name_type: str, get_schedule, name: str, match: str, schedule_slice: dict) -> str:
+        # В режиме auto база ищет только по индексу (точно и по началу имени). Если не нашлось,
+        # подстроку ищем по именам из триграммного индекса в памяти, а не $regex по всей коллекции,
+        # и берем первое подходящее имя в порядке name_key, как это делал поиск в базе
+        if (schedule := await get_schedule(name, match, **schedule_slice)) or match != "auto":
+            return schedule
+        name_key = DBClient.normalize_name(name)
+        candidates = [DBClient.normalize_name(candidate) for candidate in self.name_indexes[name_type].containing(name)]
+        if not (matched := [candidate for candidate in candidates if name_key in candidate]):
+            return schedule
+        return await get_schedule(min(matched), "exact", **schedule_slice)
+
+    def _today(self) -> date:
+        return datetime.now(self.timezone).date()
+
+    def _schedule_slice(self, query) -> dict:
+        try:
+            return parse_slice(query, self._today())
+        except ValueError as error:
+            raise web.HTTPBadRequest(reason="Bad request", text=str(error))
+
     async def teacher_list_handler(self, request):
         if not self.is_ready:
             raise web.HTTPNoContent(reason="Updating schedules, try again later")
-        teacher_list_json = self.db_client.get_teacher_list()
-        return web.Response(status=200,text=teacher_list_json, content_type="text/json")
+        return await self._cached_response(request, "/teacher/list", "", self.db_client.get_teacher_list)
     
     async def teacher_schedule_full_handler(self, request):
         if not self.is_ready:
             raise web.HTTPNoContent(reason="Updating schedules, try again later")
         query = request.query
-        if teacher_name := query.get("name"):
-            teacher_schedule = self.db_client.get_teacher_schedule_full(teacher_name)
-            return web.Response(status=200, text=teacher_schedule, content_type="text/json")
+        match = query.get("match", "auto")
+        if (teacher_name := query.get("name")) and match in DBClient.match_modes:
+            schedule_slice = self._schedule_slice(query)
+            return await self._cached_response(request, f"/teacher/schedule?match={match}&{slice_key(schedule_slice)}", teacher_name,
+                                               partial(self._find_schedule, "teacher", self.db_client.get_teacher_schedule_full,
+                                                       teacher_name, match, schedule_slice))
         raise web.HTTPBadRequest(reason="Bad request")
 
     async def group_list_handler(self, request):
         if not self.is_ready:
             raise web.HTTPNoContent(reason="Updating schedules, try again later")
-        group_list_json = self.db_client.get_group_list()
-        return web.Response(status=200,text=group_list_json, content_type="text/json")
+        return await self._cached_response(request, "/group/list", "", self.db_client.get_group_list)
 
     async def group_schedule_full_handler(self, request: web.BaseRequest):
         if not self.is_ready:
             raise web.HTTPNoContent(reason="Updating schedules, try again later")
         query = request.query
-        if group_name := query.get("name"):
-            group_schedule = self.db_client.get_group_schedule_full(group_name)
-            return web.Response(status=200, text=group_schedule, content_type="text/json")
+        match = query.get("match", "auto")
+        if (group_name := query.get("name")) and match in DBClient.match_modes:
+            schedule_slice = self._schedule_slice(query)
+            return await self._cached_response(request, f"/group/schedule?match={match}&{slice_key(schedule_slice)}", group_name,
+                                               partial(self._find_schedule, "group", self.db_client.get_group_schedule_full,
+                                                       group_name, match, schedule_slice))
         raise web.HTTPBadRequest(reason="Bad request")
 
+    async def batch_schedule_handler(self, request: web.BaseRequest):
+        if not self.is_ready:
+            raise web.HTTPNoContent(reason="Updating schedules, try again later")
+        try:
+            payload = await request.json()
+        except ValueError:
+            raise web.HTTPBadRequest(reason="Bad request")
+        if not isinstance(payload, dict):
+            raise web.HTTPBadRequest(reason="Bad request")
+        names = dict(groups=payload.get("groups", []), teachers=payload.get("teachers", []))
+        if (not all(isinstance(kind_names, list) and all(isinstance(name, str) for name in kind_names) for kind_names in names.values())
+                or sum(map(len, names.values())) > self.batch_max_names):
+            raise web.HTTPBadRequest(reason="Bad request")
+        schedule_slice = self._schedule_slice(request.query)
+
+        # Строки NDJSON отправляются по мере чтения курсора, поэтому в памяти лежит не больше одной пачки
+        response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson; charset=utf-8"})
+        await response.prepare(request)
+        for kind, name_type in (("groups", "group"), ("teachers", "teacher")):
+            requested = dict()
+            for name in names[kind]:
+                requested.setdefault(DBClient.normalize_name(name), []).append(name)
+            if not requested:
+                continue
+            cursor = await self.db_client.find_schedules(kind, list(requested), schedule_slice)
+            try:
+                while batch := await self.db_client.fetch_batch(cursor, self.batch_fetch_size):
+                    lines = []
+                    for document in batch:
+                        # Из документов с одинаковым именем берется первый по entity_id, как в /group/schedule
+                        for name in requested.pop(document.pop("name_key"), []):
+                            lines.append(json.dumps(dict(type=name_type, name=name, schedule=document)))
+                    if lines:
+                        await response.write(("\n".join(lines) + "\n").encode("utf-8"))
+            finally:
+                await self.db_client.close_cursor(cursor)
+            lines = [json.dumps(dict(type=name_type, name=name, schedule=None))
+                     for kind_names in requested.values() for name in kind_names]
+            if lines:
+                await response.write(("\n".join(lines) + "\n").encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    async def room_schedule_handler(self, request: web.BaseRequest):
+        if not self.is_ready:
+            raise web.HTTPNoContent(reason="Updating schedules, try again later")
+        query = request.query
+        schedule_slice = self._schedule_slice(query)
+        if not (room := query.get("name")) or "week" in schedule_slice or "day" in schedule_slice:
+            raise web.HTTPBadRequest(reason="Bad request")
+        if (occupancy := self.room_index.occupancy(room, schedule_slice.get("dates"))) is None:
+            return web.Response(status=200, body=b"", content_type="text/json", charset="utf-8")
+        name, slots = occupancy
+        return web.json_response(dict(room=name, slots=slots), content_type="text/json")
+
+    async def room_free_handler(self, request: web.BaseRequest):
+        if not self.is_ready:
+            raise web.HTTPNoContent(reason="Updating schedules, try again later")
+        query = request.query
+        if not (number := query.get("number")) or not number.isdigit():
+            raise web.HTTPBadRequest(reason="Bad request")
+        slot_date = self._schedule_slice(dict(date=query.get("date", "today")))["dates"][0]
+        if (free_rooms := self.room_index.free_rooms(slot_date, number)) is None:
+            raise web.HTTPNotFound(reason="No schedules for this date and pair number")
+        return web.json_response(dict(date=slot_date, number=number, free_rooms=free_rooms), content_type="text/json")
+
+    async def metrics_handler(self, request: web.BaseRequest):
+        return web.Response(body=self.metrics.render().encode("utf-8"),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def profile_handler(self, request: web.BaseRequest):
+        if not self.admin_token:
+            raise web.HTTPNotFound()
+        # Сравнение за постоянное время, чтобы токен нельзя было подобрать по времени ответа.
+        # Байты, а не строки: compare_digest не принимает строки с не-ASCII символами
+        if not hmac.compare_digest(request.headers.get("X-Admin-Token", "").encode("utf-8"), self.admin_token.encode("utf-8")):
+            raise web.HTTPForbidden(reason="Forbidden")
+        # POST взводит сессию, GET отдает состояние и сводку последней сессии
+        if request.method == "POST":
+            query = request.query
+            try:
+                self.profiler.arm(query.get("target", "update"), int(query.get("count", 1)))
+            except ValueError as error:
+                raise web.HTTPBadRequest(reason="Bad request", text=str(error))
+        return web.json_response(self.profiler.status(), content_type="text/json")
+
+    async def search_handler(self, request: web.BaseRequest):
+        if not self.is_ready:
+            raise web.HTTPNoContent(reason="Updating schedules, try again later")
+        query = request.query
+        search_type = query.get("type", "all")
+        if not (text := query.get("q")) or search_type not in ("teacher", "group", "all"):
+            raise web.HTTPBadRequest(reason="Bad request")
+        try:
+            limit = min(int(query.get("limit", 10)), self.search_max_limit)
+        except ValueError:
+            raise web.HTTPBadRequest(reason="Bad request")
+        if limit < 1:
+            raise web.HTTPBadRequest(reason="Bad request")
+        indexes = self.name_indexes
+        results = []
+        for name_type, index in indexes.items():
+            if search_type in (name_type, "all"):
+                results += [dict(name=name, type=name_type, score=score) for name, score in index.search(text, limit)]
+        results.sort(key=lambda result: -result["score"])
+        return web.json_response(dict(results=results[:limit]), content_type="text/json")
+
 
 if __name__ == "__main__":
     # Инициализируем сервис
     service = ScheduleService()
     
-    # Инициализируем сервер
-    app = web.Application()
+    # Инициализируем сервер, время и коды ответов считаются для /metrics,
+    # запросы к самому эндпоинту профилирования не профилируются
+    app = web.Application(middlewares=[metrics_middleware(service.metrics),
+                                       profiling_middleware(service.profiler, exclude=("/admin/profile",))])
     
     # Пихаем сервис в сервер
     app["state"] = {"service": service}
     
+    # Открываем сессию загрузчика (закроется после остановки сервиса)
+    app.cleanup_ctx.append(service.downloader.session_context)
+
+    # Запускаем пул процессов для парсинга
+    app.cleanup_ctx.append(service.parse_executor.executor_context)
+
+    # Останавливаем пул потоков базы данных после остановки сервиса
+    app.cleanup_ctx.append(service.db_client.executor_context)
+
     # Запускаем сервис
     app.cleanup_ctx.append(service.run_corutine)
 
@@ -307,6 +659,13 @@ if __name__ == "__main__":
     app.add_routes([web.get("/teacher/list", service.teacher_list_handler),
                     web.get("/teacher/schedule", service.teacher_schedule_full_handler),
                     web.get("/group/list", service.group_list_handler),
-                    web.get("/group/schedule", service.group_schedule_full_handler)])
+                    web.get("/group/schedule", service.group_schedule_full_handler),
+                    web.get("/search", service.search_handler),
+                    web.post("/batch/schedule", service.batch_schedule_handler),
+                    web.get("/room/schedule", service.room_schedule_handler),
+                    web.get("/room/free", service.room_free_handler),
+                    web.get("/metrics", service.metrics_handler),
+                    web.get("/admin/profile", service.profile_handler),
+                    web.post("/admin/profile", service.profile_handler)])
     # Стартуем сервер
     web.run_app(app)
@@ -0,0 +1,211 @@
+"""Модуль метрик
+
+Минимальная реестровая реализация метрик в текстовом формате Prometheus:
+счетчики и гистограммы с метками, а также middleware aiohttp, которое
+считает время и коды ответов по маршрутам. Зависимостей кроме aiohttp нет.
+
+Метки маршрутов берутся из шаблона роута, а не из фактического пути, поэтому
+количество рядов не растет от параметров запросов.
+
+Example:
+    registry = MetricsRegistry()
+    phases = registry.histogram("schedule_update_phase_seconds", "Длительность фаз обновления", ("phase",))
+    with phases.time(phase="list fetch"):
+        await download_lists()
+    app = web.Application(middlewares=[metrics_middleware(registry)])
+    text = registry.render()
+"""
+
+import time
+from contextlib import contextmanager
+from aiohttp import web
+
+# Границы корзин гистограмм по умолчанию, в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.type_name}"]
+        return "\n".join(lines + self._samples())
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = dict()
+
+    def inc(self, amount: float = 1.0, **labels):
+        """Увеличить счетчик с заданными метками"""
+
+        if amount < 0:
+            raise ValueError("Счетчик не может уменьшаться")
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(value)}"
+                for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._counts: dict[tuple[str, ...], list[int]] = dict()
+        self._sums: dict[tuple[str, ...], float] = dict()
+
+    def observe(self, value: float, **labels):
+        """Добавить наблюдение с заданными метками"""
+
+        key = self._key(labels)
+        counts = self._counts.setdefault(key, [0] * len(self.buckets))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        self._sums[key] = self._sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels):
+        """Замерить время выполнения блока, даже если он завершился исключением"""
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def sum(self, **labels) -> float:
+        return self._sums.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_number(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(self._sums[key])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Реестр метрик сервиса
+
+    Метрики с одинаковым именем регистрируются один раз: повторная регистрация
+    возвращает уже существующую метрику того же типа.
+
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = dict()
+
+    def _register(self, metric_type: type, name: str, *args, **kwargs):
+        if (metric := self._metrics.get(name)) is not None:
+            if not isinstance(metric, metric_type):
+                raise ValueError(f"Метрика {name} уже зарегистрирована с другим типом")
+            return metric
+        metric = self._metrics[name] = metric_type(name, *args, **kwargs)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        """Зарегистрировать счетчик"""
+
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        """Зарегистрировать гистограмму"""
+
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+def metrics_middleware(registry: MetricsRegistry):
+    """Middleware aiohttp, считающее время и коды ответов по маршрутам
+
+    Args:
+        registry (MetricsRegistry):
+            Реестр, в котором регистрируются метрики запросов
+
+    Returns:
+        Middleware для web.Application(middlewares=[...])
+
+    """
+
+    latency = registry.histogram("http_request_duration_seconds", "Время обработки HTTP запросов", ("route", "method"))
+    responses = registry.counter("http_responses_total", "Количество HTTP ответов", ("route", "method", "status"))
+
+    @web.middleware
+    async def middleware(request: web.Request, handler):
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else "unmatched"
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            return response
+        except web.HTTPException as error:
+            status = error.status
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start, route=route, method=request.method)
+            responses.inc(route=route, method=request.method, status=status)
+
+    return middleware
@@ -0,0 +1,156 @@
+"""Модуль поискового индекса имен
+
+Триграммный индекс для подсказок по именам преподов и групп. Терпим к опечаткам
+и неполному вводу: имя и запрос разбиваются на тройки символов, кандидаты
+ранжируются по коэффициенту Дайса между наборами троек, а совпадение начала
+имени с запросом дает дополнительный вес.
+
+Чтобы поиск занимал микросекунды даже при частых тройках, кандидаты отбираются
+только по редким тройкам запроса (частые, вроде начала "  г", есть почти у всех
+имен и ничего не различают), плюс имена, начинающиеся с запроса (их диапазон
+находится бинарным поиском по отсортированным ключам). Оценка кандидатов при этом
+считается точно, по всем тройкам.
+
+Для поиска по подстроке (containing) кандидаты берутся из пересечения списков
+имен по тройкам запроса без отступов: подстрока имени содержит все свои тройки.
+Короткие запросы без троек проверяются перебором ключей в памяти.
+
+Индекс неизменяемый: при обновлении расписания строится новый индекс и
+заменяет старый одной операцией присваивания.
+
+Example:
+    index = TrigramIndex(["ИТ-221", "ИТ-222", "ПВ-221"])
+    index.search("ит221", limit=2)
+    # [("ИТ-221", 1.5), ("ИТ-222", 0.6667)]
+"""
+
+from bisect import bisect_left
+from collections import Counter
+
+
+class TrigramIndex:
+    """Триграммный индекс имен
+
+    Attributes:
+        names (list[str]):
+            Проиндексированные имена в исходном виде
+
+    """
+
+    # Вес совпадения начала имени с запросом
+    _prefix_bonus = 0.5
+
+    # Сколько кандидатов на один результат оценивается полностью
+    _candidates_per_result = 10
+
+    # Доля имен, начиная с которой тройка считается частой и не используется для отбора кандидатов
+    _common_trigram_share = 0.2
+
+    def __init__(self, names: list[str]):
+        """Конструктор
+
+        Args:
+            names (list[str]):
+                Имена для индексации
+
+        """
+
+        self.names = list(dict.fromkeys(names))
+        self._keys = [self.normalize(name) for name in self.names]
+        self._name_trigrams: list[frozenset[str]] = []
+        self._postings: dict[str, list[int]] = dict()
+        for name_id, key in enumerate(self._keys):
+            trigrams = frozenset(self._trigrams(key))
+            self._name_trigrams.append(trigrams)
+            for trigram in trigrams:
+                self._postings.setdefault(trigram, []).append(name_id)
+        self._sorted_keys = sorted((key, name_id) for name_id, key in enumerate(self._keys))
+        self._common_limit = max(int(len(self.names) * self._common_trigram_share), 10)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Нормализовать текст: нижний регистр, без знаков препинания, схлопнутые пробелы
+
+        Знаки препинания удаляются, а не заменяются пробелом, чтобы "ИТ-221" и "ит221" совпадали
+
+        """
+
+        text = "".join(char for char in text.casefold() if char.isalnum() or char.isspace())
+        return " ".join(text.split())
+
+    @staticmethod
+    def _trigrams(key: str) -> set[str]:
+        """Тройки символов с отступами, чтобы начало слова весило больше"""
+
+        padded = f"  {key} "
+        return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[str, float]]:
+        """Найти имена, похожие на запрос
+
+        Args:
+            query (str):
+                Запрос пользователя, может быть неполным или с опечатками
+            limit (int):
+                Максимальное количество результатов
+
+        Returns:
+            Список пар (имя, оценка) по убыванию оценки
+
+        """
+
+        query_key = self.normalize(query)
+        if not query_key or limit <= 0:
+            return []
+        query_trigrams = self._trigrams(query_key)
+        postings = [self._postings[trigram] for trigram in query_trigrams if trigram in self._postings]
+        selective = [posting for posting in postings if len(posting) <= self._common_limit] or postings
+        overlaps = Counter()
+        for posting in selective:
+            overlaps.update(posting)
+        candidates_limit = limit * self._candidates_per_result
+        candidates = {name_id for name_id, _ in overlaps.most_common(candidates_limit)}
+        position = bisect_left(self._sorted_keys, (query_key, -1))
+        for key, name_id in self._sorted_keys[position:position + candidates_limit]:
+            if not key.startswith(query_key):
+                break
+            candidates.add(name_id)
+        scored = []
+        for name_id in candidates:
+            name_trigrams = self._name_trigrams[name_id]
+            score = 2 * len(query_trigrams & name_trigrams) / (len(query_trigrams) + len(name_trigrams))
+            if self._keys[name_id].startswith(query_key):
+                score += self._prefix_bonus
+            scored.append((-score, len(self._keys[name_id]), self.names[name_id], score))
+        scored.sort()
+        return [(name, round(score, 4)) for _, _, name, score in scored[:limit]]
+
+    def containing(self, query: str) -> list[str]:
+        """Найти имена, в которых запрос встречается целиком
+
+        Сравнение идет по нормализованным ключам индекса (без знаков препинания),
+        поэтому результат - кандидаты: вызывающий код может проверить их своим правилом сравнения.
+
+        Args:
+            query (str):
+                Часть имени
+
+        Returns:
+            Имена в порядке нормализованных ключей
+
+        """
+
+        query_key = self.normalize(query)
+        trigrams = {query_key[index:index + 3] for index in range(len(query_key) - 2)}
+        if any(trigram not in self._postings for trigram in trigrams):
+            return []
+        if trigrams:
+            postings = sorted((self._postings[trigram] for trigram in trigrams), key=len)
+            name_ids = set(postings[0]).intersection(*postings[1:])
+        else:
+            name_ids = range(len(self.names))
+        return [self.names[name_id] for key, name_id in self._sorted_keys
+                if name_id in name_ids and query_key in key]
@@ -0,0 +1,146 @@
+"""Модуль исполнителя парсинга
+
+Выносит парсинг заголовков и расписаний из цикла событий в пул процессов,
+чтобы HTTP обработчики не простаивали во время обновления и парсинг
+использовал все ядра. Задачи отправляются в пул пачками, чтобы расходы на
+pickle делились на много страниц.
+
+Если количество процессов равно 0, парсинг выполняется в текущем процессе
+так же, как раньше: по одной странице с передачей управления циклу событий.
+
+Example:
+    executor = ParseExecutor(ScheduleParser(), workers=4, batch_size=16)
+    await executor.start()
+    headers = await executor.get_schedule_headers(headers_html)
+    schedules = await executor.parse_full_many([(schedule_html, header, is_denominator)])
+    await executor.close()
+"""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+
+def _call(function, arguments: tuple, return_exceptions: bool):
+    try:
+        return function(*arguments)
+    except Exception as error:
+        if not return_exceptions:
+            raise
+        return error
+
+
+def _get_schedule_headers_batch(parser, headers_html: list[str], return_exceptions: bool = False) -> list[dict]:
+    return [_call(parser.get_schedule_header, (header_html,), return_exceptions) for header_html in headers_html]
+
+
+def _parse_full_batch(parser, items: list[tuple[list[str], dict, list[bool]]], return_exceptions: bool = False) -> list[dict]:
+    return [_call(parser.parse_full, arguments, return_exceptions) for arguments in items]
+
+
+class ParseExecutor:
+    """Исполнитель парсинга
+
+    Attributes:
+        parser (ScheduleParser):
+            Парсер, который выполняет работу. Передается в процессы пула через pickle
+        workers (int):
+            Количество процессов пула (0 - парсинг в текущем процессе)
+        batch_size (int):
+            Количество страниц в одной задаче пула
+
+    """
+
+    def __init__(self, parser, workers: int = 0, batch_size: int = 16):
+        """Конструктор
+
+        Args:
+            parser (ScheduleParser):
+                Парсер, который выполняет работу
+            workers (int):
+                Количество процессов пула (0 - парсинг в текущем процессе)
+            batch_size (int):
+                Количество страниц в одной задаче пула
+
+        """
+
+        self.parser = parser
+        self.workers = max(workers, 0)
+        self.batch_size = max(batch_size, 1)
+        self._pool: ProcessPoolExecutor | None = None
+
+    async def start(self):
+        """Запустить пул процессов, если он нужен и еще не запущен"""
+
+        if self.workers and self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    async def close(self):
+        """Остановить пул процессов"""
+
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
+
+    async def executor_context(self, _app):
+        """Контекст жизни пула для app.cleanup_ctx"""
+
+        await self.start()
+        yield
+        await self.close()
+
+    async def _map(self, batch_function, items: list, return_exceptions: bool = False) -> list[Any]:
+        """Применить пакетную функцию ко всем элементам с сохранением порядка
+
+        При return_exceptions ошибка на одной странице не роняет всю пачку,
+        а возвращается на месте результата этой страницы
+        """
+
+        if not items:
+            return []
+        if not self.workers:
+            result = []
+            for item in items:
+                result.extend(batch_function(self.parser, [item], return_exceptions))
+                await asyncio.sleep(0)
+            return result
+        await self.start()
+        loop = asyncio.get_running_loop()
+        batches = [items[index:index + self.batch_size] for index in range(0, len(items), self.batch_size)]
+        futures = [loop.run_in_executor(self._pool, batch_function, self.parser, batch, return_exceptions) for batch in batches]
+        result = []
+        for batch_result in await asyncio.gather(*futures):
+            result.extend(batch_result)
+        return result
+
+    async def get_schedule_headers(self, headers_html: list[str], return_exceptions: bool = False) -> list[dict]:
+        """Спарсить заголовки расписаний
+
+        Args:
+            headers_html (list[str]):
+                HTML-страницы преподов или групп
+            return_exceptions (bool):
+                Возвращать исключение на месте заголовка страницы, которую не удалось спарсить
+
+        Returns:
+            Заголовки для БГТУ API в том же порядке
+
+        """
+
+        return await self._map(_get_schedule_headers_batch, headers_html, return_exceptions)
+
+    async def parse_full_many(self, items: list[tuple[list[str], dict, list[bool]]], return_exceptions: bool = False) -> list[dict]:
+        """Спарсить несколько расписаний
+
+        Args:
+            items (list[tuple[list[str], dict, list[bool]]]):
+                Аргументы parse_full для каждого расписания: HTML недель, заголовок и флаги знаменателя
+            return_exceptions (bool):
+                Возвращать исключение на месте расписания, которое не удалось спарсить
+
+        Returns:
+            Результаты parse_full в том же порядке
+
+        """
+
+        return await self._map(_parse_full_batch, items, return_exceptions)
@@ -10,20 +10,77 @@
     4) Из каждого расписания выуживаем заголовок: имя препода/название группы, entity, id и strategy
     5) По заголовку делаем GET запрос на сервер и получаем расписание на эту и следующую неделю
     6) Парсим полученные расписания в json
+
+Парсер поддерживает два движка, которые дают одинаковый результат:
+    "bs4"  - построение полного дерева BeautifulSoup (исходный вариант)
+    "lxml" - прямой разбор через lxml.html с XPath, а заголовок страницы
+             извлекается потоковым парсером с остановкой сразу после нахождения
+             нужных элементов
 """
 
 from bs4 import BeautifulSoup
+from lxml import etree
+import lxml.html
+import hashlib
 import json
 import re
-import itertools
 
 class ScheduleParser:
     """Класс парсера расписания
 
     Парсит списки преподов и групп, создает заголовки для API запросов и парсит расписания
 
+    Attributes:
+        engine (str):
+            Движок парсинга: "bs4" или "lxml"
+        fingerprint_version (int):
+            Версия формата результата парсинга. Входит в отпечаток расписания,
+            поэтому ее нужно увеличивать при любом изменении результата parse_full
+
     """
 
+    fingerprint_version = 1
+    engines = ("bs4", "lxml")
+
+    # Размер куска, которым потоковый парсер читает страницу заголовка
+    _header_chunk_size = 16384
+
+    # Шаблоны токенов расписания, компилируются один раз при загрузке модуля
+    _cab_pattern = re.compile(r"(Г?УК\d?[ *[a-zA-Z0-9а-яА-Я_\(\)]*]*)|(КБ[ *[a-zA-Z0-9а-яА-Я_]*]*)|([К|к]афедра[\s*ТМН]*)|(ЦВТ[ *[a-zA-Z0-9а-яА-Я_]*]*)|([_|Баз\.]*[К|к]аф\.?[ *[a-zA-Z0-9а-яА-Я_\.]*]*)|(Дист\.)|(Ск\. маст\.)|(УТК)")
+    _teacher_pattern = re.compile(r"[a-zA-Zа-яА-я]* [a-zA-Zа-яА-я\.]*")
+    _group_pattern = re.compile(r"[а-яА-яa-zA-Z]*-\d*")
+
+    # Словарь перевода сокращенного названия дня в нормальное
+    _day_map = {"Пн": "Понедельник", "Вт": "Вторник",
+                "Ср": "Среда", "Чт": "Четверг",
+                "Пт": "Пятница", "Сб": "Суббота",
+                "Вс": "Воскресенье"}
+
+    def __init__(self, engine: str = "bs4"):
+        """Конструктор
+
+        Args:
+            engine (str):
+                Движок парсинга: "bs4" или "lxml"
+
+        """
+
+        if engine not in self.engines:
+            raise ValueError(f"Неизвестный движок парсинга: {engine}. Доступны: {', '.join(self.engines)}")
+        self.engine = engine
+
+    @staticmethod
+    def _class_xpath(tag: str, class_name: str) -> str:
+        """XPath для элементов, у которых среди классов есть class_name (как в BeautifulSoup)"""
+
+        return f"//{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]"
+
+    def _find_urls_lxml(self, list_html: str, class_name: str) -> list:
+        if not list_html.strip():
+            return []
+        document = lxml.html.document_fromstring(list_html)
+        return document.xpath(self._class_xpath("a", class_name))
+
     def get_group_urls(self, list_html: str, base_url: str) -> list[str]:
         """Получить ссылки на все группы из страницы списка групп
         
@@ -40,9 +97,13 @@ class ScheduleParser:
 
         """
 
+        group_urls: list[str] = []
+        if self.engine == "lxml":
+            for group_url_raw in self._find_urls_lxml(list_html, "group__item"):
+                group_urls.append(base_url+group_url_raw.attrib["href"])
+            return group_urls
         soup = BeautifulSoup(list_html, "lxml")
         group_urls_raw = soup.find_all("a", {"class": "group__item"})
-        group_urls: list[str] = []
         for group_url_raw in group_urls_raw:
             group_urls.append(base_url+group_url_raw["href"])
         return group_urls
@@ -63,15 +124,36 @@ class ScheduleParser:
 
         """
 
-        soup = BeautifulSoup(list_html, "lxml")
-        cab_regexp = r"(Г?УК\d?[ *[a-zA-Z0-9а-яА-Я_\(\)]*]*)|(КБ[ *[a-zA-Z0-9а-яА-Я_]*]*)|([К|к]афедра[\s*ТМН]*)|(ЦВТ[ *[a-zA-Z0-9а-яА-Я_]*]*)|([_|Баз\.]*[К|к]аф\.?[ *[a-zA-Z0-9а-яА-Я_\.]*]*)|(Дист\.)|(Ск\. маст\.)|(УТК)"
-        teacher_urls_raw = soup.find_all("a", {"class": "teachers__item"})
-        teacher_urls: list[str] = []
-        for teacher_url_raw in teacher_urls_raw:
-            if not re.search(cab_regexp ,teacher_url_raw.text.strip()):
-                print(teacher_url_raw.text.strip())
-                teacher_urls.append(base_url + teacher_url_raw["href"])
-        return teacher_urls
+        return [teacher["url"] for teacher in self.get_teacher_links(list_html, base_url)]
+
+    def get_teacher_links(self, list_html: str, base_url: str) -> list[dict]:
+        """Получить ссылки на всех преподов вместе с их полными именами
+
+        Ссылки на аудитории, которые тоже лежат в списке преподов, пропускаются
+
+        Args:
+            list_html (str):
+                HTML-страница со списком ссылок на преподов
+            base_url (str):
+                Базовый URL для доавления к ссылкам на преподов до полноценной ссылки
+
+        Returns:
+            Возвращает список словарей {"url": полный URL, "name": имя препода из текста ссылки}
+
+        """
+
+        if self.engine == "lxml":
+            links = [(link.text_content().strip(), link.attrib["href"])
+                     for link in self._find_urls_lxml(list_html, "teachers__item")]
+        else:
+            soup = BeautifulSoup(list_html, "lxml")
+            links = [(link.text.strip(), link["href"]) for link in soup.find_all("a", {"class": "teachers__item"})]
+        teachers: list[dict] = []
+        for name, href in links:
+            if not self._cab_pattern.search(name):
+                print(name)
+                teachers.append(dict(url=base_url + href, name=name))
+        return teachers
    
     def get_schedule_header(self, schedule_html: str) -> dict:
         """Получить заголовок расписания со страницы расписания для БГТУ API
@@ -87,6 +169,8 @@ class ScheduleParser:
 
         """
 
+        if self.engine == "lxml":
+            return self._get_schedule_header_lxml(schedule_html)
         header = dict()
         soup = BeautifulSoup(schedule_html, "lxml")
         header["table_name"] = soup.find("h1", {"class": "title"}).text.strip()
@@ -95,6 +179,44 @@ class ScheduleParser:
         header["device"] = data["data-strategy"]
         header["id"] = data["data-id"]
         return header
+
+    def _get_schedule_header_lxml(self, schedule_html: str) -> dict:
+        """Получить заголовок расписания потоковым парсером lxml
+
+        Страница читается кусками, разбор останавливается, как только найдены
+        заголовок h1.title и div с данными для API. Остаток страницы не разбирается.
+
+        Args:
+            schedule_html (str):
+                HTML-страница с нужными данными для создания заголовка запроса
+
+        Returns:
+            Возвращает заголовок для запроса к БГТУ API
+
+        """
+
+        title = None
+        data = None
+        pull_parser = etree.HTMLPullParser(events=("start", "end"))
+        for offset in range(0, len(schedule_html), self._header_chunk_size):
+            pull_parser.feed(schedule_html[offset:offset + self._header_chunk_size])
+            for event, element in pull_parser.read_events():
+                if (title is None and event == "end" and element.tag == "h1"
+                        and "title" in element.get("class", "").split()):
+                    title = element.xpath("string()").strip()
+                elif (data is None and event == "start" and element.tag == "div"
+                        and element.get("class") == "_timetable_page offset"):
+                    data = dict(element.attrib)
+            if title is not None and data is not None:
+                break
+        if title is None or data is None:
+            raise ValueError("На странице расписания нет заголовка или данных для API")
+        header = dict()
+        header["table_name"] = title
+        header["entity"] = data["data-entity"]
+        header["device"] = data["data-strategy"]
+        header["id"] = data["data-id"]
+        return header
     
     def _parse_html_to_raw_data(self, html_text: str, header: dict, is_denominator: bool) -> list[list[str]]:
         """Спарсить данные с полученного через заголовок расписания в заготовку
@@ -114,14 +236,20 @@ class ScheduleParser:
             Возвращает грубую обработку данных для дальнейшего парсинга
 
         """
-        soup = BeautifulSoup(html_text, "lxml")
         table_name = header["table_name"]
         week_status = "Знаменатель" if is_denominator else "Числитель"
-        days = soup.find_all("div", {"class": "week__day"})
+        if self.engine == "lxml":
+            days_text = []
+            if html_text.strip():
+                document = lxml.html.document_fromstring(html_text)
+                days_text = [day.text_content() for day in document.xpath(self._class_xpath("div", "week__day"))]
+        else:
+            soup = BeautifulSoup(html_text, "lxml")
+            days_text = [day.text for day in soup.find_all("div", {"class": "week__day"})]
         parsed_days: list[list[str]] = []
         parsed_days.append([table_name, week_status])
-        for day in days:
-            day_data: list[str] = list(map(str.strip, day.text.split("\n")))
+        for day_text in days_text:
+            day_data: list[str] = list(map(str.strip, day_text.split("\n")))
             day_data = list(filter(lambda x: x != "" and x != "\n", day_data))
             parsed_days.append(day_data)
         return parsed_days
@@ -141,65 +269,81 @@ class ScheduleParser:
 
         """
 
-        cab_regexp = r"(Г?УК\d?[ *[a-zA-Z0-9а-яА-Я_\(\)]*]*)|(КБ[ *[a-zA-Z0-9а-яА-Я_]*]*)|([К|к]афедра[\s*ТМН]*)|(ЦВТ[ *[a-zA-Z0-9а-яА-Я_]*]*)|([_|Баз\.]*[К|к]аф\.?[ *[a-zA-Z0-9а-яА-Я_\.]*]*)|(Дист\.)|(Ск\. маст\.)|(УТК)"
-        teacher_regexp = r"[a-zA-Zа-яА-я]* [a-zA-Zа-яА-я\.]*"
-        group_regexp = r"[а-яА-яa-zA-Z]*-\d*"
-
         # Заголовок дня
-        header = raw_data.pop(0)
+        header = raw_data[0]
         
         # Тип расписания (Препод или Группа)
-        schedule_type = {"type": "", "regexp": ""}
-        if re.search(group_regexp, header[0]):          # Группа
-            schedule_type["type"] = "teacher"
-            schedule_type["regexp"] = teacher_regexp
+        if self._group_pattern.search(header[0]):       # Группа
+            person_key, person_pattern = "teacher", self._teacher_pattern
         else:                                           # Препод
-            schedule_type["type"] = "group"
-            schedule_type["regexp"] = group_regexp
+            person_key, person_pattern = "group", self._group_pattern
 
         schedule = dict(week_status=header[1], day=[])
-        for day in raw_data:
-            # Словарь перевода сокращенного названия дня в нормальное
-            day_map = {"Пн": "Понедельник", "Вт": "Вторник",
-                       "Ср": "Среда", "Чт": "Четверг",
-                       "Пт": "Пятница", "Сб": "Суббота",
-                       "Вс": "Воскресенье"}
-            
+        for day in raw_data[1:]:
             # Инфа о дне в расписании
-            day_dict = dict(day_of_week=day_map[day[0]], date=day[1], subjects=[])
-            day.pop(0)
-            day.pop(0)
-            day_iter = iter(day)
-            while (entry := next(day_iter, None)) is not None:
-                if entry == "Нет занятий":
-                    break
-                elif entry == "Перерыв":
-                    day_dict["subjects"].append({"name": "Перерыв 1 час"})
-                    next(day_iter, None)
-                else:
-                    subj_dict = dict()
-                    subj_dict["number"] = entry                 # Номер пары
-                    subj_dict["type"] = next(day_iter, None)    # Тип пары
-                    subj_dict["name"] = next(day_iter, None)    # Название предмета
-                    subj_dict["start"] = next(day_iter, None)   # Время начала пары
-                    next(day_iter, None)                        # Черта
-                    subj_dict["end"] = next(day_iter, None)     # Время конца пары
-
-                    # Если нашли аудитории, то вписываем их
-                    subj_dict["classroom"] = []
-                    while (entry := next(day_iter, None)) and (cab := re.match(cab_regexp, entry)):
-                        subj_dict["classroom"].append(str(cab.group(0)))
-                    day_iter = itertools.chain([entry], day_iter)
-
-                    # Если нашли учителей, то вписываем их
-                    subj_dict[schedule_type["type"]] = []
-                    while (entry := next(day_iter, None)) and re.search(schedule_type["regexp"], entry):
-                        subj_dict[schedule_type["type"]].append(entry)
-                    day_iter = itertools.chain([entry], day_iter)
-                    day_dict["subjects"].append(subj_dict)
+            day_dict = dict(day_of_week=self._day_map[day[0]], date=day[1],
+                            subjects=self._parse_day_tokens(day, person_key, person_pattern))
             schedule["day"].append(day_dict)
         return schedule
 
+    def _parse_day_tokens(self, day: list[str], person_key: str, person_pattern: re.Pattern) -> list[dict]:
+        """Разобрать токены одного дня в список пар
+
+        Один проход по токенам с заглядыванием на один токен вперед. Токены дня,
+        начиная с третьего, разбираются по грамматике:
+            "Нет занятий"                  - конец дня
+            "Перерыв" <время>              - перерыв
+            <номер> <тип> <название> <начало> <черта> <конец> <аудитория>* <препод|группа>*
+
+        Args:
+            day (list[str]):
+                Токены дня: сокращенное название дня, дата и далее пары
+            person_key (str):
+                Ключ для списка людей в паре: "teacher" или "group"
+            person_pattern (re.Pattern):
+                Шаблон, по которому токен распознается как препод или группа
+
+        Returns:
+            Возвращает список пар дня
+
+        """
+
+        subjects = []
+        count = len(day)
+        position = 2
+        while position < count:
+            entry = day[position]
+            if entry == "Нет занятий":
+                break
+            if entry == "Перерыв":
+                subjects.append({"name": "Перерыв 1 час"})
+                position += 2
+                continue
+            # Поля пары стоят на фиксированных смещениях, токена черты между временами пропускаем
+            fields = day[position + 1:position + 6]
+            fields += [None] * (5 - len(fields))
+            subj_dict = dict()
+            subj_dict["number"] = entry                 # Номер пары
+            subj_dict["type"] = fields[0]               # Тип пары
+            subj_dict["name"] = fields[1]               # Название предмета
+            subj_dict["start"] = fields[2]              # Время начала пары
+            subj_dict["end"] = fields[4]                # Время конца пары
+            position += 6
+
+            # Если нашли аудитории, то вписываем их
+            subj_dict["classroom"] = []
+            while position < count and (cab := self._cab_pattern.match(day[position])):
+                subj_dict["classroom"].append(cab.group(0))
+                position += 1
+
+            # Если нашли учителей, то вписываем их
+            subj_dict[person_key] = []
+            while position < count and person_pattern.search(day[position]):
+                subj_dict[person_key].append(day[position])
+                position += 1
+            subjects.append(subj_dict)
+        return subjects
+
     def _parse(self, html_text: str, header: dict, is_denominator: bool) -> dict:
         """Объединение функций грубой обработки расписания и переработки в словарь
 
@@ -221,6 +365,29 @@ class ScheduleParser:
 
         return self._parse_raw_data_to_dict(self._parse_html_to_raw_data(html_text, header, is_denominator))
     
+    def get_fingerprint(self, html_text: list[str], header: dict, is_denominator: list[bool]) -> str:
+        """Получить отпечаток исходных данных расписания
+
+        Отпечаток зависит только от входа parse_full, поэтому совпадение отпечатков
+        означает, что результат парсинга тоже совпадет и парсить заново не нужно.
+
+        Args:
+            html_text (list[str]):
+                Список HTML-страниц с расписаниями на несколько недель
+            header (dict):
+                Заголовок с именем препода или группы
+            is_denominator (list[bool]):
+                Список флагов знаменателя
+
+        Returns:
+            Возвращает hex-строку SHA-256
+
+        """
+
+        payload = json.dumps([self.fingerprint_version, header["table_name"], html_text, is_denominator],
+                             ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
     # Полный парсинг расписания из GET запросов в Python объект, готовый к вставке в базу данных
     def parse_full(self, html_text: list[str], header: dict, is_denominator: list[bool]) -> dict:
         """Полный парсинг нескольких расписаний с результатом, готовым к вставке в базу данных
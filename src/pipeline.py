@@ -0,0 +1,154 @@
+"""Модуль потокового конвейера
+
+Простой конвейер на asyncio очередях: элементы проходят через цепочку стадий,
+у каждой стадии свое количество обработчиков, а между стадиями стоят очереди
+ограниченного размера. Если следующая стадия не успевает, предыдущая ждет
+места в очереди, поэтому в памяти одновременно находится не больше элементов,
+чем помещается в очереди и обработчики, независимо от общего количества.
+
+Стадия может обрабатывать элементы по одному или пачками. Пачка собирается
+из того, что уже лежит в очереди, без ожидания, поэтому задержка не растет.
+
+Example:
+    stages = [PipelineStage("fetch", fetch_item, workers=16),
+              PipelineStage("parse", parse_items, workers=2, batch_size=8),
+              PipelineStage("write", write_items, batch_size=100)]
+    stats = await run_pipeline(urls, stages, queue_size=64)
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Iterable
+
+# Маркер конца потока элементов
+_DONE = object()
+
+
+class PipelineStage:
+    """Стадия конвейера
+
+    Attributes:
+        name (str):
+            Название стадии для логов и статистики
+        function (Callable):
+            Обработчик. При batch_size == 0 принимает один элемент и возвращает
+            результат или None (элемент отбрасывается). При batch_size > 0 принимает
+            список элементов и возвращает список результатов
+        workers (int):
+            Количество одновременно работающих обработчиков
+        batch_size (int):
+            Максимальный размер пачки (0 - обработка по одному)
+
+    """
+
+    def __init__(self, name: str, function: Callable[[Any], Awaitable[Any]], workers: int = 1, batch_size: int = 0):
+        """Конструктор
+
+        Args:
+            name (str):
+                Название стадии для логов и статистики
+            function (Callable):
+                Обработчик элемента или пачки элементов
+            workers (int):
+                Количество одновременно работающих обработчиков
+            batch_size (int):
+                Максимальный размер пачки (0 - обработка по одному)
+
+        """
+
+        self.name = name
+        self.function = function
+        self.workers = max(workers, 1)
+        self.batch_size = max(batch_size, 0)
+
+
+async def _run_stage(stage: PipelineStage, inbox: asyncio.Queue, outbox: asyncio.Queue | None, stats: dict):
+    async def worker():
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                # Возвращаем маркер, чтобы его увидели остальные обработчики стадии
+                inbox.put_nowait(_DONE)
+                return
+            start = time.perf_counter()
+            if stage.batch_size:
+                batch = [item]
+                while len(batch) < stage.batch_size and not inbox.empty():
+                    item = inbox.get_nowait()
+                    if item is _DONE:
+                        inbox.put_nowait(_DONE)
+                        break
+                    batch.append(item)
+                results = await stage.function(batch)
+                stats["processed"] += len(batch)
+            else:
+                result = await stage.function(item)
+                results = [result]
+                stats["processed"] += 1
+            stats["busy_seconds"] += time.perf_counter() - start
+            for result in results:
+                if result is None:
+                    continue
+                if stats["first_output"] is None:
+                    stats["first_output"] = time.perf_counter()
+                if outbox is not None:
+                    await outbox.put(result)
+
+    # Обработчики - отдельные задачи: если стадия падает или ее отменяют, они отменяются
+    # вместе с ней, а не продолжают ходить на сервер после завершения конвейера
+    workers = [asyncio.create_task(worker()) for _ in range(stage.workers)]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        raise
+    if outbox is not None:
+        await outbox.put(_DONE)
+
+
+async def run_pipeline(items: Iterable[Any], stages: list[PipelineStage], queue_size: int = 64) -> dict[str, dict]:
+    """Прогнать элементы через конвейер
+
+    Если любая стадия падает с исключением, остальные стадии и все их
+    обработчики отменяются и дожидаются, а исключение пробрасывается дальше.
+
+    Args:
+        items (Iterable[Any]):
+            Входные элементы первой стадии
+        stages (list[PipelineStage]):
+            Стадии в порядке прохождения
+        queue_size (int):
+            Размер очереди перед каждой стадией
+
+    Returns:
+        Статистика по стадиям: количество обработанных элементов, время работы
+        обработчиков и время от старта конвейера до первого результата стадии
+
+    """
+
+    started = time.perf_counter()
+    queues = [asyncio.Queue(maxsize=max(queue_size, 1)) for _ in stages]
+    stats = {stage.name: dict(processed=0, busy_seconds=0.0, first_output=None) for stage in stages}
+
+    async def feed():
+        for item in items:
+            await queues[0].put(item)
+        await queues[0].put(_DONE)
+
+    tasks = [asyncio.create_task(feed())]
+    for index, stage in enumerate(stages):
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        tasks.append(asyncio.create_task(_run_stage(stage, queues[index], outbox, stats[stage.name])))
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    for stage_stats in stats.values():
+        if stage_stats["first_output"] is not None:
+            stage_stats["first_output"] -= started
+    return stats
@@ -0,0 +1,210 @@
+"""Модуль профилирования по запросу
+
+Профилировщик оборачивает в cProfile и tracemalloc либо следующий цикл
+обновления, либо следующие N HTTP запросов. Сессию заранее "взводят"
+(переменной окружения при старте или через админский эндпоинт), и она
+запускается, когда до нее дойдет очередь. После сессии в каталог пишутся
+файл pstats и снимок аллокаций tracemalloc, а краткая сводка хранится в
+памяти: топ функций по времени с вложенными вызовами (cumulative), топ по
+собственному времени (total, в нем видны горячие места, а не цикл событий)
+и топ строк по выделенной памяти.
+
+Файлы пишутся и сводка считается в потоке, чтобы не останавливать цикл
+событий. Ошибки сохранения только печатаются: профилирование не должно
+ломать ни цикл обновления, ни ответ на запрос. Если каталог недоступен для
+записи, сводка все равно сохраняется, но без путей к файлам.
+
+cProfile видит весь код потока цикла событий, поэтому во время сессии
+попадают и сопрограммы, выполнявшиеся параллельно с профилируемой. Парсинг
+в процессах пула (PARSE_WORKERS > 0) в профиль не попадает, для профиля
+парсера сервис запускают с PARSE_WORKERS=0.
+
+Файлы открываются стандартными средствами:
+    python -m pstats profiles/update-20261016-120000-1.pstats
+    tracemalloc.Snapshot.load("profiles/update-20261016-120000-1.tracemalloc")
+
+Example:
+    profiler = Profiler("profiles", top=30)
+    profiler.arm("update")
+    async with profiler.session("update"):
+        await update_schedule()
+    summary = profiler.last_summary
+"""
+
+import asyncio
+import cProfile
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import asynccontextmanager
+from aiohttp import web
+
+TARGETS = ("update", "requests")
+
+
+class Profiler:
+    """Профилировщик циклов обновления и HTTP запросов
+
+    Одновременно идет не больше одной сессии: cProfile и tracemalloc
+    глобальны для процесса. Если сессия взведена, но занято, она
+    дождется следующего цикла или запроса.
+
+    Attributes:
+        directory (str):
+            Каталог для файлов pstats и снимков tracemalloc
+        top (int):
+            Количество строк в сводке
+        frames (int):
+            Глубина стека, которую запоминает tracemalloc
+        armed (dict[str, int]):
+            Взведенные сессии: для update - 1, для requests - сколько запросов профилировать
+        active (str | None):
+            Цель идущей сессии
+        last_summary (dict | None):
+            Сводка последней завершенной сессии
+
+    """
+
+    def __init__(self, directory: str, top: int = 30, frames: int = 1):
+        self.directory = directory
+        self.top = top
+        self.frames = frames
+        self.armed: dict[str, int] = dict()
+        self.active: str | None = None
+        self.last_summary: dict | None = None
+        self._profile: cProfile.Profile | None = None
+        self._started_at = 0.0
+        self._start = 0.0
+        self._requests_left = 0
+        self._own_tracemalloc = False
+        self._sessions = 0
+
+    def arm(self, target: str, count: int = 1):
+        """Взвести сессию для следующего цикла обновления или следующих count запросов"""
+
+        if target not in TARGETS:
+            raise ValueError(f"Неизвестная цель профилирования {target}, ожидается одна из {TARGETS}")
+        if count < 1:
+            raise ValueError("Количество запросов должно быть положительным")
+        self.armed[target] = 1 if target == "update" else count
+
+    def status(self) -> dict:
+        return dict(armed=dict(self.armed), active=self.active, last=self.last_summary)
+
+    def _start_session(self, target: str) -> bool:
+        if self.active is not None or target not in self.armed:
+            return False
+        count = self.armed.pop(target)
+        self._requests_left = count if target == "requests" else 0
+        self.active = target
+        self._started_at = time.time()
+        self._start = time.perf_counter()
+        # tracemalloc мог запустить кто-то другой, тогда его не трогаем
+        self._own_tracemalloc = not tracemalloc.is_tracing()
+        if self._own_tracemalloc:
+            tracemalloc.start(self.frames)
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        print(f"Profiling {target} started")
+        return True
+
+    async def _stop_session(self):
+        self._profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        if self._own_tracemalloc:
+            tracemalloc.stop()
+        target, profile = self.active, self._profile
+        self.active, self._profile = None, None
+        seconds = time.perf_counter() - self._start
+
+        # Номер сессии в имени, чтобы две сессии в одну секунду не перезаписали друг друга
+        self._sessions += 1
+        started = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._started_at))
+        base_path = os.path.join(self.directory, f"{target}-{started}-{self._sessions}")
+        try:
+            summary = await asyncio.get_running_loop().run_in_executor(None, self._save, target, profile, snapshot, base_path)
+        except Exception as error:
+            print(f"Profiling {target}: failed to build summary: {error!r}")
+            return
+        self.last_summary = dict(target=target, started_at=self._started_at, seconds=round(seconds, 3), **summary)
+        print(f"Profiling {target} finished in {seconds:.2f} seconds")
+
+    def _save(self, target: str, profile: cProfile.Profile, snapshot: tracemalloc.Snapshot, base_path: str) -> dict:
+        # Выполняется в потоке: запись файлов и разбор статистики занимают заметное время
+        stats = pstats.Stats(profile)
+        snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),
+                                           tracemalloc.Filter(False, "<frozen importlib._bootstrap>")))
+        paths = dict(pstats_path=None, snapshot_path=None)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            stats.dump_stats(base_path + ".pstats")
+            snapshot.dump(base_path + ".tracemalloc")
+            paths = dict(pstats_path=base_path + ".pstats", snapshot_path=base_path + ".tracemalloc")
+            print(f"Profiling {target} saved to {base_path}.*")
+        except OSError as error:
+            print(f"Profiling {target}: failed to save files to {self.directory}: {error}")
+        return dict(paths, functions=self._top_functions(stats, 3), hot_functions=self._top_functions(stats, 2),
+                    allocations=self._top_allocations(snapshot))
+
+    def _top_functions(self, stats: pstats.Stats, sort_index: int) -> list[dict]:
+        # Значение в stats.stats: (примитивные вызовы, все вызовы, собственное время, время с вложенными, вызывающие)
+        rows = sorted(stats.stats.items(), key=lambda row: -row[1][sort_index])[:self.top]
+        return [dict(function=f"{file_name}:{line}({function})", calls=calls, primitive_calls=primitive_calls,
+                     total_seconds=round(total, 6), cumulative_seconds=round(cumulative, 6))
+                for (file_name, line, function), (primitive_calls, calls, total, cumulative, _) in rows]
+
+    def _top_allocations(self, snapshot: tracemalloc.Snapshot) -> list[dict]:
+        return [dict(location=str(stat.traceback[0]), size_kb=round(stat.size / 1024, 1), count=stat.count)
+                for stat in snapshot.statistics("lineno")[:self.top]]
+
+    @asynccontextmanager
+    async def session(self, target: str):
+        """Профилировать блок, если для цели взведена сессия, иначе просто выполнить его"""
+
+        started = self._start_session(target)
+        try:
+            yield
+        finally:
+            if started:
+                await self._stop_session()
+
+    def request_started(self) -> bool:
+        """Начать сессию запросов, если она взведена. Возвращает True, если запрос профилируется"""
+
+        return self._start_session("requests") or self.active == "requests"
+
+    async def request_finished(self):
+        """Отметить профилируемый запрос, после последнего сессия завершается"""
+
+        if self.active != "requests":
+            return
+        self._requests_left -= 1
+        if self._requests_left <= 0:
+            await self._stop_session()
+
+
+def profiling_middleware(profiler: Profiler, exclude: tuple[str, ...] = ()):
+    """Middleware aiohttp, профилирующее следующие N запросов взведенной сессии
+
+    Args:
+        profiler (Profiler):
+            Профилировщик сервиса
+        exclude (tuple[str, ...]):
+            Пути, которые не профилируются и не учитываются в счетчике запросов
+
+    Returns:
+        Middleware для web.Application(middlewares=[...])
+
+    """
+
+    @web.middleware
+    async def middleware(request: web.Request, handler):
+        if request.path in exclude or not profiler.request_started():
+            return await handler(request)
+        try:
+            return await handler(request)
+        finally:
+            await profiler.request_finished()
+
+    return middleware
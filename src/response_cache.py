@@ -0,0 +1,249 @@
+"""Модуль кэша ответов
+
+Хранит готовые к отправке тела ответов для эндпоинтов расписания, чтобы
+повторные запросы не ходили в MongoDB и не сериализовали JSON заново.
+
+Каждая запись помечена поколением буфера, из которого она получена. Поколение
+меняется при каждом применении обновлений в базе, после чего запись с другим
+поколением считается промахом. Поэтому даже ответ, собранный во время
+переключения буферов, никогда не будет отдан после него.
+
+Вместе с телом хранятся валидаторы для условных запросов (ETag из поколения и
+хэша тела, Last-Modified из времени применения обновлений) и сжатые варианты
+тела. Варианты сжимаются один раз при первом запросе с нужным Accept-Encoding
+и живут, пока запись не вытеснена или не сменилось поколение.
+
+Пакет brotli указан в requirements.txt и ставится в образ сервиса. Если его
+нет (например, в окружении разработки), поддерживается только gzip.
+
+Example:
+    cache = ResponseCache(max_entries=4096, normalize_name=DBClient.normalize_name)
+    generation = db_client.generation
+    if (response := cache.get("/group/schedule", name, generation)) is None:
+        body = (await db_client.get_group_schedule_full(name)).encode()
+        response = CachedResponse(body, generation, db_client.committed_at)
+        cache.put("/group/schedule", name, generation, response)
+    encoding = response.negotiate(request.headers.get("Accept-Encoding", ""))
+    body = response.variant(encoding)
+"""
+
+import gzip
+import hashlib
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class CachedResponse:
+    """Готовое тело ответа с валидаторами и сжатыми вариантами
+
+    Attributes:
+        body (bytes):
+            Несжатое тело ответа
+        last_modified (str | None):
+            Значение заголовка Last-Modified или None, если время неизвестно
+
+    """
+
+    # Поддерживаемые кодировки в порядке предпочтения
+    encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+
+    # Тела меньше этого размера не сжимаются: выигрыш меньше накладных расходов
+    _min_compress_size = 1024
+
+    def __init__(self, body: bytes, generation: int, committed_at: float | None = None):
+        """Конструктор
+
+        Args:
+            body (bytes):
+                Несжатое тело ответа
+            generation (int):
+                Поколение буфера, из которого получен ответ
+            committed_at (float | None):
+                Время применения обновлений этого поколения (unix time)
+
+        """
+
+        self.body = body
+        self.last_modified = formatdate(committed_at, usegmt=True) if committed_at else None
+        self._etag_base = f"{generation}-{hashlib.sha256(body).hexdigest()[:24]}"
+        self._variants: dict[str, bytes] = dict(identity=body)
+
+    def etag(self, encoding: str = "identity") -> str:
+        """Сильный ETag варианта тела: у каждой кодировки свой, как того требует RFC 9110"""
+
+        if encoding == "identity":
+            return f'"{self._etag_base}"'
+        return f'"{self._etag_base}-{encoding}"'
+
+    def negotiate(self, accept_encoding: str) -> str:
+        """Выбрать кодировку по заголовку Accept-Encoding
+
+        Args:
+            accept_encoding (str):
+                Значение заголовка Accept-Encoding
+
+        Returns:
+            "br", "gzip" или "identity"
+
+        """
+
+        if len(self.body) < self._min_compress_size or not accept_encoding:
+            return "identity"
+        weights = dict()
+        for part in accept_encoding.split(","):
+            coding, _, params = part.partition(";")
+            weight = 1.0
+            params = params.strip().lower()
+            if params.startswith("q="):
+                try:
+                    weight = float(params[2:])
+                except ValueError:
+                    weight = 0.0
+            weights[coding.strip().lower()] = weight
+        best, best_weight = "identity", 0.0
+        for encoding in self.encodings:
+            weight = weights.get(encoding, weights.get("*", 0.0))
+            if weight > best_weight:
+                best, best_weight = encoding, weight
+        return best
+
+    def variant(self, encoding: str) -> bytes:
+        """Тело в нужной кодировке, сжимается при первом обращении"""
+
+        if (body := self._variants.get(encoding)) is None:
+            if encoding == "br":
+                body = brotli.compress(self.body, quality=5)
+            else:
+                body = gzip.compress(self.body, compresslevel=6, mtime=0)
+            self._variants[encoding] = body
+        return body
+
+    def not_modified(self, if_none_match: str | None, if_modified_since: str | None) -> bool:
+        """Проверить условный запрос
+
+        If-None-Match имеет приоритет над If-Modified-Since. ETag сравнивается
+        слабым сравнением, поэтому подходит тег любого варианта этого тела.
+
+        Args:
+            if_none_match (str | None):
+                Значение заголовка If-None-Match
+            if_modified_since (str | None):
+                Значение заголовка If-Modified-Since
+
+        Returns:
+            True, если у клиента актуальная версия и можно ответить 304
+
+        """
+
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or any(self.etag(encoding) in tags for encoding in ("identity",) + self.encodings)
+        if if_modified_since and self.last_modified:
+            try:
+                return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(self.last_modified)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+class ResponseCache:
+    """LRU кэш готовых ответов с привязкой к поколению буфера
+
+    Attributes:
+        max_entries (int):
+            Максимальное количество записей (0 - кэш отключен)
+        generation (int):
+            Поколение, для которого сейчас хранятся записи
+        normalize_name (Callable[[str], str]):
+            Нормализация имени из запроса в ключ кэша
+
+    """
+
+    def __init__(self, max_entries: int = 4096, normalize_name: Callable[[str], str] = str):
+        """Конструктор
+
+        Args:
+            max_entries (int):
+                Максимальное количество записей (0 - кэш отключен)
+            normalize_name (Callable[[str], str]):
+                Нормализация имени из запроса в ключ кэша. Сервис передает DBClient.normalize_name,
+                чтобы имена, которые база считает одинаковыми, попадали в одну запись.
+                По умолчанию имя используется как есть
+
+        """
+
+        self.max_entries = max(max_entries, 0)
+        self.generation = None
+        self.normalize_name = normalize_name
+        self._entries: OrderedDict[tuple[str, str], CachedResponse] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, endpoint: str, name: str, generation: int) -> CachedResponse | None:
+        """Получить ответ из кэша
+
+        Args:
+            endpoint (str):
+                Путь эндпоинта
+            name (str):
+                Имя препода или группы из запроса
+            generation (int):
+                Текущее поколение буфера
+
+        Returns:
+            Ответ или None, если записи нет или она от другого поколения
+
+        """
+
+        if generation != self.generation:
+            self.invalidate(generation)
+        key = (endpoint, self.normalize_name(name))
+        response = self._entries.get(key)
+        if response is None:
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def put(self, endpoint: str, name: str, generation: int, response: CachedResponse):
+        """Положить ответ в кэш
+
+        Ответы от устаревшего поколения не сохраняются.
+
+        Args:
+            endpoint (str):
+                Путь эндпоинта
+            name (str):
+                Имя препода или группы из запроса
+            generation (int):
+                Поколение буфера, из которого получен ответ
+            response (CachedResponse):
+                Готовый ответ
+
+        """
+
+        if not self.max_entries or generation != self.generation:
+            return
+        key = (endpoint, self.normalize_name(name))
+        self._entries[key] = response
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, generation: int | None = None):
+        """Сбросить все записи и перейти на новое поколение
+
+        Args:
+            generation (int | None):
+                Новое поколение буфера
+
+        """
+
+        self._entries.clear()
+        self.generation = generation
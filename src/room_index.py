@@ -0,0 +1,112 @@
+"""Модуль индекса аудиторий
+
+Отвечает на вопросы "чем занята аудитория" и "какие аудитории свободны на паре"
+без просмотра расписаний групп. Индекс строится из коллекции rooms текущего
+буфера (см. DBClient.build_room_index) и хранится в памяти: занятость аудитории
+и список свободных аудиторий для каждого слота (дата, номер пары) считаются
+заранее, поэтому ответ - это поиск по словарю.
+
+Свободные аудитории известны только для слотов из календаря индекса: дат и
+номеров пар, которые есть в расписаниях групп. Для даты без единой пары
+свободны все аудитории, а для даты вне скачанных недель или несуществующего
+номера пары ответа нет.
+
+Как и поисковый индекс имен, индекс неизменяемый: после применения обновлений
+строится новый и заменяет старый одной операцией присваивания.
+
+Example:
+    index = RoomIndex(await db_client.get_room_documents(), await db_client.get_room_calendar())
+    index.free_rooms("16.10", "3")
+    index.occupancy("ук1 101", dates=["16.10"])
+"""
+
+
+class RoomIndex:
+    """Индекс занятости аудиторий
+
+    Attributes:
+        rooms (list[str]):
+            Все известные аудитории по алфавиту
+        dates (list[str]):
+            Даты, по которым построен индекс, по порядку
+        numbers (list[str]):
+            Номера пар, которые встречаются в расписаниях
+
+    """
+
+    def __init__(self, documents: list[dict], calendar: dict | None = None):
+        """Конструктор
+
+        Args:
+            documents (list[dict]):
+                Документы коллекции rooms: {"room": аудитория, "slots": [занятые слоты]}
+            calendar (dict | None):
+                Документ коллекции calendar: {"dates": [даты], "numbers": [номера пар]}.
+                Без него календарь собирается из занятых слотов, и дни без пар считаются неизвестными
+
+        """
+
+        self.rooms = sorted(document["room"] for document in documents)
+        self._keys = {self.normalize(document["room"]): document["room"] for document in documents}
+        self._slots = {document["room"]: document["slots"] for document in documents}
+        occupied: dict[tuple[str, str], set[str]] = dict()
+        for document in documents:
+            for slot in document["slots"]:
+                occupied.setdefault((slot["date"], slot["number"]), set()).add(document["room"])
+        self._free = {key: [room for room in self.rooms if room not in rooms] for key, rooms in occupied.items()}
+        if calendar is None:
+            calendar = dict(dates=list(dict.fromkeys(date for date, _ in occupied)),
+                            numbers=sorted({number for _, number in occupied}, key=lambda number: number.zfill(2)))
+        self.dates = calendar["dates"]
+        self.numbers = calendar["numbers"]
+        self._calendar = (set(self.dates), set(self.numbers))
+
+    def __len__(self) -> int:
+        return len(self.rooms)
+
+    @staticmethod
+    def normalize(room: str) -> str:
+        """Нормализовать название аудитории: нижний регистр и схлопнутые пробелы"""
+
+        return " ".join(room.casefold().split())
+
+    def occupancy(self, room: str, dates: list[str] | None = None) -> tuple[str, list[dict]] | None:
+        """Занятость аудитории
+
+        Args:
+            room (str):
+                Название аудитории без учета регистра
+            dates (list[str] | None):
+                Оставить только слоты с этими датами в формате "ДД.ММ"
+
+        Returns:
+            Пара (название аудитории, занятые слоты по порядку) или None, если аудитория неизвестна
+
+        """
+
+        if (name := self._keys.get(self.normalize(room))) is None:
+            return None
+        slots = self._slots[name]
+        if dates is not None:
+            slots = [slot for slot in slots if slot["date"] in dates]
+        return name, slots
+
+    def free_rooms(self, date: str, number: str) -> list[str] | None:
+        """Свободные аудитории на паре
+
+        Args:
+            date (str):
+                Дата в формате "ДД.ММ"
+            number (str):
+                Номер пары
+
+        Returns:
+            Аудитории, в которых в этот слот нет пар, по алфавиту, или None,
+            если дата или номер пары не входят в индекс
+
+        """
+
+        dates, numbers = self._calendar
+        if date not in dates or number not in numbers:
+            return None
+        return self._free.get((date, number), self.rooms)
@@ -0,0 +1,107 @@
+"""Модуль срезов расписания
+
+Разбирает параметры запроса week, day, date, from и to в срез расписания,
+который DBClient применяет на стороне MongoDB, чтобы из базы приходила
+и сериализовалась только нужная часть документа.
+
+Даты в расписании хранятся как "ДД.ММ" без года, поэтому диапазон дат
+раскрывается в явный список дней. Так переход через новый год обрабатывается
+без сравнения строк.
+
+Параметры:
+    week       - номер недели в документе: 0 - эта, 1 - следующая
+    day        - день недели: номер от 1 (понедельник) до 7 или название
+    date       - одна дата: "today", "ГГГГ-ММ-ДД" или "ДД.ММ"
+    from, to   - диапазон дат включительно в тех же форматах. Без from
+                 диапазон начинается сегодня, без to длится две недели
+
+Example:
+    schedule_slice = parse_slice(request.query, datetime.now(ZoneInfo("Europe/Moscow")).date())
+    # ?date=today -> {"dates": ["16.10"]}
+    # ?week=0&day=1 -> {"week": 0, "day": "Понедельник"}
+"""
+
+from datetime import date, timedelta
+from typing import Mapping
+
+WEEK_DAYS = ("Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье")
+
+# Максимальная длина диапазона дат в днях
+MAX_RANGE_DAYS = 62
+
+
+def _parse_date(value: str, today: date, not_before: date | None = None) -> date:
+    """Разобрать дату из запроса
+
+    У даты "ДД.ММ" год берется текущий, а если она оказывается раньше not_before,
+    то следующий.
+
+    """
+
+    if value == "today":
+        return today
+    if "-" in value:
+        return date.fromisoformat(value)
+    day, month = value.split(".")
+    result = date(today.year, int(month), int(day))
+    if not_before is not None and result < not_before:
+        result = date(today.year + 1, int(month), int(day))
+    return result
+
+
+def parse_slice(query: Mapping[str, str], today: date) -> dict:
+    """Разобрать параметры среза из запроса
+
+    Args:
+        query (Mapping[str, str]):
+            Параметры запроса
+        today (date):
+            Сегодняшняя дата, относительно которой разбираются "today" и неполные даты.
+            Берется в часовом поясе расписания, а не сервера
+
+    Returns:
+        Срез для DBClient с ключами week, day и dates (только заданные),
+        пустой словарь - расписание целиком
+
+    Raises:
+        ValueError: Некорректные значения параметров
+
+    """
+
+    schedule_slice = dict()
+    if (week := query.get("week")) is not None:
+        if not week.isdigit():
+            raise ValueError(f"Некорректный номер недели: {week}")
+        schedule_slice["week"] = int(week)
+    if (day := query.get("day")) is not None:
+        if day.isdigit():
+            if not 1 <= int(day) <= len(WEEK_DAYS):
+                raise ValueError(f"Некорректный номер дня: {day}")
+            schedule_slice["day"] = WEEK_DAYS[int(day) - 1]
+        else:
+            names = {name.casefold(): name for name in WEEK_DAYS}
+            if day.casefold() not in names:
+                raise ValueError(f"Некорректный день недели: {day}")
+            schedule_slice["day"] = names[day.casefold()]
+    has_range = "from" in query or "to" in query
+    if "date" in query:
+        if has_range:
+            raise ValueError("Параметр date нельзя указывать вместе с from и to")
+        days = [_parse_date(query["date"], today)]
+    elif has_range:
+        start = _parse_date(query["from"], today) if "from" in query else today
+        end = _parse_date(query["to"], today, not_before=start) if "to" in query else start + timedelta(days=13)
+        if not 0 <= (end - start).days < MAX_RANGE_DAYS:
+            raise ValueError(f"Диапазон дат должен быть от 1 до {MAX_RANGE_DAYS} дней")
+        days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    else:
+        return schedule_slice
+    schedule_slice["dates"] = [f"{day.day:02}.{day.month:02}" for day in days]
+    return schedule_slice
+
+
+def slice_key(schedule_slice: dict) -> str:
+    """Строка среза для ключа кэша ответов"""
+
+    return "&".join(f"{key}={','.join(value) if key == 'dates' else value}"
+                    for key, value in sorted(schedule_slice.items()))
@@ -0,0 +1,178 @@
+"""Модуль вывода расписаний преподов из расписаний групп
+
+Каждая пара есть и в расписании группы, и в расписании препода, поэтому
+расписание препода можно собрать, не запрашивая его у БГТУ API: пройти по
+расписаниям всех групп и сгруппировать пары по полю teacher. Пара потока,
+которая стоит у нескольких групп, объединяется в одну со всеми группами
+и аудиториями.
+
+В расписаниях групп преподы записаны кратко ("Иванов И.И."), а в списке
+преподов - полностью ("Иванов Иван Иванович"). Полное имя сводится к краткому
+(фамилия и инициалы). Если краткое имя совпадает у нескольких преподов, пары
+нельзя однозначно приписать, и таких преподов нужно скачивать как обычно.
+
+В выведенных расписаниях нет перерывов: на странице препода они свои и из
+расписаний групп не восстанавливаются. Сравнение с настоящим расписанием
+(compare) поэтому смотрит только на пары.
+
+Example:
+    deriver = TeacherDeriver(parser.get_teacher_links(teacher_list_html, base_url))
+    schedules = deriver.derive(group_documents)
+    problems = TeacherDeriver.compare(schedules[url], fetched_schedule)
+"""
+
+from urllib.parse import urlsplit
+
+# Порядок дней внутри недели. День ищется по названию, а не по дате, чтобы неделя
+# на стыке годов (29.12 - 04.01) не перемешалась
+_WEEKDAYS = {name: index for index, name in enumerate(("Понедельник", "Вторник", "Среда", "Четверг",
+                                                        "Пятница", "Суббота", "Воскресенье"))}
+
+
+def _day_order(day: tuple[str, str]) -> tuple:
+    date, day_of_week = day
+    return (_WEEKDAYS.get(day_of_week, len(_WEEKDAYS)), date.split(".")[::-1])
+
+
+def short_teacher_name(full_name: str) -> str:
+    """Краткое имя препода, как в расписаниях групп: "Иванов Иван Иванович" -> "Иванов И.И."
+
+    Части имени, которые не начинаются с буквы, в инициалы не попадают
+    """
+
+    surname, *rest = full_name.split() or [""]
+    return " ".join([surname, "".join(f"{part[0]}." for part in rest if part[0].isalpha())]).strip()
+
+
+def url_entity_id(url: str) -> str:
+    """Идентификатор сущности по ссылке на расписание: .../raspisaniya/prepodavateli/311 -> "prepodavateli:311"
+
+    Совпадает с entity:id из заголовка расписания, поэтому его можно получить без скачивания страницы
+    """
+
+    return ":".join(urlsplit(url).path.rstrip("/").split("/")[-2:])
+
+
+class TeacherDeriver:
+    """Сборщик расписаний преподов из расписаний групп
+
+    Attributes:
+        teachers (dict[str, dict]):
+            Краткое имя -> препод {"url", "name"}, для которого его можно вывести
+        ambiguous (list[dict]):
+            Преподы, у которых краткое имя совпадает с другим преподом
+        unknown_names (set[str]):
+            Краткие имена из расписаний групп, которых нет в списке преподов (после derive)
+
+    """
+
+    def __init__(self, teachers: list[dict]):
+        """Конструктор
+
+        Args:
+            teachers (list[dict]):
+                Преподы из списка: {"url": ссылка на расписание, "name": полное имя}
+
+        """
+
+        by_short_name: dict[str, list[dict]] = dict()
+        for teacher in teachers:
+            by_short_name.setdefault(short_teacher_name(teacher["name"]), []).append(teacher)
+        self.teachers = {short_name: same_name[0] for short_name, same_name in by_short_name.items() if len(same_name) == 1}
+        self.ambiguous = [teacher for same_name in by_short_name.values() if len(same_name) > 1 for teacher in same_name]
+        self.unknown_names: set[str] = set()
+
+    def derive(self, group_documents) -> dict[str, dict]:
+        """Вывести расписания всех однозначно определенных преподов
+
+        Args:
+            group_documents (Iterable[dict]):
+                Расписания групп в формате базы: nameofgroup и weeks
+
+        Returns:
+            Словарь URL препода -> расписание в формате парсера (table_name, weeks) с entity_id
+
+        """
+
+        # Каркас недель берется из расписаний групп: статус недели и дни по датам
+        weeks: list[dict] = []
+        lessons: dict[str, dict[tuple, dict]] = dict()
+        unknown_names = set()
+        for document in group_documents:
+            for week_index, week in enumerate(document.get("weeks", [])):
+                if week_index == len(weeks):
+                    weeks.append(dict(week_status=week["week_status"], days=dict()))
+                for day in week["day"]:
+                    weeks[week_index]["days"].setdefault(day["date"], day["day_of_week"])
+                    for subject in day["subjects"]:
+                        for short_name in subject.get("teacher", []):
+                            if short_name not in self.teachers:
+                                unknown_names.add(short_name)
+                                continue
+                            key = (week_index, day["date"], subject["number"], subject["type"], subject["name"])
+                            lesson = lessons.setdefault(short_name, dict()).get(key)
+                            if lesson is None:
+                                lesson = dict(number=subject["number"], type=subject["type"], name=subject["name"],
+                                              start=subject["start"], end=subject["end"], classroom=[], group=[])
+                                lessons[short_name][key] = lesson
+                            lesson["classroom"] += [room for room in subject.get("classroom", []) if room not in lesson["classroom"]]
+                            if document["nameofgroup"] not in lesson["group"]:
+                                lesson["group"].append(document["nameofgroup"])
+        self.unknown_names = unknown_names
+        # Дни копятся в порядке, в котором встретились у групп: у первой группы могло не быть какого-то дня
+        for week in weeks:
+            week["days"] = dict(sorted(week["days"].items(), key=_day_order))
+
+        schedules = dict()
+        for short_name, teacher in self.teachers.items():
+            by_day: dict[tuple[int, str], list[dict]] = dict()
+            for (week_index, date, *_), lesson in lessons.get(short_name, dict()).items():
+                by_day.setdefault((week_index, date), []).append(lesson)
+            schedule_weeks = [dict(week_status=week["week_status"],
+                                   day=[dict(day_of_week=day_of_week, date=date,
+                                             subjects=sorted(by_day.get((week_index, date), []),
+                                                             key=lambda lesson: lesson["number"].zfill(2)))
+                                        for date, day_of_week in week["days"].items()])
+                              for week_index, week in enumerate(weeks)]
+            schedules[teacher["url"]] = dict(table_name=teacher["name"], weeks=schedule_weeks,
+                                             entity_id=url_entity_id(teacher["url"]))
+        return schedules
+
+    @staticmethod
+    def compare(derived: dict, fetched: dict) -> list[str]:
+        """Сравнить выведенное расписание препода со скачанным
+
+        Args:
+            derived (dict):
+                Выведенное расписание
+            fetched (dict):
+                Расписание, скачанное с БГТУ API и спарсенное как обычно
+
+        Returns:
+            Список расхождений в читаемом виде, пустой - расписания совпадают
+
+        """
+
+        def lessons(schedule: dict) -> dict[tuple, dict]:
+            return {(week_index, day["date"], subject["number"], subject["name"]): subject
+                    for week_index, week in enumerate(schedule["weeks"])
+                    for day in week["day"] for subject in day["subjects"] if "number" in subject}
+
+        derived_lessons, fetched_lessons = lessons(derived), lessons(fetched)
+        problems = []
+        for key in sorted(fetched_lessons.keys() - derived_lessons.keys(), key=str):
+            problems.append(f"неделя {key[0]}, {key[1]}, пара {key[2]} {key[3]}: нет в выведенном расписании")
+        for key in sorted(derived_lessons.keys() - fetched_lessons.keys(), key=str):
+            problems.append(f"неделя {key[0]}, {key[1]}, пара {key[2]} {key[3]}: нет в скачанном расписании")
+        for key in sorted(derived_lessons.keys() & fetched_lessons.keys(), key=str):
+            derived_lesson, fetched_lesson = derived_lessons[key], fetched_lessons[key]
+            for field in ("type", "start", "end"):
+                if derived_lesson.get(field) != fetched_lesson.get(field):
+                    problems.append(f"неделя {key[0]}, {key[1]}, пара {key[2]} {key[3]}: {field} "
+                                    f"{derived_lesson.get(field)!r} вместо {fetched_lesson.get(field)!r}")
+            # Порядок групп и аудиторий на странице препода не восстанавливается, сравниваем множества
+            for field in ("classroom", "group"):
+                if set(derived_lesson.get(field, [])) != set(fetched_lesson.get(field, [])):
+                    problems.append(f"неделя {key[0]}, {key[1]}, пара {key[2]} {key[3]}: {field} "
+                                    f"{sorted(derived_lesson.get(field, []))} вместо {sorted(fetched_lesson.get(field, []))}")
+        return problems
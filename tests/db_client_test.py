@@ -0,0 +1,344 @@
+import pytest
+import asyncio
+import json
+import os
+import time
+import threading
+from src import db_client as db_client_module
+from src.db_client import AsyncDBClient, DBClient
+
+class SlowClient:
+    def __init__(self):
+        self.threads = set()
+        self.name = "slow"
+
+    def get_group_list(self) -> str:
+        self.threads.add(threading.current_thread().name)
+        time.sleep(0.05)
+        return '{"group_names": []}'
+
+    def get_group_schedule_full(self, group_name: str) -> str:
+        return group_name
+
+@pytest.mark.asyncio
+class TestAsyncDBClient:
+    async def test_same_surface(self):
+        db_client = AsyncDBClient(SlowClient())
+        assert await db_client.get_group_schedule_full("ИТ-221") == "ИТ-221"
+        assert db_client.name == "slow"
+        await db_client.close()
+
+    async def test_calls_overlap(self):
+        slow_client = SlowClient()
+        db_client = AsyncDBClient(slow_client, max_workers=4)
+        start = time.perf_counter()
+        results = await asyncio.gather(*[db_client.get_group_list() for _ in range(4)])
+        assert time.perf_counter() - start < 0.15
+        assert results == ['{"group_names": []}'] * 4
+        assert all(name.startswith("db_client") for name in slow_client.threads)
+        await db_client.close()
+
+    async def test_loop_not_blocked(self):
+        db_client = AsyncDBClient(SlowClient(), max_workers=1)
+        ticks = []
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.005)
+        await asyncio.gather(db_client.get_group_list(), ticker())
+        assert len(ticks) == 5
+        await db_client.close()
+
+class TestNameLookup:
+    def test_exact_and_prefix(self, filled_client):
+        assert json.loads(filled_client.get_group_schedule_full("ит-221"))["nameofgroup"] == "ИТ-221"
+        assert json.loads(filled_client.get_group_schedule_full("  ИТ-22  "))["nameofgroup"] == "ИТ-221"
+        assert filled_client.get_group_schedule_full("ИТ-22", "exact") == ""
+        assert json.loads(filled_client.get_group_schedule_full("В-22", "contains"))["nameofgroup"] == "ПВ-221"
+
+    def test_auto_does_not_scan(self, filled_client, monkeypatch):
+        queries = []
+        find_one = type(filled_client["current_buffer"]["groups"]).find_one
+        def spy(collection, query, *args, **kwargs):
+            queries.append(query)
+            return find_one(collection, query, *args, **kwargs)
+        monkeypatch.setattr(type(filled_client["current_buffer"]["groups"]), "find_one", spy)
+        # Промах в auto проверяет только точное имя и начало имени, оба по индексу name_key;
+        # подстроку сервис ищет по триграммному индексу в памяти
+        assert filled_client.get_group_schedule_full("221") == ""
+        assert queries == [{"name_key": "221"}, {"name_key": {"$regex": "^221"}}]
+        assert json.loads(filled_client.get_group_schedule_full("221", "contains"))["nameofgroup"] == "ИТ-221"
+
+    def test_regex_escaped(self, filled_client):
+        assert filled_client.get_group_schedule_full("ИТ-2.*") == ""
+        assert filled_client.get_group_schedule_full(".*", "contains") == ""
+
+    def test_service_fields_hidden(self, filled_client):
+        schedule = json.loads(filled_client.get_group_schedule_full("ИТ-221"))
+        assert set(schedule) == {"nameofgroup", "weeks"}
+
+    def test_unknown_mode(self, filled_client):
+        with pytest.raises(ValueError):
+            filled_client.get_group_schedule_full("ИТ-221", "fuzzy")
+
+    def test_sorted_list(self, filled_client):
+        assert json.loads(filled_client.get_group_list())["group_names"] == ["ИТ-221", "ИТ-222", "ПВ-221"]
+
+class TestWarmStart:
+    def test_committed_buffer_restored(self, filled_client):
+        restarted = DBClient("localhost", 27017, "username", "password")
+        assert restarted.generation == filled_client.generation == 1
+        assert restarted["current_buffer"].name == filled_client["current_buffer"].name
+        assert json.loads(restarted.get_group_schedule_full("ИТ-221"))["nameofgroup"] == "ИТ-221"
+
+    def test_unfinished_next_buffer_cleared(self, filled_client):
+        filled_client.update_groups_many([dict(table_name="КБ-231", entity_id="gruppy:9", fingerprint="9", weeks=[])])
+        restarted = DBClient("localhost", 27017, "username", "password")
+        assert restarted["next_buffer"]["groups"].count_documents({}) == 0
+        restarted.commit_updates()
+        assert restarted.generation == 2
+        assert restarted.get_group_list() == '{"group_names": []}'
+
+    def test_fresh_start(self, mongo_client):
+        assert mongo_client.generation == 0
+
+class TestGenerations:
+    def test_commit_switches_pointer(self, filled_client):
+        old_name = filled_client["current_buffer"].name
+        next_name = filled_client["next_buffer"].name
+        filled_client.update_groups_many([dict(table_name="КБ-231", entity_id="gruppy:9", fingerprint="9", weeks=[])])
+        filled_client.commit_updates()
+        assert filled_client["current_buffer"].name == next_name
+        assert filled_client.meta.find_one({"_id": "buffers"})["current_buffer"] == next_name
+        assert filled_client["next_buffer"]["groups"].count_documents({}) == 0
+        # Старое поколение живо до явного удаления
+        assert filled_client.db[old_name]["groups"].count_documents({}) == 3
+        filled_client.drop_retired_buffers()
+        assert f"{old_name}.groups" not in filled_client.db.list_collection_names()
+        assert json.loads(filled_client.get_group_list())["group_names"] == ["КБ-231"]
+
+    def test_discard_updates(self, filled_client):
+        filled_client.write_batch_size = 2
+        filled_client.add_groups([dict(table_name=f"Г-{index}", entity_id=f"gruppy:{10 + index}", fingerprint="0", weeks=[])
+                                  for index in range(3)])
+        filled_client.discard_updates()
+        # Недописанная пачка не попадает в следующий цикл
+        filled_client.flush_writes()
+        assert filled_client["next_buffer"]["groups"].count_documents({}) == 0
+        assert filled_client.generation == 1
+        assert len(json.loads(filled_client.get_group_list())["group_names"]) == 3
+
+    def test_stale_buffers_dropped_on_start(self, filled_client):
+        filled_client.db["buffer_1"]["groups"].insert_one({"nameofgroup": "old"})
+        restarted = DBClient("localhost", 27017, "username", "password")
+        names = restarted.db.list_collection_names()
+        assert "buffer_1.groups" not in names
+        assert f"{restarted['current_buffer'].name}.groups" in names
+
+class TestFindSchedules:
+    def test_batches_in_name_order(self, filled_client):
+        cursor = filled_client.find_schedules("groups", ["пв-221", "ИТ-221", "ИТ-221", "нет такой"])
+        first = filled_client.fetch_batch(cursor, 1)
+        rest = filled_client.fetch_batch(cursor, 10)
+        assert [document["name_key"] for document in first + rest] == ["ит-221", "пв-221"]
+        assert filled_client.fetch_batch(cursor, 10) == []
+        assert "entity_id" not in first[0] and "_id" not in first[0]
+
+    def test_sliced(self, filled_client):
+        cursor = filled_client.find_schedules("groups", ["ИТ-222"], dict(week=0))
+        assert [document["nameofgroup"] for document in filled_client.fetch_batch(cursor, 10)] == ["ИТ-222"]
+
+class TestScheduleSlices:
+    @pytest.fixture
+    def sliced_client(self, mongo_client) -> DBClient:
+        weeks = [dict(week_status="Числитель", day=[dict(day_of_week="Понедельник", date="01.09", subjects=[]),
+                                                    dict(day_of_week="Вторник", date="02.09", subjects=[])]),
+                 dict(week_status="Знаменатель", day=[dict(day_of_week="Понедельник", date="08.09", subjects=[])])]
+        mongo_client.update_groups_many([dict(table_name="ИТ-221", entity_id="gruppy:1", fingerprint="1", weeks=weeks)])
+        mongo_client.commit_updates()
+        return mongo_client
+
+    def test_week(self, sliced_client):
+        weeks = json.loads(sliced_client.get_group_schedule_full("ИТ-221", week=1))["weeks"]
+        assert [week["week_status"] for week in weeks] == ["Знаменатель"]
+
+    def test_day_and_dates(self, sliced_client):
+        schedule = json.loads(sliced_client.get_group_schedule_full("ИТ-221", day="Понедельник"))
+        assert [day["date"] for week in schedule["weeks"] for day in week["day"]] == ["01.09", "08.09"]
+        assert set(schedule) == {"weeks", "nameofgroup"}
+        weeks = json.loads(sliced_client.get_group_schedule_full("ИТ-221", dates=["02.09"]))["weeks"]
+        assert weeks == [dict(week_status="Числитель", day=[dict(day_of_week="Вторник", date="02.09", subjects=[])])]
+
+    def test_empty_slice(self, sliced_client):
+        assert json.loads(sliced_client.get_group_schedule_full("ИТ-221", dates=["03.09"]))["weeks"] == []
+        assert sliced_client.get_group_schedule_full("ПВ-221", dates=["01.09"]) == ""
+
+class TestRoomIndex:
+    def test_built_and_committed_with_buffer(self, mongo_client):
+        lesson = dict(number="1", type="Лекция", name="Физика", start="08:00", end="09:35")
+        day = lambda teacher: dict(day_of_week="Понедельник", date="01.09",
+                                   subjects=[dict(lesson, classroom=["УК1 101"], teacher=[teacher]), dict(name="Перерыв 1 час")])
+        mongo_client.update_groups_many([dict(table_name=name, entity_id=name, fingerprint="1",
+                                              weeks=[dict(week_status="Числитель", day=[day(teacher)])])
+                                         for name, teacher in (("ИТ-221", "Иванов И.И."), ("ИТ-222", "Петров П.П."))])
+        assert mongo_client.build_room_index() == 1
+        assert mongo_client.get_room_documents() == []
+        mongo_client.commit_updates()
+        [document] = mongo_client.get_room_documents()
+        assert document["room"] == "УК1 101"
+        assert [(slot["groups"], slot["teachers"]) for slot in document["slots"]] == [(["ИТ-221", "ИТ-222"], ["Иванов И.И.", "Петров П.П."])]
+        assert mongo_client.get_room_calendar() == dict(dates=["01.09"], numbers=["1"])
+        # Следующее поколение начинается без индекса
+        assert mongo_client["next_buffer"]["rooms"].count_documents({}) == 0
+        assert mongo_client["next_buffer"]["calendar"].count_documents({}) == 0
+
+    def test_calendar_keeps_days_without_lessons(self, mongo_client):
+        lesson = dict(number="2", type="Лекция", name="Физика", start="09:45", end="11:20", classroom=["УК1 101"])
+        days = [dict(day_of_week="Понедельник", date="01.09", subjects=[lesson]),
+                dict(day_of_week="Вторник", date="02.09", subjects=[]),
+                dict(day_of_week="Среда", date="03.09", subjects=[dict(lesson, number="10", classroom=[])])]
+        mongo_client.update_groups_many([dict(table_name="ИТ-221", entity_id="gruppy:1", fingerprint="1",
+                                              weeks=[dict(week_status="Числитель", day=days)])])
+        mongo_client.build_room_index()
+        mongo_client.commit_updates()
+        assert mongo_client.get_room_calendar() == dict(dates=["01.09", "02.09", "03.09"], numbers=["2", "10"])
+
+class TestHeaderCache:
+    def test_round_trip(self, mongo_client):
+        assert mongo_client.get_cached_headers() == dict()
+        header = dict(table_name="ИТ-221", entity="gruppy", device="desktop", id="1042")
+        before = time.time()
+        mongo_client.update_cached_headers({"https://t.bstu.ru/raspisaniya/gruppy/1042": header})
+        cached = mongo_client.get_cached_headers()["https://t.bstu.ru/raspisaniya/gruppy/1042"]
+        assert cached["header"] == header and before <= cached["checked_at"] <= time.time()
+
+    def test_update_refreshes_checked_at(self, mongo_client):
+        url = "https://t.bstu.ru/raspisaniya/gruppy/1042"
+        mongo_client.update_cached_headers({url: dict(entity="gruppy", id="1042")})
+        mongo_client.header_cache.update_one({"_id": url}, {"$set": {"checked_at": 0}})
+        mongo_client.update_cached_headers({url: dict(entity="gruppy", id="2042")})
+        cached = mongo_client.get_cached_headers()
+        assert list(cached) == [url] and cached[url]["header"]["id"] == "2042" and cached[url]["checked_at"] > 0
+        # Пустое обновление ничего не пишет
+        mongo_client.update_cached_headers(dict())
+        # Кэш не зависит от поколений буфера
+        mongo_client.commit_updates()
+        assert mongo_client.get_cached_headers() == cached
+
+class TestBulkWrites:
+    def test_batches_and_flush(self, mongo_client):
+        mongo_client.write_batch_size = 4
+        schedules = [dict(table_name=f"Г-{index}", entity_id=f"gruppy:{index}", fingerprint="0", weeks=[]) for index in range(10)]
+        mongo_client.add_groups(schedules)
+        assert [batch["documents"] for batch in mongo_client.write_stats] == [4, 4]
+        assert mongo_client["next_buffer"]["groups"].count_documents({}) == 8
+        mongo_client.flush_writes()
+        assert [batch["documents"] for batch in mongo_client.write_stats] == [4, 4, 2]
+        assert mongo_client["next_buffer"]["groups"].count_documents({}) == 10
+        # Входные данные не изменяются
+        assert "table_name" in schedules[0] and "name_key" not in schedules[0]
+
+    def test_upsert_by_entity(self, mongo_client):
+        mongo_client.add_groups([dict(table_name="ИТ-221", entity_id="gruppy:1", fingerprint="1", weeks=[])])
+        mongo_client.add_groups([dict(table_name="ИТ-221", entity_id="gruppy:1", fingerprint="2", weeks=[])])
+        mongo_client.flush_writes()
+        documents = list(mongo_client["next_buffer"]["groups"].find())
+        assert len(documents) == 1 and documents[0]["fingerprint"] == "2"
+
+    def test_stats_reset_on_commit(self, mongo_client):
+        mongo_client.update_teachers_many([dict(table_name="Иванов Иван Иванович", entity_id="prepodavateli:1", fingerprint="1", weeks=[])])
+        assert mongo_client.write_stats
+        mongo_client.commit_updates()
+        assert mongo_client.write_stats == []
+
+class TestNormalizedStorage:
+    def test_round_trip(self, normalized_client):
+        group, teacher = golden_schedule("week_group"), golden_schedule("week_teacher")
+        normalized_client.update_groups_many([dict(group, entity_id="gruppy:1", fingerprint="1")])
+        normalized_client.update_teachers_many([dict(teacher, entity_id="prepodavateli:1", fingerprint="1")])
+        normalized_client.commit_updates()
+        assert normalized_client.get_group_schedule_full(group["table_name"]) == json.dumps(dict(weeks=group["weeks"], nameofgroup=group["table_name"]))
+        assert normalized_client.get_teacher_schedule_full(teacher["table_name"]) == json.dumps(dict(weeks=teacher["weeks"], nameofteacher=teacher["table_name"]))
+        stored = normalized_client["current_buffer"]["groups"].find_one()
+        assert stored["normalized"] and all(isinstance(subject, list) for week in stored["weeks"]
+                                            for day in week["day"] for subject in day["subjects"])
+
+    def test_smaller_documents(self, mongo_client, normalized_client):
+        bson = pytest.importorskip("bson")
+        schedule = dict(golden_schedule("week_group"), entity_id="gruppy:1", fingerprint="1")
+        plain_size = len(bson.encode(mongo_client._to_document("groups", schedule)))
+        normalized_size = len(bson.encode(normalized_client._to_document("groups", schedule)))
+        assert normalized_size < plain_size / 2
+
+    def test_slices_and_batches(self, normalized_client):
+        group = golden_schedule("week_group")
+        normalized_client.update_groups_many([dict(group, entity_id="gruppy:1", fingerprint="1")])
+        normalized_client.commit_updates()
+        expected = [day for week in group["weeks"] for day in week["day"] if day["day_of_week"] == "Среда"]
+        schedule = json.loads(normalized_client.get_group_schedule_full(group["table_name"], day="Среда"))
+        assert [day for week in schedule["weeks"] for day in week["day"]] == expected
+        schedule = json.loads(normalized_client.get_group_schedule_full(group["table_name"], dates=[expected[0]["date"], "31.12"]))
+        assert [day for week in schedule["weeks"] for day in week["day"]] == [day for day in expected if day["date"] == expected[0]["date"]]
+        cursor = normalized_client.find_schedules("groups", [group["table_name"]], dict(week=0))
+        [document] = normalized_client.fetch_batch(cursor, 10)
+        assert document["weeks"] == group["weeks"][:1] and "normalized" not in document
+
+    def test_room_index(self, mongo_client, normalized_client):
+        schedules = [dict(golden_schedule("week_group"), entity_id="gruppy:1", fingerprint="1")]
+        mongo_client.add_groups(schedules)
+        mongo_client.flush_writes()
+        mongo_client.build_room_index()
+        plain_rooms = list(mongo_client["next_buffer"]["rooms"].find({}, {"_id": 0}))
+        normalized_client.update_groups_many(schedules)
+        normalized_client.build_room_index()
+        assert list(normalized_client["next_buffer"]["rooms"].find({}, {"_id": 0})) == plain_rooms
+
+    def test_format_switch(self, mongo_client, normalized_client):
+        group = golden_schedule("week_group")
+        mongo_client.update_groups_many([dict(group, entity_id="gruppy:1", fingerprint="1")])
+        mongo_client.commit_updates()
+        # Клиент в другом режиме читает документы старого формата, но не переносит их
+        normalized_client.buffers = dict(mongo_client.buffers)
+        assert normalized_client.get_group_fingerprints() == dict()
+        assert mongo_client.get_group_fingerprints() == {"gruppy:1": "1"}
+        assert json.loads(normalized_client.get_group_schedule_full(group["table_name"]))["weeks"] == group["weeks"]
+
+    def test_dictionary_survives_restart(self, normalized_client):
+        group = golden_schedule("week_group")
+        normalized_client.update_groups_many([dict(group, entity_id="gruppy:1", fingerprint="1")])
+        normalized_client.commit_updates()
+        strings = normalized_client.dictionary.count_documents({})
+        restarted = DBClient("localhost", 27017, "username", "password", normalized=True)
+        assert restarted.get_group_schedule_full(group["table_name"]) == normalized_client.get_group_schedule_full(group["table_name"])
+        restarted.update_groups_many([dict(group, table_name="ИТ-222", entity_id="gruppy:2", fingerprint="1")])
+        assert restarted.dictionary.count_documents({}) == strings
+
+    def test_next_group_documents(self, normalized_client):
+        group = golden_schedule("week_group")
+        normalized_client.update_groups_many([dict(group, entity_id="gruppy:1", fingerprint="1")])
+        assert normalized_client.get_next_group_documents() == [dict(weeks=group["weeks"], nameofgroup=group["table_name"])]
+
+@pytest.fixture
+def mongo_client(monkeypatch) -> DBClient:
+    mongomock = pytest.importorskip("mongomock")
+    server = mongomock.MongoClient()
+    monkeypatch.setattr(db_client_module.pymongo, "MongoClient", lambda *args, **kwargs: server)
+    return DBClient("localhost", 27017, "username", "password")
+
+@pytest.fixture
+def filled_client(mongo_client) -> DBClient:
+    mongo_client.update_groups_many([dict(table_name=name, entity_id=f"gruppy:{index}", fingerprint=str(index), weeks=[])
+                                     for index, name in enumerate(["ПВ-221", "ИТ-222", "ИТ-221"])])
+    mongo_client.commit_updates()
+    return mongo_client
+
+@pytest.fixture
+def normalized_client(mongo_client) -> DBClient:
+    # Второй клиент к той же базе, что и mongo_client
+    return DBClient("localhost", 27017, "username", "password", normalized=True)
+
+
+def golden_schedule(name: str) -> dict:
+    path = os.path.join(os.path.dirname(__file__), "golden", "parser", "expected", f"{name}.json")
+    with open(path, encoding="utf-8") as schedule_file:
+        return json.load(schedule_file)
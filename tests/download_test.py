@@ -1,38 +1,95 @@
 import pytest
+import pytest_asyncio
 import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 from src.download_html import ScheduleDownloader
 
 @pytest.mark.asyncio
 class TestDownloader:
-    async def test_page_download_success(self, default_agent):
-        downloader = ScheduleDownloader(default_agent)
+    async def test_page_download_success(self, make_downloader):
+        downloader = make_downloader()
         response, status = await downloader.try_download_page("https://google.com")
         assert status
         assert response != ""
 
-    async def test_page_download_fail(self, default_agent):
-        downloader = ScheduleDownloader(default_agent)
+    async def test_page_download_fail(self, make_downloader):
+        downloader = make_downloader()
         response, status = await downloader.try_download_page("bruh://bruh.brom")
         assert not status
         assert response == ""
 
-    async def test_api_call_success(self, default_agent, api_url, good_api_header):
-        downloader = ScheduleDownloader(default_agent)
+    async def test_api_call_success(self, make_downloader, api_url, good_api_header):
+        downloader = make_downloader()
         response, status = await downloader.try_get_request(api_url, good_api_header, 0)
         assert status
         assert response != ""
         
-    async def test_api_call_bad(self, default_agent, api_url, bad_api_header):
-        downloader = ScheduleDownloader(default_agent)
+    async def test_api_call_bad(self, make_downloader, api_url, bad_api_header):
+        downloader = make_downloader()
         response, status = await downloader.try_get_request(api_url, bad_api_header, 0)
         assert not status
         assert response == ""
 
+    async def test_session_reused(self, make_downloader, local_server):
+        downloader = make_downloader()
+        await downloader.start()
+        session = downloader._session
+        for _ in range(3):
+            response, status = await downloader.try_download_page(str(local_server.make_url("/page")))
+            assert status
+            assert response == "ok"
+        assert downloader._session is session
+        await downloader.close()
+        assert downloader._session is None
+
+    async def test_conditional_request(self, make_downloader, local_server):
+        downloader = make_downloader(conditional_requests=True)
+        url = str(local_server.make_url("/etag"))
+        first, status = await downloader.try_download_page(url)
+        assert status
+        second, status = await downloader.try_download_page(url)
+        assert status
+        assert second == first
+        assert local_server.not_modified["count"] == 1
+
+    async def test_conditional_cache_bounded(self, make_downloader, local_server):
+        downloader = make_downloader(conditional_requests=True, validator_cache_bytes=20)
+        for path in ("/etag?page=1", "/etag?page=2", "/etag?page=3"):
+            await downloader.try_download_page(str(local_server.make_url(path)))
+        # Тело "schedule" занимает 8 байт, в лимит 20 байт помещаются два последних адреса
+        assert [url.split("=")[-1] for url in downloader._validators] == ["2", "3"]
+        assert downloader._validators_bytes == 16
+        await downloader.try_download_page(str(local_server.make_url("/etag?page=1")))
+        assert local_server.not_modified["count"] == 0
+        await downloader.try_download_page(str(local_server.make_url("/etag?page=3")))
+        assert local_server.not_modified["count"] == 1
+
+    async def test_cancel_propagates(self, make_downloader, local_server):
+        downloader = make_downloader()
+        task = asyncio.create_task(downloader.try_download_page(str(local_server.make_url("/slow"))))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        # Отмененная загрузка не превращается в неудачную попытку, которую планировщик повторит
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
 @pytest.fixture
 def default_agent() -> dict:
     agent = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:101.0) Gecko/20100101 Firefox/101.0'}
     return agent
 
+@pytest_asyncio.fixture
+async def make_downloader(default_agent):
+    # Загрузчик держит сессию с пулом соединений, закрываем ее даже после упавшей проверки
+    downloaders = []
+    def make(**kwargs) -> ScheduleDownloader:
+        downloaders.append(ScheduleDownloader(default_agent, **kwargs))
+        return downloaders[-1]
+    yield make
+    for downloader in downloaders:
+        await downloader.close()
+
 @pytest.fixture
 def good_api_header() -> dict:
     return dict(entity="gruppy", id="528", week="0", device="desktop")
@@ -44,3 +101,25 @@ def bad_api_header() -> dict:
 @pytest.fixture
 def api_url() -> str:
     return "https://t.bstu.ru/web/api/events"
+
+@pytest_asyncio.fixture
+async def local_server():
+    async def page_handler(request):
+        return web.Response(text="ok")
+    async def slow_handler(request):
+        await asyncio.sleep(10)
+        return web.Response(text="late")
+    not_modified = dict(count=0)
+    async def etag_handler(request):
+        if request.headers.get("If-None-Match") == '"v1"':
+            not_modified["count"] += 1
+            return web.Response(status=304)
+        return web.Response(text="schedule", headers={"ETag": '"v1"'})
+    app = web.Application()
+    app.add_routes([web.get("/page", page_handler), web.get("/etag", etag_handler),
+                    web.get("/slow", slow_handler)])
+    server = TestServer(app)
+    await server.start_server()
+    server.not_modified = not_modified
+    yield server
+    await server.close()
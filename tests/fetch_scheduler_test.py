@@ -0,0 +1,58 @@
+import pytest
+import asyncio
+from src.fetch_scheduler import FetchScheduler
+
+@pytest.mark.asyncio
+class TestFetchScheduler:
+    async def test_retry_until_success(self, fast_scheduler):
+        attempts = []
+        async def fetch():
+            attempts.append(1)
+            return ("ok", len(attempts) == 3)
+        result = await fast_scheduler.run("http://host/page", fetch, name="Test")
+        assert result == "ok"
+        assert len(attempts) == 3
+        assert fast_scheduler.stats["retries"] == 2
+
+    async def test_attempts_exceeded(self, fast_scheduler):
+        async def fetch():
+            return ("", False)
+        with pytest.raises(RuntimeError):
+            await fast_scheduler.run("http://host/page", fetch, name="Test", attempts=2)
+        assert fast_scheduler.stats["failures"] == 1
+
+    async def test_retry_budget_exhausted(self):
+        scheduler = FetchScheduler(rate_per_sec=0, retry_budget=1, backoff_base=0.001)
+        scheduler.new_cycle()
+        calls = []
+        async def fetch():
+            calls.append(1)
+            return ("", False)
+        with pytest.raises(RuntimeError):
+            await scheduler.run("http://host/page", fetch, name="Test", attempts=10)
+        assert len(calls) == 2
+
+    async def test_per_host_concurrency(self):
+        scheduler = FetchScheduler(max_concurrency=10, per_host_concurrency=2, rate_per_sec=0)
+        active = dict(now=0, peak=0)
+        async def fetch():
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+            await asyncio.sleep(0.01)
+            active["now"] -= 1
+            return ("ok", True)
+        await asyncio.gather(*[scheduler.run("http://host/page", fetch) for _ in range(10)])
+        assert active["peak"] == 2
+
+    async def test_limit_decreases_on_failure(self, fast_scheduler):
+        async def fetch():
+            return ("", False)
+        with pytest.raises(RuntimeError):
+            await fast_scheduler.run("http://host/page", fetch, attempts=1)
+        assert fast_scheduler.limit < fast_scheduler.max_concurrency
+
+@pytest.fixture
+def fast_scheduler() -> FetchScheduler:
+    scheduler = FetchScheduler(max_concurrency=8, rate_per_sec=0, backoff_base=0.001, backoff_max=0.01)
+    scheduler.new_cycle()
+    return scheduler
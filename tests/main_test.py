@@ -0,0 +1,409 @@
+import pytest
+import pytest_asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+# main импортирует соседние модули по именам верхнего уровня, как при запуске из src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from room_index import RoomIndex
+from response_cache import CachedResponse
+
+@pytest.mark.asyncio
+class TestScheduleHandlers:
+    async def test_default_match_finds_substring(self, client):
+        response = await client.get("/group/schedule", params=dict(name="221"))
+        assert response.status == 200
+        assert json.loads(await response.text())["nameofgroup"] == "ИТ-221"
+        response = await client.get("/teacher/schedule", params=dict(name="иван"))
+        assert json.loads(await response.text())["nameofteacher"] == "Иванов Иван Иванович"
+        response = await client.get("/group/schedule", params=dict(name="в-2"))
+        assert json.loads(await response.text())["nameofgroup"] == "ПВ-222"
+        # Промах по подстроке не уходит в базу: кандидатов нет в триграммном индексе
+        response = await client.get("/group/schedule", params=dict(name="КБ-231"))
+        assert response.status == 200 and await response.text() == ""
+
+    async def test_cache_lookups_exported(self, client):
+        for name in ("ИТ-221", " ит-221", "ПВ-222"):
+            await client.get("/group/schedule", params=dict(name=name, week="1"))
+        response = await client.get("/metrics")
+        lines = (await response.text()).splitlines()
+        assert 'response_cache_lookups_total{endpoint="/group/schedule",result="hit"} 1.0' in lines
+        assert 'response_cache_lookups_total{endpoint="/group/schedule",result="miss"} 2.0' in lines
+
+    async def test_explicit_match(self, client):
+        response = await client.get("/group/schedule", params=dict(name="221", match="prefix"))
+        assert response.status == 200 and await response.text() == ""
+        response = await client.get("/group/schedule", params=dict(name="221", match="fuzzy"))
+        assert response.status == 400
+
+@pytest.mark.asyncio
+class TestConditionalResponses:
+    async def test_etag_revalidation(self, client, large_group):
+        response = await client.get("/group/schedule", params=dict(name=large_group))
+        assert response.status == 200 and response.headers["Vary"] == "Accept-Encoding"
+        etag, last_modified = response.headers["ETag"], response.headers["Last-Modified"]
+        response = await client.get("/group/schedule", params=dict(name=large_group), headers={"If-None-Match": etag})
+        assert response.status == 304 and await response.read() == b""
+        assert response.headers["ETag"] == etag
+        response = await client.get("/group/schedule", params=dict(name=large_group), headers={"If-Modified-Since": last_modified})
+        assert response.status == 304
+        response = await client.get("/group/schedule", params=dict(name=large_group), headers={"If-None-Match": '"other"'})
+        assert response.status == 200
+
+    async def test_new_generation_changes_etag(self, client, service, large_group):
+        response = await client.get("/group/schedule", params=dict(name=large_group))
+        etag = response.headers["ETag"]
+        database = service.db_client.db_client
+        database.update_groups_many([dict(table_name=large_group, entity_id="gruppy:7", fingerprint="2", weeks=[])])
+        database.commit_updates()
+        response = await client.get("/group/schedule", params=dict(name=large_group), headers={"If-None-Match": etag})
+        assert response.status == 200 and response.headers["ETag"] != etag
+
+    async def test_negotiated_compression(self, client, large_group):
+        response = await client.get("/group/schedule", params=dict(name=large_group), headers={"Accept-Encoding": "identity"})
+        body = await response.read()
+        assert "Content-Encoding" not in response.headers and len(body) >= 1024
+        identity_etag = response.headers["ETag"]
+        for accept_encoding, encoding in (("gzip", "gzip"), ("gzip;q=0.5, br", "br")):
+            if encoding not in CachedResponse.encodings:
+                continue
+            response = await client.get("/group/schedule", params=dict(name=large_group), headers={"Accept-Encoding": accept_encoding})
+            assert response.headers["Content-Encoding"] == encoding
+            assert response.headers["ETag"] != identity_etag
+            # Клиент распаковывает тело, оно должно совпасть с несжатым
+            assert await response.read() == body
+            # Тег сжатого варианта тоже подходит для If-None-Match
+            response = await client.get("/group/schedule", params=dict(name=large_group),
+                                        headers={"Accept-Encoding": "identity", "If-None-Match": response.headers["ETag"]})
+            assert response.status == 304
+
+
+@pytest.mark.asyncio
+class TestBatchHandler:
+    async def test_ndjson_found_and_missing(self, client):
+        response = await client.post("/batch/schedule", json=dict(groups=["ИТ-221", "нет такой", " ит-221 "],
+                                                                  teachers=["Иванов Иван Иванович"]))
+        assert response.status == 200
+        assert response.headers["Content-Type"].startswith("application/x-ndjson")
+        body = await response.text()
+        assert body.endswith("\n")
+        lines = [json.loads(line) for line in body.splitlines()]
+        # Каждое запрошенное имя встречается ровно один раз, ненайденное - с пустым расписанием
+        by_name = {(line["type"], line["name"]): line["schedule"] for line in lines}
+        assert len(lines) == len(by_name) == 4
+        assert by_name[("group", "ИТ-221")]["nameofgroup"] == "ИТ-221"
+        assert by_name[("group", " ит-221 ")] == by_name[("group", "ИТ-221")]
+        assert by_name[("group", "нет такой")] is None
+        assert by_name[("teacher", "Иванов Иван Иванович")]["nameofteacher"] == "Иванов Иван Иванович"
+
+    async def test_name_limit(self, client, service):
+        service.batch_max_names = 2
+        response = await client.post("/batch/schedule", json=dict(groups=["ИТ-221", "ПВ-222"]))
+        assert response.status == 200
+        response = await client.post("/batch/schedule", json=dict(groups=["ИТ-221", "ПВ-222"], teachers=["Иванов"]))
+        assert response.status == 400
+
+    async def test_bad_body(self, client):
+        for body in ("{", "[]", '{"groups": "ИТ-221"}', '{"groups": [221]}'):
+            response = await client.post("/batch/schedule", data=body, headers={"Content-Type": "application/json"})
+            assert response.status == 400
+
+
+@pytest.mark.asyncio
+class TestSearchHandler:
+    async def test_limit(self, client, service):
+        await service._rebuild_indexes()
+        response = await client.get("/search", params=dict(q="ит"))
+        assert response.status == 200
+        response = await client.get("/search", params=dict(q="ит", type="group", limit="1"))
+        assert [result["name"] for result in json.loads(await response.text())["results"]] == ["ИТ-221"]
+        service.search_max_limit = 1
+        response = await client.get("/search", params=dict(q="-22", type="group", limit="10"))
+        assert len(json.loads(await response.text())["results"]) == 1
+        for params in (dict(q="ит", limit="-1"), dict(q="ит", limit="0"), dict(q="ит", limit="много"),
+                       dict(q="ит", type="room"), dict(limit="5")):
+            response = await client.get("/search", params=params)
+            assert response.status == 400
+
+    async def test_reads_index_after_generation_flip(self, client, service):
+        await service._rebuild_indexes()
+        response = await client.get("/search", params=dict(q="кб-231", type="group"))
+        assert json.loads(await response.text())["results"] == []
+        database = service.db_client.db_client
+        database.update_groups_many([dict(table_name="КБ-231", entity_id="gruppy:9", fingerprint="1", weeks=[])])
+        database.commit_updates()
+        await service._rebuild_indexes()
+        response = await client.get("/search", params=dict(q="кб-213", type="group"))
+        assert [result["name"] for result in json.loads(await response.text())["results"]] == ["КБ-231"]
+        # Группы прошлого поколения в новом индексе не ищутся
+        response = await client.get("/search", params=dict(q="ИТ-221", type="group"))
+        assert "ИТ-221" not in [result["name"] for result in json.loads(await response.text())["results"]]
+
+
+@pytest.mark.asyncio
+class TestRoomHandlers:
+    async def test_free_rooms(self, client, service):
+        service.room_index = RoomIndex([dict(room="УК1 101", slots=[dict(date="01.09", number="1")]),
+                                        dict(room="УК2 202", slots=[])],
+                                       dict(dates=["01.09", "02.09"], numbers=["1", "2"]))
+        response = await client.get("/room/free", params=dict(date="01.09", number="1"))
+        assert json.loads(await response.text())["free_rooms"] == ["УК2 202"]
+        # Известный день без пар
+        response = await client.get("/room/free", params=dict(date="02.09", number="1"))
+        assert json.loads(await response.text())["free_rooms"] == ["УК1 101", "УК2 202"]
+
+    async def test_today_in_service_timezone(self, client, service, monkeypatch):
+        import main
+        class FixedDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                # 16.10 22:30 по UTC - в Москве уже 17.10
+                return datetime(2026, 10, 16, 22, 30, tzinfo=timezone.utc).astimezone(tz)
+        monkeypatch.setattr(main, "datetime", FixedDatetime)
+        service.room_index = RoomIndex([dict(room="УК1 101", slots=[])], dict(dates=["16.10", "17.10"], numbers=["1"]))
+        response = await client.get("/room/free", params=dict(number="1"))
+        assert json.loads(await response.text())["date"] == "17.10"
+        service.timezone = timezone.utc
+        response = await client.get("/room/free", params=dict(number="1"))
+        assert json.loads(await response.text())["date"] == "16.10"
+
+    async def test_unknown_slot(self, client, service):
+        service.room_index = RoomIndex([dict(room="УК1 101", slots=[dict(date="01.09", number="1")])],
+                                       dict(dates=["01.09"], numbers=["1"]))
+        for params in (dict(date="31.12", number="1"), dict(date="01.09", number="9")):
+            response = await client.get("/room/free", params=params)
+            assert response.status == 404
+
+
+@pytest.mark.asyncio
+class TestHeaderCache:
+    async def test_revalidate_period(self, service):
+        database = service.db_client.db_client
+        database.update_cached_headers({url: dict(entity="gruppy", id=url[-1]) for url in ("fresh/1", "stale/2")})
+        database.header_cache.update_one({"_id": "stale/2"}, {"$set": {"checked_at": time.time() - service.header_cache_revalidate_period - 1}})
+        items = [dict(url=url) for url in ("fresh/1", "stale/2", "new/3")]
+        await service._reuse_cached_headers(items)
+        assert items == [dict(url="fresh/1", header=dict(entity="gruppy", id="1"), header_cached=True),
+                         dict(url="stale/2"), dict(url="new/3")]
+
+    async def test_cached_header_failure_refetches_page(self, service, monkeypatch):
+        stale_header = dict(table_name="ИТ-221", entity="gruppy", device="desktop", id="1")
+        requested = []
+        async def get_server_response(header, week_indexes, attempts=None):
+            requested.append(header["id"])
+            if header == stale_header:
+                raise RuntimeError("API request failed")
+            return [dict(result=dict(html=dict(week=f"<week {index}>"), week=dict(is_denominator=bool(index))))
+                    for index in week_indexes]
+        async def download_html_page(url, url_name, attempts=None):
+            return golden_page("header_group.html")
+        monkeypatch.setattr(service, "_get_server_response", get_server_response)
+        monkeypatch.setattr(service, "_download_html_page", download_html_page)
+        item = dict(kind="groups", url="https://t.bstu.ru/raspisaniya/gruppy/1042", name="Group header 0",
+                    header=stale_header, header_cached=True)
+        item = await service._fetch_weeks_stage(item)
+        assert requested == ["1", "1042"]
+        assert item["header"]["id"] == "1042" and "header_cached" not in item
+        assert item["schedule_html"] == dict(html=["<week 0>", "<week 1>"], is_denominator=[False, True])
+        # Свежий заголовок сохранен в кэш
+        assert service.db_client.db_client.get_cached_headers()[item["url"]]["header"] == item["header"]
+
+    async def test_fresh_header_failure_raises(self, service, monkeypatch):
+        async def get_server_response(header, week_indexes, attempts=None):
+            raise RuntimeError("API request failed")
+        monkeypatch.setattr(service, "_get_server_response", get_server_response)
+        with pytest.raises(RuntimeError):
+            await service._fetch_weeks_stage(dict(kind="groups", url="gruppy/1", name="Group header 0", header=dict(id="1")))
+
+
+@pytest.mark.asyncio
+class TestProfileHandler:
+    async def test_admin_token(self, client, service):
+        response = await client.get("/admin/profile", headers={"X-Admin-Token": "secret"})
+        assert response.status == 404
+        service.admin_token = "secret"
+        response = await client.get("/admin/profile", headers={"X-Admin-Token": "secret"})
+        assert response.status == 200
+        for headers in (dict(), {"X-Admin-Token": "secres"}, {"X-Admin-Token": "секрет".encode("utf-8").decode("latin-1")}):
+            response = await client.get("/admin/profile", headers=headers)
+            assert response.status == 403
+
+
+@pytest.mark.asyncio
+class TestUpdatePipeline:
+    async def test_parse_stages_fill_the_pool(self, service, monkeypatch):
+        import main
+        monkeypatch.setenv("PARSE_WORKERS", "8")
+        monkeypatch.setenv("PIPELINE_PARSE_WORKERS", "2")
+        pooled = main.ScheduleService()
+        # Каждый обработчик стадии держит в пуле одну пачку, обработчиков не меньше процессов
+        assert pooled.pipeline_parse_workers == 8
+        await pooled.downloader.close()
+        await pooled.db_client.close()
+
+    async def test_written_schedules_released(self, service):
+        items = [dict(kind="groups", url="gruppy/5", verify=False, entity_id="gruppy:5", header=dict(id="5"),
+                      schedule=dict(table_name="Г-5", entity_id="gruppy:5", fingerprint="1", weeks=[])),
+                 dict(kind="teachers", url="prepodavateli/7", verify=True, entity_id="prepodavateli:7", header=dict(id="7"),
+                      schedule=dict(table_name="Петров Петр Петрович", entity_id="prepodavateli:7", fingerprint="1", weeks=[])),
+                 dict(kind="groups", url="gruppy/1", verify=False, entity_id="gruppy:1", header=dict(id="1"), schedule=None)]
+        verified = []
+        await service._write_stage(verified, items)
+        await service.db_client.flush_writes()
+        assert service.db_client.db_client["next_buffer"]["groups"].count_documents({}) == 2
+        # В памяти остается только выборка для проверки выведенных преподов
+        assert verified == [items[1]] and items[1]["schedule"]["table_name"] == "Петров Петр Петрович"
+        assert all("schedule" not in item and "header" not in item for item in (items[0], items[2]))
+
+
+@pytest.mark.asyncio
+class TestUpdateFailures:
+    async def test_retry_budget_exhausted_mid_cycle(self, bstu, updating_service):
+        await updating_service._update_cycle()
+        assert updating_service.db_client.generation == 1
+        kept = await updating_service.db_client.get_group_schedule_full("Г-1", "exact")
+        # Во втором цикле все расписания меняются, но для двух групп API отвечает ошибкой,
+        # и бюджета повторов на них не хватает
+        events = bstu.corpus.events
+        bstu.corpus.events = lambda entity, entity_id, week: None if entity_id in ("1", "2") else events(entity, entity_id, week)
+        bstu.corpus.revision = 1
+        await updating_service._update_cycle()
+        assert updating_service.fetch_scheduler.stats["retries"] == 2
+        assert updating_service.db_client.generation == 2
+        assert await updating_service.db_client.get_group_schedule_full("Г-1", "exact") == kept
+        assert await updating_service.db_client.get_group_schedule_full("Г-0", "exact") != ""
+        assert json.loads(await updating_service.db_client.get_group_list())["group_names"] == ["Г-0", "Г-1", "Г-2", "Г-3"]
+
+    async def test_bad_upstream_data_kept_per_entity(self, bstu, updating_service):
+        await updating_service._update_cycle()
+        kept = [await updating_service.db_client.get_group_schedule_full(name, "exact") for name in ("Г-1", "Г-2")]
+        # Страница заголовка без заголовка и ответ API неожиданного формата
+        page, events = bstu.corpus.page, bstu.corpus.events
+        bstu.corpus.page = lambda path: "<html><body></body></html>" if path.endswith("gruppy/1") else page(path)
+        bstu.corpus.events = lambda entity, entity_id, week: (dict(success=True, result=dict()) if entity_id == "2"
+                                                              else events(entity, entity_id, week))
+        bstu.corpus.revision = 1
+        updating_service.db_client.db_client.header_cache.delete_many({})
+        await updating_service._update_cycle()
+        assert updating_service.db_client.generation == 2
+        assert [await updating_service.db_client.get_group_schedule_full(name, "exact") for name in ("Г-1", "Г-2")] == kept
+
+    async def test_aborted_cycle_keeps_serving(self, bstu, updating_service, monkeypatch):
+        await updating_service._update_cycle()
+        group_list = await updating_service.db_client.get_group_list()
+        database = updating_service.db_client.db_client
+        build_room_index_ok = database.build_room_index
+        def build_room_index():
+            raise ValueError("broken index")
+        monkeypatch.setattr(database, "build_room_index", build_room_index)
+        bstu.corpus.revision = 1
+        await updating_service._update_cycle()
+        assert updating_service.is_ready and database.generation == 1
+        assert await updating_service.db_client.get_group_list() == group_list
+        # Остатки прерванного цикла не переходят в следующий
+        assert database["next_buffer"]["groups"].count_documents({}) == 0
+        assert not any(database._pending_writes.values())
+        monkeypatch.setattr(database, "build_room_index", build_room_index_ok)
+        await updating_service._update_cycle()
+        assert database.generation == 2
+
+    async def test_upstream_down(self, bstu, updating_service):
+        bstu.error_rate = 1.0
+        await updating_service._update_cycle()
+        assert not updating_service.is_ready and updating_service.db_client.generation == 0
+
+
+@pytest.fixture
+def service(monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    import db_client
+    import main
+    server = mongomock.MongoClient()
+    monkeypatch.setattr(db_client.pymongo, "MongoClient", lambda *args, **kwargs: server)
+    service = main.ScheduleService()
+    database = service.db_client.db_client
+    emulate_carry_forward(database, monkeypatch)
+    database.update_groups_many([dict(table_name=name, entity_id=f"gruppy:{index}", fingerprint="1", weeks=[])
+                                 for index, name in enumerate(["ИТ-221", "ПВ-222"])])
+    database.update_teachers_many([dict(table_name="Иванов Иван Иванович", entity_id="prepodavateli:1", fingerprint="1", weeks=[])])
+    database.commit_updates()
+    service.is_ready = True
+    return service
+
+@pytest.fixture
+def large_group(service) -> str:
+    # Тело ответа больше порога сжатия CachedResponse
+    days = [dict(day_of_week="пн", date=f"{day:02}.09", subjects=[dict(number="1", name="Математика", teacher=["Иванов И.И."])])
+            for day in range(1, 29)]
+    database = service.db_client.db_client
+    database.update_groups_many([dict(table_name="МТ-231", entity_id="gruppy:7", fingerprint="1",
+                                      weeks=[dict(week_status="числитель", day=days)])])
+    database.commit_updates()
+    return "МТ-231"
+
+@pytest_asyncio.fixture
+async def client(service):
+    app = web.Application()
+    app.add_routes([web.get("/group/schedule", service.group_schedule_full_handler),
+                    web.get("/teacher/schedule", service.teacher_schedule_full_handler),
+                    web.get("/search", service.search_handler),
+                    web.post("/batch/schedule", service.batch_schedule_handler),
+                    web.get("/room/free", service.room_free_handler),
+                    web.get("/metrics", service.metrics_handler),
+                    web.get("/admin/profile", service.profile_handler)])
+    # Подстроку в режиме auto сервис ищет по индексу имен, как после запуска с примененным расписанием
+    await service._rebuild_indexes()
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    yield client
+    await client.close()
+    await service.downloader.close()
+    await service.db_client.close()
+
+@pytest_asyncio.fixture
+async def bstu():
+    from benchmarks.fake_bstu import FakeBSTU, SyntheticCorpus
+    server = FakeBSTU(SyntheticCorpus(groups=4, teachers=3))
+    server.base_url = await server.start()
+    yield server
+    await server.stop()
+
+@pytest_asyncio.fixture
+async def updating_service(bstu, monkeypatch):
+    mongomock = pytest.importorskip("mongomock")
+    import db_client
+    import main
+    server = mongomock.MongoClient()
+    monkeypatch.setattr(db_client.pymongo, "MongoClient", lambda *args, **kwargs: server)
+    for name, value in dict(SCHEDULE_BASE_URL=bstu.base_url,
+                            SCHEDULE_TEACHER_LIST_URL=bstu.base_url + "/raspisaniya/prepodavateli",
+                            SCHEDULE_GROUP_LIST_URL=bstu.base_url + "/raspisaniya/gruppy",
+                            SCHEDULE_API_URL=bstu.base_url + "/web/api/events",
+                            FETCH_RATE_PER_SEC="0", FETCH_RETRY_BUDGET="2", DB_WRITE_BATCH_SIZE="2",
+                            FETCH_BACKOFF_BASE_SECS="0.001", FETCH_BACKOFF_MAX_SECS="0.001").items():
+        monkeypatch.setenv(name, value)
+    service = main.ScheduleService()
+    emulate_carry_forward(service.db_client.db_client, monkeypatch)
+    yield service
+    await service.downloader.close()
+    await service.db_client.close()
+
+
+
+def emulate_carry_forward(database, monkeypatch):
+    # mongomock не умеет $unset и $merge, переносим документы теми же upsert-ами по (name_key, entity_id)
+    def carry_forward(kind, entity_ids):
+        for document in database["current_buffer"][kind].find({"entity_id": {"$in": entity_ids}}, {"_id": 0}):
+            database["next_buffer"][kind].replace_one({"name_key": document["name_key"], "entity_id": document["entity_id"]},
+                                                      document, upsert=True)
+    monkeypatch.setattr(database, "_carry_forward", carry_forward)
+
+def golden_page(file_name: str) -> str:
+    path = os.path.join(os.path.dirname(__file__), "golden", "parser", file_name)
+    with open(path, encoding="utf-8") as page_file:
+        return page_file.read()
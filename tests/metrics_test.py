@@ -0,0 +1,69 @@
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from src.metrics import MetricsRegistry, metrics_middleware
+
+class TestMetrics:
+    def test_counter(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("requests_total", "Запросы", ("kind",))
+        counter.inc(kind="page")
+        counter.inc(2, kind="page")
+        assert counter.value(kind="page") == 3
+        assert registry.counter("requests_total", "Запросы", ("kind",)) is counter
+        assert 'requests_total{kind="page"} 3.0' in registry.render()
+        with pytest.raises(ValueError):
+            counter.inc(kind="page", extra="x")
+        with pytest.raises(ValueError):
+            counter.inc(-1, kind="page")
+
+    def test_histogram(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("phase_seconds", "Фазы", ("phase",), buckets=(1, 5))
+        histogram.observe(0.5, phase="commit")
+        histogram.observe(3, phase="commit")
+        histogram.observe(10, phase="commit")
+        lines = registry.render().splitlines()
+        assert "# TYPE phase_seconds histogram" in lines
+        assert 'phase_seconds_bucket{phase="commit",le="1.0"} 1' in lines
+        assert 'phase_seconds_bucket{phase="commit",le="5.0"} 2' in lines
+        assert 'phase_seconds_bucket{phase="commit",le="+Inf"} 3' in lines
+        assert 'phase_seconds_sum{phase="commit"} 13.5' in lines
+        assert 'phase_seconds_count{phase="commit"} 3' in lines
+
+    def test_timer_on_error(self):
+        histogram = MetricsRegistry().histogram("seconds", "Время")
+        with pytest.raises(RuntimeError):
+            with histogram.time():
+                raise RuntimeError()
+        assert histogram.count() == 1
+
+    def test_label_escaping(self):
+        registry = MetricsRegistry()
+        registry.counter("total", "Счетчик", ("name",)).inc(name='a"b\\c')
+        assert 'total{name="a\\"b\\\\c"} 1.0' in registry.render()
+
+@pytest.mark.asyncio
+class TestMiddleware:
+    async def test_route_labels(self):
+        registry = MetricsRegistry()
+        async def handler(request):
+            return web.Response(text=request.match_info["name"])
+        async def fail(request):
+            raise web.HTTPBadRequest()
+        app = web.Application(middlewares=[metrics_middleware(registry)])
+        app.add_routes([web.get("/group/{name}", handler), web.get("/fail", fail)])
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        try:
+            await client.get("/group/a")
+            await client.get("/group/b")
+            await client.get("/fail")
+            await client.get("/missing")
+        finally:
+            await client.close()
+        text = registry.render()
+        assert 'http_responses_total{route="/group/{name}",method="GET",status="200"} 2.0' in text
+        assert 'http_responses_total{route="/fail",method="GET",status="400"} 1.0' in text
+        assert 'status="404"' in text
+        assert 'http_request_duration_seconds_count{route="/group/{name}",method="GET"} 2' in text
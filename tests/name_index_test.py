@@ -0,0 +1,43 @@
+import pytest
+from src.name_index import TrigramIndex
+
+class TestTrigramIndex:
+    def test_exact_first(self, index):
+        assert index.search("ИТ-221", 3)[0][0] == "ИТ-221"
+
+    def test_typo_and_punctuation(self, index):
+        assert index.search("ит221", 1)[0][0] == "ИТ-221"
+        assert index.search("Абакумв Роман", 1)[0][0] == "Абакумов Роман Григорьевич"
+
+    def test_prefix(self, index):
+        names = [name for name, _ in index.search("ит-22", 2)]
+        assert sorted(names) == ["ИТ-221", "ИТ-222"]
+
+    def test_scores_sorted_and_limited(self, index):
+        results = index.search("иван", 2)
+        assert len(results) == 2
+        assert results[0][1] >= results[1][1]
+        assert results[0][0] == "Иванов Иван Иванович"
+
+    def test_empty(self, index):
+        assert index.search("", 5) == []
+        assert index.search("---", 5) == []
+        assert TrigramIndex([]).search("ИТ", 5) == []
+
+    def test_containing(self, index):
+        assert index.containing("221") == ["ИТ-221", "ПВ-221"]
+        assert index.containing("в-2") == ["ПВ-221"]
+        assert index.containing("иван ив") == ["Иванов Иван Иванович"]
+        assert index.containing("ж") == []
+        assert index.containing("221ж") == []
+
+    def test_large_index(self):
+        names = [f"Г{letter}-{number}" for letter in "АБВГДЕЖЗИКЛМНОПРСТУФ" for number in range(100, 200)]
+        index = TrigramIndex(names)
+        assert index.search("гк15о", 1)[0][0].startswith("ГК-15")
+        assert index.search("ГК-150", 1)[0][0] == "ГК-150"
+
+@pytest.fixture
+def index() -> TrigramIndex:
+    return TrigramIndex(["ИТ-221", "ИТ-222", "ПВ-221", "Абакумов Роман Григорьевич",
+                         "Иванов Иван Иванович", "Иванова Анна Сергеевна"])
@@ -0,0 +1,53 @@
+import pytest
+from src.parse_html import ScheduleParser
+from src.parse_executor import ParseExecutor
+
+@pytest.mark.asyncio
+class TestParseExecutor:
+    async def test_headers_match_in_process(self, header_html):
+        parser = ScheduleParser()
+        executor = ParseExecutor(parser, workers=2, batch_size=2)
+        headers_html = [header_html.format(id=index) for index in range(5)]
+        headers = await executor.get_schedule_headers(headers_html)
+        await executor.close()
+        assert headers == [parser.get_schedule_header(html) for html in headers_html]
+
+    async def test_schedules_match_in_process(self, week_html):
+        parser = ScheduleParser()
+        header = dict(table_name="ИТ-221", entity="gruppy", id="1", device="desktop")
+        items = [([week_html, week_html], header, [False, True]) for _ in range(5)]
+        in_process = await ParseExecutor(parser).parse_full_many(items)
+        executor = ParseExecutor(parser, workers=2, batch_size=3)
+        in_pool = await executor.parse_full_many(items)
+        await executor.close()
+        assert in_pool == in_process
+        assert in_pool[0] == parser.parse_full(*items[0])
+
+    async def test_return_exceptions(self, header_html):
+        headers_html = [header_html.format(id=1), "<html><body>нет заголовка</body></html>", header_html.format(id=3)]
+        for workers in (0, 2):
+            executor = ParseExecutor(ScheduleParser("lxml"), workers=workers, batch_size=3)
+            with pytest.raises(ValueError):
+                await executor.get_schedule_headers(headers_html)
+            # Одна плохая страница не роняет пачку
+            headers = await executor.get_schedule_headers(headers_html, return_exceptions=True)
+            await executor.close()
+            assert [header["id"] for header in (headers[0], headers[2])] == ["1", "3"]
+            assert isinstance(headers[1], ValueError)
+
+    async def test_empty_input(self):
+        executor = ParseExecutor(ScheduleParser(), workers=2)
+        assert await executor.parse_full_many([]) == []
+        await executor.close()
+
+@pytest.fixture
+def header_html() -> str:
+    return ('<html><body><h1 class="title"> ИТ-221 </h1>'
+            '<div class="_timetable_page offset" data-entity="gruppy" data-strategy="desktop" data-id="{id}"></div>'
+            '</body></html>')
+
+@pytest.fixture
+def week_html() -> str:
+    return ('<div class="week__day">\nПн\n01.09\n1\nЛекция\nМатематика\n08:00\n-\n09:35\nУК1 101\nИванов И.И.\n'
+            'Перерыв\n09:35\n2\nПрактика\nФизика\n09:45\n-\n11:20\nУК2 202\nПетров П.П.\n</div>'
+            '<div class="week__day">\nВт\n02.09\nНет занятий\n</div>')
@@ -0,0 +1,68 @@
+import pytest
+import json
+from src.parse_html import ScheduleParser
+from tests.synthetic_pages import header_page, week_page, group_list_page, teacher_list_page, GROUPS, TEACHER_NAMES
+
+class TestParserEngines:
+    @pytest.mark.parametrize("seed", range(10))
+    def test_parse_full_identical(self, parsers, seed):
+        for_group = seed % 2 == 0
+        header = dict(table_name=GROUPS[0] if for_group else TEACHER_NAMES[0])
+        pages = [week_page(seed, for_group), week_page(seed + 100, for_group)]
+        results = [json.dumps(parser.parse_full(pages, header, [False, True])) for parser in parsers]
+        assert results[0] == results[1]
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_schedule_header_identical(self, parsers, seed):
+        page = header_page(GROUPS[seed], "gruppy", str(seed), seed=seed)
+        headers = [parser.get_schedule_header(page) for parser in parsers]
+        assert headers[0] == headers[1]
+        assert list(headers[0]) == list(headers[1])
+
+    def test_urls_identical(self, parsers):
+        base_url = "https://t.bstu.ru"
+        assert parsers[0].get_group_urls(group_list_page(30), base_url) == parsers[1].get_group_urls(group_list_page(30), base_url)
+        assert parsers[0].get_teacher_urls(teacher_list_page(30), base_url) == parsers[1].get_teacher_urls(teacher_list_page(30), base_url)
+        links = [parser.get_teacher_links(teacher_list_page(30), base_url) for parser in parsers]
+        assert links[0] == links[1]
+        assert [link["url"] for link in links[0]] == parsers[0].get_teacher_urls(teacher_list_page(30), base_url)
+        assert links[0][0]["name"] == f"{TEACHER_NAMES[1]} 1"
+
+    def test_unknown_engine(self):
+        with pytest.raises(ValueError):
+            ScheduleParser("html5lib")
+
+class TestRawDataParsing:
+    def test_group_day(self):
+        raw_data = [["ИТ-221", "Числитель"],
+                    ["Пн", "01.09", "1", "Лекция", "Физика", "08:00", "-", "09:35", "УК1 101", "ГУК 2",
+                     "Иванов И.И.", "Перерыв", "13:05", "2", "Практика", "Философия", "13:20", "-", "14:55",
+                     "Петров П.П."],
+                    ["Вт", "02.09", "Нет занятий"]]
+        schedule = ScheduleParser()._parse_raw_data_to_dict(raw_data)
+        assert schedule == {"week_status": "Числитель", "day": [
+            {"day_of_week": "Понедельник", "date": "01.09", "subjects": [
+                {"number": "1", "type": "Лекция", "name": "Физика", "start": "08:00", "end": "09:35",
+                 "classroom": ["УК1 101", "ГУК 2"], "teacher": ["Иванов И.И."]},
+                {"name": "Перерыв 1 час"},
+                {"number": "2", "type": "Практика", "name": "Философия", "start": "13:20", "end": "14:55",
+                 "classroom": [], "teacher": ["Петров П.П."]}]},
+            {"day_of_week": "Вторник", "date": "02.09", "subjects": []}]}
+
+    def test_teacher_day_truncated(self):
+        raw_data = [["Иванов Иван Иванович", "Знаменатель"],
+                    ["Ср", "03.09", "1", "Лекция", "Физика", "08:00"]]
+        schedule = ScheduleParser()._parse_raw_data_to_dict(raw_data)
+        assert schedule["day"][0]["subjects"] == [
+            {"number": "1", "type": "Лекция", "name": "Физика", "start": "08:00", "end": None,
+             "classroom": [], "group": []}]
+
+    def test_long_day(self):
+        lesson = ["1", "Лекция", "Физика", "08:00", "-", "09:35", "УК1 101", "Иванов И.И."]
+        raw_data = [["ИТ-221", "Числитель"], ["Чт", "04.09"] + lesson * 5000]
+        schedule = ScheduleParser()._parse_raw_data_to_dict(raw_data)
+        assert len(schedule["day"][0]["subjects"]) == 5000
+
+@pytest.fixture
+def parsers() -> list[ScheduleParser]:
+    return [ScheduleParser("bs4"), ScheduleParser("lxml")]
@@ -0,0 +1,115 @@
+"""Эталонные результаты ScheduleParser
+
+Входные страницы и ожидаемые результаты лежат в tests/golden/parser, список
+случаев - в cases.json. Оба движка должны выдавать ровно эталон.
+
+Страницы недель в cases.json синтетические: они собраны вручную по разметке
+t.bstu.ru и покрывают известные варианты (пары потока, несколько аудиторий,
+перерывы, пустые дни), но не доказывают, что парсер
+понимает настоящую страницу целиком. Настоящие недели группы и препода
+добавляются из корпуса benchmarks/record_corpus.py (нужен доступ к сети):
+    python benchmarks/record_corpus.py corpus.json --groups 1 --teachers 1
+    python -m tests.parser_golden_test --import-corpus corpus.json
+Вторая команда кладет недели первой группы и первого препода корпуса в
+recorded_*.html, описывает случаи в recorded.json и перезаписывает эталоны.
+Эталон записанной недели - результат текущего парсера, поэтому его нужно
+просмотреть глазами перед коммитом.
+
+После намеренного изменения поведения парсера эталоны перезаписываются командой
+из корня репозитория:
+    python -m tests.parser_golden_test
+"""
+
+import argparse
+
+import json
+import os
+import pytest
+from src.parse_html import ScheduleParser
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "parser")
+BASE_URL = "https://t.bstu.ru"
+
+
+def read_page(file_name: str) -> str:
+    with open(os.path.join(GOLDEN_DIR, file_name), encoding="utf-8") as page_file:
+        return page_file.read()
+
+
+def load_cases() -> dict[str, list[dict]]:
+    with open(os.path.join(GOLDEN_DIR, "cases.json"), encoding="utf-8") as cases_file:
+        cases = json.load(cases_file)
+    # Записанные с сервера недели, если их добавили через --import-corpus
+    if os.path.exists(recorded_path := os.path.join(GOLDEN_DIR, "recorded.json")):
+        with open(recorded_path, encoding="utf-8") as recorded_file:
+            for method, recorded_cases in json.load(recorded_file).items():
+                cases.setdefault(method, []).extend(recorded_cases)
+    return cases
+
+
+def import_corpus(corpus_path: str):
+    """Добавить в эталоны недели первой группы и первого препода из корпуса record_corpus.py"""
+
+    parser = ScheduleParser("bs4")
+    with open(corpus_path, encoding="utf-8") as corpus_file:
+        corpus = json.load(corpus_file)
+    recorded_cases = []
+    for entity, kind in (("gruppy", "group"), ("prepodavateli", "teacher")):
+        page_path = min(path for path in corpus["pages"] if path.startswith(f"/raspisaniya/{entity}/"))
+        header = parser.get_schedule_header(corpus["pages"][page_path])
+        case = dict(name=f"recorded_{kind}", files=[], table_name=header["table_name"], is_denominator=[])
+        for week in range(2):
+            response = corpus["events"][f"{header['entity']}:{header['id']}:{week}"]
+            case["files"].append(f"recorded_{kind}_{week + 1}.html")
+            case["is_denominator"].append(response["result"]["week"]["is_denominator"])
+            with open(os.path.join(GOLDEN_DIR, case["files"][-1]), "w", encoding="utf-8") as page_file:
+                page_file.write(response["result"]["html"]["week"])
+        recorded_cases.append(case)
+        print(f"Recorded {page_path} as {case['name']}")
+    with open(os.path.join(GOLDEN_DIR, "recorded.json"), "w", encoding="utf-8") as recorded_file:
+        recorded_file.write(dump(dict(parse_full=recorded_cases)))
+
+
+def run_case(parser: ScheduleParser, method: str, case: dict):
+    if method == "group_urls":
+        return parser.get_group_urls(read_page(case["file"]), BASE_URL)
+    if method == "teacher_urls":
+        return parser.get_teacher_urls(read_page(case["file"]), BASE_URL)
+    if method == "schedule_header":
+        return parser.get_schedule_header(read_page(case["file"]))
+    return parser.parse_full([read_page(file_name) for file_name in case["files"]],
+                             dict(table_name=case["table_name"]), case["is_denominator"])
+
+
+def expected_path(case: dict) -> str:
+    return os.path.join(GOLDEN_DIR, "expected", f"{case['name']}.json")
+
+
+def dump(result) -> str:
+    return json.dumps(result, ensure_ascii=False, indent=1) + "\n"
+
+
+CASES = [(method, case) for method, cases in load_cases().items() for case in cases]
+
+
+class TestParserGolden:
+    @pytest.mark.parametrize("engine", ScheduleParser.engines)
+    @pytest.mark.parametrize("method,case", CASES, ids=[case["name"] for _, case in CASES])
+    def test_matches_golden(self, engine, method, case, capsys):
+        result = run_case(ScheduleParser(engine), method, case)
+        with open(expected_path(case), encoding="utf-8") as expected_file:
+            # Сравнение текстом проверяет и порядок ключей, который виден в ответах API
+            assert dump(result) == expected_file.read()
+
+
+if __name__ == "__main__":
+    argument_parser = argparse.ArgumentParser(description="Перезаписать эталоны парсера")
+    argument_parser.add_argument("--import-corpus", metavar="CORPUS", help="сначала добавить недели из корпуса record_corpus.py")
+    arguments = argument_parser.parse_args()
+    if arguments.import_corpus:
+        import_corpus(arguments.import_corpus)
+    parser = ScheduleParser("bs4")
+    for method, case in [(method, case) for method, cases in load_cases().items() for case in cases]:
+        with open(expected_path(case), "w", encoding="utf-8") as expected_file:
+            expected_file.write(dump(run_case(parser, method, case)))
+        print(f"Updated {expected_path(case)}")
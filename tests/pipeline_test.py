@@ -0,0 +1,69 @@
+import pytest
+import asyncio
+from src.pipeline import PipelineStage, run_pipeline
+
+@pytest.mark.asyncio
+class TestPipeline:
+    async def test_all_items_pass(self):
+        written = []
+        async def double(item):
+            await asyncio.sleep(0)
+            return item * 2
+        async def write(items):
+            written.extend(items)
+            return items
+        stats = await run_pipeline(range(100), [PipelineStage("double", double, workers=4),
+                                                PipelineStage("write", write, batch_size=10)], queue_size=5)
+        assert sorted(written) == [item * 2 for item in range(100)]
+        assert stats["write"]["processed"] == 100
+        assert stats["write"]["first_output"] is not None
+
+    async def test_none_drops_item(self):
+        written = []
+        async def only_even(item):
+            return item if item % 2 == 0 else None
+        async def write(item):
+            written.append(item)
+        await run_pipeline(range(10), [PipelineStage("filter", only_even), PipelineStage("write", write)])
+        assert sorted(written) == [0, 2, 4, 6, 8]
+
+    async def test_backpressure(self):
+        in_flight = dict(now=0, peak=0)
+        async def produce(item):
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+            return item
+        async def slow_consume(item):
+            await asyncio.sleep(0.001)
+            in_flight["now"] -= 1
+        await run_pipeline(range(200), [PipelineStage("produce", produce, workers=8),
+                                        PipelineStage("consume", slow_consume)], queue_size=4)
+        # Очередь + обработчики обеих стадий
+        assert in_flight["peak"] <= 4 + 8 + 1
+
+    async def test_error_propagates(self):
+        async def fail(item):
+            if item == 5:
+                raise RuntimeError("bad item")
+            return item
+        async def write(item):
+            return item
+        with pytest.raises(RuntimeError):
+            await run_pipeline(range(100), [PipelineStage("fail", fail, workers=2), PipelineStage("write", write)])
+
+    async def test_workers_stopped_on_error(self):
+        finished = []
+        async def fetch(item):
+            if item == 3:
+                raise RuntimeError("bad item")
+            await asyncio.sleep(0.2)
+            finished.append(item)
+            return item
+        async def write(item):
+            return item
+        with pytest.raises(RuntimeError):
+            await run_pipeline(range(100), [PipelineStage("fetch", fetch, workers=8), PipelineStage("write", write)])
+        # Соседние обработчики упавшей стадии отменены и дождались, а не работают дальше
+        assert not [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        await asyncio.sleep(0.3)
+        assert finished == []
@@ -0,0 +1,116 @@
+import pstats
+import tracemalloc
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from src.profiling import Profiler, profiling_middleware
+
+@pytest.mark.asyncio
+class TestProfiler:
+    async def test_not_armed(self, profiler):
+        async with profiler.session("update"):
+            busy_loop()
+        assert profiler.last_summary is None
+        assert profiler.active is None
+
+    async def test_update_session(self, profiler):
+        profiler.arm("update")
+        async with profiler.session("update"):
+            assert profiler.active == "update"
+            busy_loop()
+        summary = profiler.last_summary
+        assert summary["target"] == "update"
+        assert profiler.status()["armed"] == dict()
+        assert any("busy_loop" in row["function"] for row in summary["functions"])
+        assert any("<genexpr>" in row["function"] for row in summary["hot_functions"])
+        hot_seconds = [row["total_seconds"] for row in summary["hot_functions"]]
+        assert hot_seconds == sorted(hot_seconds, reverse=True)
+        assert len(summary["functions"]) <= profiler.top
+        assert all(row.keys() == {"location", "size_kb", "count"} for row in summary["allocations"])
+        assert pstats.Stats(summary["pstats_path"]).total_calls > 0
+        assert tracemalloc.Snapshot.load(summary["snapshot_path"]) is not None
+        assert not tracemalloc.is_tracing()
+        # Сессия одноразовая, следующий цикл не профилируется
+        async with profiler.session("update"):
+            pass
+        assert profiler.last_summary is summary
+
+    async def test_one_session_at_a_time(self, profiler):
+        profiler.arm("update")
+        profiler.arm("requests", 2)
+        async with profiler.session("update"):
+            assert not profiler.request_started()
+        assert profiler.status()["armed"] == dict(requests=2)
+
+    async def test_unwritable_directory(self, tmp_path):
+        # Вместо каталога файл: сохранить профиль нельзя, но блок и сводка не страдают
+        (tmp_path / "profiles").write_text("")
+        profiler = Profiler(str(tmp_path / "profiles"), top=10)
+        profiler.arm("update")
+        async with profiler.session("update"):
+            busy_loop()
+        summary = profiler.last_summary
+        assert summary["pstats_path"] is None and summary["snapshot_path"] is None
+        assert any("busy_loop" in row["function"] for row in summary["functions"])
+        assert profiler.active is None and not tracemalloc.is_tracing()
+
+    async def test_block_errors_propagate(self, profiler):
+        profiler.arm("update")
+        with pytest.raises(ZeroDivisionError):
+            async with profiler.session("update"):
+                1 / 0
+        assert profiler.active is None and profiler.last_summary["target"] == "update"
+
+    async def test_bad_arm(self, profiler):
+        with pytest.raises(ValueError):
+            profiler.arm("parser")
+        with pytest.raises(ValueError):
+            profiler.arm("requests", 0)
+
+@pytest.mark.asyncio
+class TestMiddleware:
+    async def test_requests_session(self, profiler):
+        async def handler(request):
+            busy_loop()
+            return web.Response(text="ok")
+        app = web.Application(middlewares=[profiling_middleware(profiler, exclude=("/skip",))])
+        app.add_routes([web.get("/work", handler), web.get("/skip", handler)])
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        try:
+            profiler.arm("requests", 2)
+            await client.get("/work")
+            await client.get("/skip")
+            assert profiler.active == "requests"
+            await client.get("/work")
+            assert profiler.active is None
+            assert profiler.last_summary["target"] == "requests"
+            await client.get("/work")
+            assert profiler.last_summary["target"] == "requests"
+        finally:
+            await client.close()
+
+    async def test_save_failure_keeps_response(self, tmp_path):
+        (tmp_path / "profiles").write_text("")
+        profiler = Profiler(str(tmp_path / "profiles"), top=10)
+        async def handler(request):
+            return web.Response(text="ok")
+        app = web.Application(middlewares=[profiling_middleware(profiler)])
+        app.add_routes([web.get("/work", handler)])
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        try:
+            profiler.arm("requests", 1)
+            response = await client.get("/work")
+            assert response.status == 200 and await response.text() == "ok"
+            assert profiler.last_summary["pstats_path"] is None
+        finally:
+            await client.close()
+
+
+def busy_loop():
+    return sum(index * index for index in range(10000))
+
+@pytest.fixture
+def profiler(tmp_path):
+    return Profiler(str(tmp_path), top=10)
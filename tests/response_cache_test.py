@@ -0,0 +1,81 @@
+import gzip
+from src.response_cache import ResponseCache, CachedResponse
+from src.db_client import DBClient
+
+class TestResponseCache:
+    def test_hit_and_miss(self):
+        cache = ResponseCache(normalize_name=DBClient.normalize_name)
+        assert cache.get("/group/schedule", "ИТ-221", 1) is None
+        cache.put("/group/schedule", "ИТ-221", 1, b"body")
+        assert cache.get("/group/schedule", " ит-221 ", 1) == b"body"
+        assert cache.get("/teacher/schedule", "ИТ-221", 1) is None
+
+    def test_names_kept_as_is_by_default(self):
+        cache = ResponseCache()
+        cache.invalidate(1)
+        cache.put("/group/schedule", "ИТ-221", 1, b"body")
+        assert cache.get("/group/schedule", "ит-221", 1) is None
+
+    def test_generation_change_invalidates(self):
+        cache = ResponseCache()
+        cache.get("/group/schedule", "ИТ-221", 1)
+        cache.put("/group/schedule", "ИТ-221", 1, b"old")
+        assert cache.get("/group/schedule", "ИТ-221", 2) is None
+        assert len(cache) == 0
+
+    def test_stale_put_ignored(self):
+        cache = ResponseCache()
+        cache.invalidate(2)
+        cache.put("/group/schedule", "ИТ-221", 1, b"old")
+        assert cache.get("/group/schedule", "ИТ-221", 2) is None
+
+    def test_lru_bound(self):
+        cache = ResponseCache(max_entries=2)
+        cache.invalidate(1)
+        cache.put("/group/schedule", "a", 1, b"a")
+        cache.put("/group/schedule", "b", 1, b"b")
+        assert cache.get("/group/schedule", "a", 1) == b"a"
+        cache.put("/group/schedule", "c", 1, b"c")
+        assert cache.get("/group/schedule", "b", 1) is None
+        assert cache.get("/group/schedule", "a", 1) == b"a"
+        assert len(cache) == 2
+
+    def test_disabled(self):
+        cache = ResponseCache(max_entries=0)
+        cache.invalidate(1)
+        cache.put("/group/schedule", "a", 1, b"a")
+        assert cache.get("/group/schedule", "a", 1) is None
+
+class TestCachedResponse:
+    def test_etag_depends_on_generation_and_body(self):
+        body = b"x" * 2048
+        assert CachedResponse(body, 1).etag() == CachedResponse(body, 1).etag()
+        assert CachedResponse(body, 1).etag() != CachedResponse(body, 2).etag()
+        assert CachedResponse(body, 1).etag() != CachedResponse(body + b"y", 1).etag()
+        assert CachedResponse(body, 1).etag() != CachedResponse(body, 1).etag("gzip")
+
+    def test_negotiate(self):
+        response = CachedResponse(b"x" * 2048, 1)
+        assert response.negotiate("") == "identity"
+        assert response.negotiate("gzip, deflate") == "gzip"
+        assert response.negotiate("gzip;q=0") == "identity"
+        assert response.negotiate("*") == response.encodings[0]
+        # Маленькие тела не сжимаются
+        assert CachedResponse(b"{}", 1).negotiate("gzip") == "identity"
+
+    def test_variant_cached(self):
+        response = CachedResponse(b"x" * 2048, 1)
+        compressed = response.variant("gzip")
+        assert gzip.decompress(compressed) == response.body
+        assert response.variant("gzip") is compressed
+
+    def test_not_modified(self):
+        response = CachedResponse(b"x" * 2048, 1, committed_at=1700000000)
+        assert response.not_modified(response.etag(), None)
+        assert response.not_modified(f'"other", W/{response.etag("gzip")}', None)
+        assert not response.not_modified('"other"', None)
+        assert response.not_modified(None, response.last_modified)
+        assert not response.not_modified(None, "Mon, 01 Jan 2001 00:00:00 GMT")
+        assert not response.not_modified(None, "garbage")
+        # If-None-Match важнее If-Modified-Since
+        assert not response.not_modified('"other"', response.last_modified)
@@ -0,0 +1,45 @@
+import pytest
+from src.room_index import RoomIndex
+
+def slot(date: str, number: str) -> dict:
+    return dict(date=date, day_of_week="Понедельник", number=number, start="08:00", end="09:35",
+                name="Физика", groups=["ИТ-221"], teachers=["Иванов И.И."])
+
+class TestRoomIndex:
+    def test_occupancy(self, index):
+        name, slots = index.occupancy("ук1   101")
+        assert name == "УК1 101"
+        assert [(slot["date"], slot["number"]) for slot in slots] == [("01.09", "1"), ("01.09", "3"), ("02.09", "1")]
+        assert len(index.occupancy("УК1 101", dates=["02.09"])[1]) == 1
+        assert index.occupancy("УК9 999") is None
+
+    def test_free_rooms(self, index):
+        assert index.free_rooms("01.09", "1") == ["ГУК 305"]
+        assert index.free_rooms("01.09", "3") == ["ГУК 305", "УК2 202"]
+        # В известный день без пар свободны все аудитории
+        assert index.free_rooms("03.09", "1") == index.rooms == ["ГУК 305", "УК1 101", "УК2 202"]
+        assert index.free_rooms("02.09", "3") == index.rooms
+
+    def test_unknown_slot(self, index):
+        # Дата вне скачанных недель и несуществующий номер пары
+        assert index.free_rooms("31.12", "1") is None
+        assert index.free_rooms("01.09", "9") is None
+
+    def test_calendar_from_slots(self):
+        index = RoomIndex([dict(room="УК1 101", slots=[slot("02.09", "3"), slot("01.09", "1")])])
+        assert index.dates == ["02.09", "01.09"] and index.numbers == ["1", "3"]
+        assert index.free_rooms("01.09", "3") == ["УК1 101"]
+        # Без календаря день без пар не отличить от неизвестного
+        assert index.free_rooms("03.09", "1") is None
+
+    def test_empty(self):
+        assert len(RoomIndex([])) == 0
+        assert RoomIndex([]).free_rooms("01.09", "1") is None
+        assert RoomIndex([], dict(dates=["01.09"], numbers=["1"])).free_rooms("01.09", "1") == []
+
+@pytest.fixture
+def index() -> RoomIndex:
+    return RoomIndex([dict(room="УК1 101", slots=[slot("01.09", "1"), slot("01.09", "3"), slot("02.09", "1")]),
+                      dict(room="УК2 202", slots=[slot("01.09", "1")]),
+                      dict(room="ГУК 305", slots=[])],
+                     dict(dates=["01.09", "02.09", "03.09"], numbers=["1", "2", "3"]))
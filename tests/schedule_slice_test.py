@@ -0,0 +1,28 @@
+import pytest
+from datetime import date
+from src.schedule_slice import parse_slice, slice_key
+
+class TestParseSlice:
+    def test_empty(self):
+        assert parse_slice({}, date(2026, 10, 16)) == {}
+
+    def test_week_and_day(self):
+        assert parse_slice({"week": "1", "day": "2"}, date(2026, 10, 16)) == dict(week=1, day="Вторник")
+        assert parse_slice({"day": "пятница"}, date(2026, 10, 16)) == dict(day="Пятница")
+
+    def test_dates(self):
+        today = date(2026, 10, 16)
+        assert parse_slice({"date": "today"}, today) == dict(dates=["16.10"])
+        assert parse_slice({"date": "2026-09-01"}, today) == dict(dates=["01.09"])
+        assert parse_slice({"from": "30.12", "to": "02.01"}, today)["dates"] == ["30.12", "31.12", "01.01", "02.01"]
+        assert len(parse_slice({"from": "today"}, today)["dates"]) == 14
+
+    @pytest.mark.parametrize("query", [{"week": "-1"}, {"day": "8"}, {"day": "пн"}, {"date": "32.01"},
+                                       {"date": "today", "from": "today"}, {"from": "2026-01-01", "to": "2026-06-01"},
+                                       {"from": "2026-02-01", "to": "2026-01-01"}])
+    def test_invalid(self, query):
+        with pytest.raises(ValueError):
+            parse_slice(query, date(2026, 10, 16))
+
+    def test_key_stable(self):
+        assert slice_key(dict(week=0, dates=["01.09", "02.09"])) == "dates=01.09,02.09&week=0"
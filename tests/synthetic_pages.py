@@ -0,0 +1,99 @@
+"""Генератор синтетических страниц сайта t.bstu.ru
+
+Повторяет разметку, на которую опирается ScheduleParser: списки групп и преподов,
+страницы заголовков расписания и HTML недель из ответа /web/api/events.
+Страницы детерминированы: одинаковый seed дает одинаковый результат.
+"""
+
+import random
+
+DAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб"]
+TIMES = [("08:00", "09:35"), ("09:45", "11:20"), ("11:30", "13:05"),
+         ("13:20", "14:55"), ("15:05", "16:40"), ("16:50", "18:25")]
+SUBJECTS = ["Математический анализ", "Физика", "Программирование", "Базы данных",
+            "Иностранный язык", "Физическая культура", "Философия", "Компьютерные сети"]
+LESSON_TYPES = ["Лекция", "Практика", "Лабораторная"]
+ROOMS = ["УК1 101", "УК2 202", "ГУК 305", "УК4 14", "Кафедра ТМН", "ЦВТ 2", "Дист."]
+TEACHERS = ["Иванов И.И.", "Петров П.П.", "Сидорова А.В.", "Кузнецов Д.С.", "Смирнова Е.А."]
+GROUPS = ["ИТ-221", "ПВ-222", "КБ-231", "ВТ-241", "МТ-211"]
+TEACHER_NAMES = ["Абакумов Роман Григорьевич", "Иванов Иван Иванович", "Петров Петр Петрович",
+                 "Сидорова Анна Викторовна", "Кузнецов Дмитрий Сергеевич"]
+
+
+def _lesson(rng: random.Random, number: int, for_group: bool) -> list[str]:
+    start, end = TIMES[number - 1]
+    people = TEACHERS if for_group else GROUPS
+    lines = ['<div class="lesson">',
+             f'  <div class="lesson__number">{number}</div>',
+             f'  <div class="lesson__type">{rng.choice(LESSON_TYPES)}</div>',
+             f'  <div class="lesson__name">{rng.choice(SUBJECTS)}</div>',
+             '  <div class="lesson__time">',
+             f'    <span>{start}</span>',
+             '    <span>-</span>',
+             f'    <span>{end}</span>',
+             '  </div>']
+    for room in rng.sample(ROOMS, rng.randint(1, 2)):
+        lines.append(f'  <div class="lesson__room">{room}</div>')
+    for person in rng.sample(people, rng.randint(1, 2)):
+        lines.append(f'  <a class="lesson__person" href="#">{person}</a>')
+    lines.append('</div>')
+    return lines
+
+
+def week_page(seed: int, for_group: bool = True) -> str:
+    """HTML недели, как в поле result.html.week ответа БГТУ API"""
+
+    rng = random.Random(seed)
+    lines = ['<div class="week">']
+    for index, day in enumerate(DAYS):
+        lines += ['<div class="week__day">',
+                  '  <div class="day__title">',
+                  f'    <span>{day}</span>',
+                  f'    <span>{index + 1:02}.09</span>',
+                  '  </div>']
+        count = rng.randint(0, 5)
+        if not count:
+            lines.append('  <div class="lesson lesson--empty">Нет занятий</div>')
+        for number in range(1, count + 1):
+            lines += _lesson(rng, number, for_group)
+            if number == 3 and rng.random() < 0.3:
+                lines += ['<div class="lesson lesson--break">', '  <span>Перерыв</span>',
+                          '  <span>13:05</span>', '</div>']
+        lines.append('</div>')
+    lines.append('</div>')
+    return "\n".join(lines)
+
+
+def header_page(table_name: str, entity: str, entity_id: str, device: str = "desktop", seed: int = 0) -> str:
+    """Страница расписания группы или препода с данными для заголовка API"""
+
+    navigation = "\n".join(f'<li class="menu__item"><a href="/page/{index}">Раздел {index}</a></li>'
+                           for index in range(300))
+    footer = "\n".join(f'<p class="footer__text">Строка подвала {index}</p>' for index in range(300))
+    return ('<!DOCTYPE html>\n<html>\n<head><title>Расписание</title>'
+            '<script>var config = {"a": 1};</script></head>\n<body>\n'
+            f'<nav><ul class="menu">\n{navigation}\n</ul></nav>\n'
+            f'<h1 class="title page__title">\n  {table_name}\n</h1>\n'
+            f'<div class="_timetable_page offset" data-entity="{entity}" data-strategy="{device}" data-id="{entity_id}">\n'
+            f'{week_page(seed, entity == "gruppy")}\n</div>\n'
+            f'<footer>\n{footer}\n</footer>\n</body>\n</html>')
+
+
+def group_list_page(count: int) -> str:
+    """Страница со списком ссылок на группы"""
+
+    links = "\n".join(f'<a class="group__item link" href="/raspisaniya/gruppy/{index}">Г-{index}</a>'
+                      for index in range(count))
+    return f'<html><body><div class="groups">\n{links}\n</div></body></html>'
+
+
+def teacher_list_page(count: int) -> str:
+    """Страница со списком ссылок на преподов и аудитории"""
+
+    links = []
+    for index in range(count):
+        name = f"{TEACHER_NAMES[index % len(TEACHER_NAMES)]} {index}"
+        if index % 7 == 0:
+            name = ROOMS[index % len(ROOMS)]
+        links.append(f'<a class="teachers__item" href="/raspisaniya/prepodavateli/{index}">\n  {name}\n</a>')
+    return '<html><body><div class="teachers">\n' + "\n".join(links) + '\n</div></body></html>'
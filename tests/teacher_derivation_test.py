@@ -0,0 +1,76 @@
+import pytest
+from src.teacher_derivation import TeacherDeriver, short_teacher_name
+
+def lesson(number: str, name: str, rooms: list[str], teachers: list[str], lesson_type: str = "Лекция") -> dict:
+    start, end = {"1": ("08:00", "09:35"), "2": ("09:45", "11:20")}[number]
+    return dict(number=number, type=lesson_type, name=name, start=start, end=end, classroom=rooms, teacher=teachers)
+
+def group(name: str, monday: list[dict], tuesday: list[dict] = ()) -> dict:
+    return dict(nameofgroup=name, weeks=[dict(week_status="Числитель",
+                                              day=[dict(day_of_week="Понедельник", date="01.09", subjects=monday),
+                                                   dict(day_of_week="Вторник", date="02.09", subjects=list(tuesday))])])
+
+class TestShortName:
+    def test_short_name(self):
+        assert short_teacher_name("Иванов Иван Иванович") == "Иванов И.И."
+        assert short_teacher_name("Петрова-Водкина Мария Александровна") == "Петрова-Водкина М.А."
+        assert short_teacher_name("Smith John") == "Smith J."
+        assert short_teacher_name("Абакумов Роман Григорьевич 7") == "Абакумов Р.Г."
+
+class TestTeacherDeriver:
+    def test_ambiguous(self, deriver):
+        assert sorted(deriver.teachers) == ["Иванов И.И.", "Петров П.П."]
+        assert [teacher["name"] for teacher in deriver.ambiguous] == ["Сидоров Андрей Викторович", "Сидоров Алексей Владимирович"]
+
+    def test_derive(self, deriver, groups):
+        schedules = deriver.derive(groups)
+        assert set(schedules) == {"https://t.bstu.ru/raspisaniya/prepodavateli/1", "https://t.bstu.ru/raspisaniya/prepodavateli/2"}
+        ivanov = schedules["https://t.bstu.ru/raspisaniya/prepodavateli/1"]
+        assert ivanov["table_name"] == "Иванов Иван Иванович"
+        assert ivanov["entity_id"] == "prepodavateli:1"
+        monday, tuesday = ivanov["weeks"][0]["day"]
+        # Пара потока объединяется, пары дня идут по номерам
+        assert monday == dict(day_of_week="Понедельник", date="01.09", subjects=[
+            dict(number="1", type="Лекция", name="Физика", start="08:00", end="09:35", classroom=["УК1 101"], group=["ИТ-221", "ИТ-222"]),
+            dict(number="2", type="Практика", name="Философия", start="09:45", end="11:20", classroom=["ГУК 305", "УК2 202"], group=["ИТ-222"])])
+        assert tuesday["subjects"] == []
+        # Препод без пар получает пустые дни той же недели
+        petrov = schedules["https://t.bstu.ru/raspisaniya/prepodavateli/2"]
+        assert [day["subjects"] for day in petrov["weeks"][0]["day"]] == [[], []]
+        assert deriver.unknown_names == {"Сидоров А.В.", "Вакансия"}
+
+    def test_days_in_week_order(self, deriver, groups):
+        # У первой группы нет понедельника, а неделя идет через Новый год
+        groups = [dict(nameofgroup="ИТ-223", weeks=[dict(week_status="Числитель", day=[
+                      dict(day_of_week="Пятница", date="02.01", subjects=[lesson("1", "Химия", ["УК1 101"], ["Иванов И.И."])])])]),
+                  dict(nameofgroup="ИТ-224", weeks=[dict(week_status="Числитель", day=[
+                      dict(day_of_week="Понедельник", date="29.12", subjects=[]),
+                      dict(day_of_week="Среда", date="31.12", subjects=[])])])]
+        ivanov = deriver.derive(groups)["https://t.bstu.ru/raspisaniya/prepodavateli/1"]
+        assert [day["date"] for day in ivanov["weeks"][0]["day"]] == ["29.12", "31.12", "02.01"]
+
+    def test_compare(self, deriver, groups):
+        derived = deriver.derive(groups)["https://t.bstu.ru/raspisaniya/prepodavateli/1"]
+        assert TeacherDeriver.compare(derived, derived) == []
+        fetched = dict(derived, weeks=[dict(derived["weeks"][0], day=[dict(day) for day in derived["weeks"][0]["day"]])])
+        monday = fetched["weeks"][0]["day"][0]
+        monday["subjects"] = [dict(monday["subjects"][0], group=["ИТ-222", "ИТ-221"], start="08:10"), dict(name="Перерыв 1 час")]
+        fetched["weeks"][0]["day"][1] = dict(fetched["weeks"][0]["day"][1], subjects=[lesson("1", "Химия", ["УК1 101"], [])])
+        assert TeacherDeriver.compare(derived, fetched) == [
+            "неделя 0, 02.09, пара 1 Химия: нет в выведенном расписании",
+            "неделя 0, 01.09, пара 2 Философия: нет в скачанном расписании",
+            "неделя 0, 01.09, пара 1 Физика: start '08:00' вместо '08:10'"]
+
+@pytest.fixture
+def deriver() -> TeacherDeriver:
+    names = ["Иванов Иван Иванович", "Петров Петр Петрович", "Сидоров Андрей Викторович", "Сидоров Алексей Владимирович"]
+    return TeacherDeriver([dict(url=f"https://t.bstu.ru/raspisaniya/prepodavateli/{index}", name=name)
+                           for index, name in enumerate(names, start=1)])
+
+@pytest.fixture
+def groups() -> list[dict]:
+    return [group("ИТ-221", [lesson("1", "Физика", ["УК1 101"], ["Иванов И.И.", "Сидоров А.В."])]),
+            group("ИТ-222", [dict(name="Перерыв 1 час"),
+                             lesson("2", "Философия", ["ГУК 305", "УК2 202"], ["Иванов И.И."], "Практика"),
+                             lesson("1", "Физика", ["УК1 101"], ["Иванов И.И."])],
+                  [lesson("1", "Физика", ["УК4 14"], ["Вакансия"])])]